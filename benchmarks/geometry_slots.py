@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Time the construction and the scalar math of the slotted Point and Vect classes
+of qProf.gsf.geometry against the array-backed versions they replaced.
+
+Run from the folder containing the qProf plugin folder, in the QGIS Python environment:
+
+    python qProf/benchmarks/geometry_slots.py [repetitions]
+"""
+
+from __future__ import division, print_function
+
+import os
+import sys
+import timeit
+from math import sqrt
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from qProf.gsf.geometry import Point, Vect
+
+
+class ArrayPoint(object):
+    """
+    Point as implemented before the slotted version,
+    with the values stored in a 4-element array (only the benchmarked methods).
+    """
+
+    def __init__(self, x=np.nan, y=np.nan, z=np.nan, t=np.nan):
+
+        self._p = np.array([x, y, z, t], dtype=np.float64)
+
+    @property
+    def v(self):
+
+        return self._p
+
+    @property
+    def x(self):
+
+        return self.v[0]
+
+    @property
+    def y(self):
+
+        return self.v[1]
+
+    @property
+    def z(self):
+
+        return self.v[2]
+
+    @property
+    def t(self):
+
+        return self.v[3]
+
+    def dist_2d(self, another):
+
+        return sqrt((self.x - another.x) ** 2 + (self.y - another.y) ** 2)
+
+    def vect_offset(self, displ_vect):
+
+        return ArrayPoint(self.x + displ_vect.x,
+                          self.y + displ_vect.y,
+                          self.z + displ_vect.z,
+                          self.t)
+
+
+class ArrayVect(object):
+    """
+    Vect as implemented before the slotted version,
+    with the values stored in a 3-element array (only the benchmarked methods).
+    """
+
+    def __init__(self, x=np.nan, y=np.nan, z=np.nan):
+
+        self._v = np.array([x, y, z], dtype=np.float64)
+
+    @classmethod
+    def from_array(cls, a):
+
+        obj = cls()
+
+        assert a.size == 3
+        b = a.astype(np.float64)
+        obj._v = b
+        return obj
+
+    @property
+    def v(self):
+
+        return self._v
+
+    @property
+    def x(self):
+
+        return self.v[0]
+
+    @property
+    def y(self):
+
+        return self.v[1]
+
+    @property
+    def z(self):
+
+        return self.v[2]
+
+    def scale(self, scale_factor):
+
+        return ArrayVect.from_array(self.v * scale_factor)
+
+    def sp(self, another):
+
+        return self.x * another.x + self.y * another.y + self.z * another.z
+
+
+STATEMENTS = [
+    ("construction", "P(1.0, 2.0, 3.0)"),
+    ("dist_2d", "p.dist_2d(q)"),
+    ("vect_offset", "p.vect_offset(w)"),
+    ("scale", "v.scale(2.5)"),
+    ("sp", "v.sp(w)")]
+
+benchmark_objects = dict()
+
+
+def time_classes(point_class, vect_class, number):
+    """
+    Time the benchmark statements with the given Point and Vect classes.
+
+    :param point_class: Point class
+    :param vect_class: Vect class
+    :param number: repetitions of each statement - int
+    :return: list of (operation, seconds) tuples
+    """
+
+    global benchmark_objects
+
+    benchmark_objects = dict(P=point_class,
+                             p=point_class(1.0, 2.0, 3.0),
+                             q=point_class(4.0, 6.0, 3.0),
+                             v=vect_class(1.0, 2.0, 3.0),
+                             w=vect_class(4.0, 6.0, 3.0))
+
+    setup = "from {} import benchmark_objects as objs; ".format(__name__) + \
+            "P, p, q, v, w = objs['P'], objs['p'], objs['q'], objs['v'], objs['w']"
+
+    return [(operation, timeit.timeit(statement, setup=setup, number=number)) for operation, statement in STATEMENTS]
+
+
+def main():
+
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    array_timings = time_classes(ArrayPoint, ArrayVect, number)
+    slots_timings = time_classes(Point, Vect, number)
+
+    print("{:<14}{:>12}{:>12}{:>10}".format("operation", "array (s)", "slots (s)", "speedup"))
+    for (operation, array_time), (_, slots_time) in zip(array_timings, slots_timings):
+        print("{:<14}{:>12.4f}{:>12.4f}{:>9.1f}x".format(operation, array_time, slots_time, array_time / slots_time))
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Time the intersection of many planes with a synthetic DEM by qProf.gis_utils.batch_intersections.planes_networks,
+sequentially and with a pool of processes.
+The pool pays off when the work per plane exceeds the cost of copying the DEM terms to the processes
+and the intersections back, i.e. with large DEMs, many planes and several cores, as in the default case.
+
+Run from the folder containing the qProf plugin folder, in the QGIS Python environment:
+
+    python qProf/benchmarks/plane_networks_pool.py [rows cols planes processes]
+"""
+
+from __future__ import division, print_function
+
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from qProf.gis_utils.batch_intersections import planes_networks
+from qProf.gsf.geometry import Point, GPlane
+
+from raster_plane_intersection import synthetic_grid
+
+
+def random_planes(num_planes, x0, y0, width, height, seed=0):
+    """
+    Planes with random source points within the DEM and random attitudes.
+
+    :return: list of (Point, GPlane) tuples
+    """
+
+    rng = np.random.RandomState(seed)
+
+    return [(Point(x0 + rng.uniform(0.2, 0.8) * width, y0 + rng.uniform(0.2, 0.8) * height, rng.uniform(300.0, 700.0)),
+             GPlane(rng.uniform(0.0, 360.0), rng.uniform(10.0, 80.0)))
+            for _ in range(num_planes)]
+
+
+def benchmark_planes_networks(rows=3000, cols=3000, num_planes=48, processes=None, cellsize=10.0):
+    """
+    Time planes_networks sequentially and with a pool of processes.
+
+    :param rows: DEM row number - int
+    :param cols: DEM column number - int
+    :param num_planes: number of planes - int
+    :param processes: pool processes, by default the number of cores - int
+    :param cellsize: DEM cell size - float
+    :return: tuple of sequential and pool seconds
+    """
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    x0, y0 = 500000.0, 4000000.0
+
+    grid = synthetic_grid(rows, cols, cellsize, x0, y0)
+    planes = random_planes(num_planes, x0, y0, cols * cellsize, rows * cellsize)
+
+    start = time.time()
+    planes_networks(grid, planes)
+    sequential_time = time.time() - start
+
+    start = time.time()
+    planes_networks(grid, planes, processes=processes)
+    pool_time = time.time() - start
+
+    return sequential_time, pool_time
+
+
+def main():
+
+    if len(sys.argv) > 4:
+        rows, cols, num_planes, processes = [int(arg) for arg in sys.argv[1:5]]
+        sequential_time, pool_time = benchmark_planes_networks(rows, cols, num_planes, processes)
+    else:
+        processes = multiprocessing.cpu_count()
+        sequential_time, pool_time = benchmark_planes_networks(processes=processes)
+
+    print("{:<24}{:>10.3f} s".format("sequential", sequential_time))
+    print("{:<24}{:>10.3f} s".format("pool, {} processes".format(processes), pool_time))
+    print("{:<24}{:>10.1f}x".format("speedup", sequential_time / pool_time))
+
+
+if __name__ == "__main__":
+
+    main()
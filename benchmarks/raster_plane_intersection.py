@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Time the plane - DEM intersection of qProf.gis_utils.rasters on a synthetic DEM, in float32 and float64,
+and the coincident intersections filter as array mask against a per-cell Python loop,
+the latter timed on the first rows and scaled to the whole grid.
+
+Run from the folder containing the qProf plugin folder, in the QGIS Python environment:
+
+    python qProf/benchmarks/raster_plane_intersection.py [rows cols]
+"""
+
+from __future__ import division, print_function
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from qProf.gis_utils.rasters import Grid, RectangularDomain
+from qProf.gsf.geometry import MIN_SEPARATION_THRESHOLD, Point, GPlane
+
+
+def synthetic_grid(rows, cols, cellsize, x0, y0):
+    """
+    Grid of a smooth synthetic DEM.
+
+    :param rows: DEM row number - int
+    :param cols: DEM column number - int
+    :param cellsize: DEM cell size - float
+    :param x0: x coordinate of the DEM lower-left corner - float
+    :param y0: y coordinate of the DEM lower-left corner - float
+    :return: qProf.gis_utils.rasters.Grid
+    """
+
+    xs = (0.5 + np.arange(cols)) * cellsize
+    ys = (rows - 0.5 - np.arange(rows)) * cellsize
+    data = 500.0 + 200.0 * np.sin(xs[np.newaxis, :] / 700.0) * np.cos(ys[:, np.newaxis] / 900.0) + \
+        0.02 * xs[np.newaxis, :]
+
+    grid = Grid(grid_data=data)
+    grid.domain = RectangularDomain(Point(x0, y0), Point(x0 + cols * cellsize, y0 + rows * cellsize))
+
+    return grid
+
+
+def benchmark_plane_intersection(rows=5000, cols=5000, cellsize=10.0):
+    """
+    Time the plane - DEM intersection and the coincident intersections filter.
+
+    :param rows: DEM row number - int
+    :param cols: DEM column number - int
+    :param cellsize: DEM cell size - float
+    :return: dictionary of timings, in seconds
+    """
+
+    x0, y0 = 500000.0, 4000000.0
+
+    grid = synthetic_grid(rows, cols, cellsize, x0, y0)
+
+    src_pt = Point(x0 + 0.5 * cols * cellsize, y0 + 0.5 * rows * cellsize, 500.0)
+    plane_attitude = GPlane(120.0, 30.0)
+
+    timings = dict()
+
+    for dtype in (np.float32, np.float64):
+        start = time.time()
+        xcoords_x, xcoords_y, ycoords_x, ycoords_y = grid.intersection_with_surface('plane', src_pt,
+                                                                                   plane_attitude, dtype)
+        timings[np.dtype(dtype).name] = time.time() - start
+
+    start = time.time()
+    coincident = (np.abs(xcoords_x - ycoords_x) < MIN_SEPARATION_THRESHOLD) & \
+                 (np.abs(ycoords_y - xcoords_y) < MIN_SEPARATION_THRESHOLD)
+    ycoords_y[coincident] = np.nan
+    timings['coincidence mask'] = time.time() - start
+
+    loop_rows = min(rows, 100)
+    start = time.time()
+    for i in range(loop_rows):
+        for j in range(cols):
+            if abs(xcoords_x[i, j] - ycoords_x[i, j]) < MIN_SEPARATION_THRESHOLD and abs(
+                            ycoords_y[i, j] - xcoords_y[i, j]) < MIN_SEPARATION_THRESHOLD:
+                ycoords_y[i, j] = np.nan
+    timings['coincidence loop'] = (time.time() - start) * rows / float(loop_rows)
+
+    return timings
+
+
+def main():
+
+    if len(sys.argv) > 2:
+        timings = benchmark_plane_intersection(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        timings = benchmark_plane_intersection()
+
+    for operation, seconds in sorted(timings.items()):
+        print("{:<20}{:>10.3f} s".format(operation, seconds))
+
+
+if __name__ == "__main__":
+
+    main()
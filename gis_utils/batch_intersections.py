@@ -0,0 +1,126 @@
+from __future__ import division
+
+import logging
+import multiprocessing
+import os
+import sys
+
+from .rasters import PlaneIntersectionTerms
+from .intersections import Intersections, intersection_cells
+
+
+logger = logging.getLogger(__name__)
+
+
+# DEM terms of the pool worker processes, set once per process
+_worker_terms = None
+
+
+def pool_executable():
+    """
+    Return the Python interpreter able to run the pool processes, or None when not found.
+    On Windows the pool processes are spawned by running sys.executable,
+    that inside QGIS is the QGIS application itself: the interpreter of the Python installation
+    (sys.exec_prefix) is used instead. Elsewhere the processes are forked from the current one.
+
+    :return: string or None
+    """
+
+    if sys.platform != 'win32':
+        return sys.executable
+
+    if os.path.basename(sys.executable).lower() in ('python.exe', 'pythonw.exe'):
+        return sys.executable
+
+    for name in ('pythonw.exe', 'python.exe'):
+        path = os.path.join(sys.exec_prefix, name)
+        if os.path.isfile(path):
+            return path
+
+    return None
+
+
+def _init_worker(terms):
+
+    global _worker_terms
+    _worker_terms = terms
+
+
+def _worker_plane_networks(plane_args):
+
+    return plane_networks(_worker_terms, *plane_args)
+
+
+def plane_networks(terms, srcPt, srcPlaneAttitude, radius=None):
+    """
+    Intersect a plane with a DEM, given its precomputed terms, and build the trace networks.
+
+    :param terms: DEM terms - PlaneIntersectionTerms
+    :param srcPt: point of the plane - Point
+    :param srcPlaneAttitude: plane attitude - GPlane
+    :param radius: half side of the square window around srcPt where traces are searched,
+                   the whole DEM when None - float
+    :return: Intersections, with neighbours and networks defined
+    """
+
+    if radius is None:
+        window = (0, terms.row_num, 0, terms.col_num)
+    else:
+        window = terms.window(srcPt, radius)
+
+    row_min, _, col_min, _ = window
+
+    xcoords_x, xcoords_y, ycoords_x, ycoords_y = terms.intersections(srcPt, srcPlaneAttitude, window)
+
+    x_cells, y_cells = intersection_cells(xcoords_x, xcoords_y, ycoords_x, ycoords_y, row_min, col_min)
+
+    intersections = Intersections.from_cells((terms.row_num, terms.col_num), x_cells, y_cells)
+    intersections.neighbours = intersections.set_neighbours()
+    intersections.networks = intersections.define_networks()
+
+    return intersections
+
+
+def planes_networks(grid, planes, radius=None, processes=None, dtype=None):
+    """
+    Intersect many planes with a DEM, computing the DEM terms once.
+    Planes can be processed by a pool of processes: the DEM terms are sent once to each of them.
+
+    The pool has a fixed cost: starting the processes, copying the DEM terms
+    (four arrays of the DEM size) to each of them and copying back the intersections.
+    It pays off just when the work per plane dominates, e.g. with tens of planes searched over DEMs
+    of millions of cells on several cores (see benchmarks/plane_networks_pool.py);
+    with smaller DEMs (e.g. 500 x 600 cells and 40 planes) the sequential processing is faster.
+    On Windows the pool processes run the Python interpreter returned by pool_executable,
+    set as the multiprocessing executable; when it is not found, planes are processed sequentially.
+
+    :param grid: DEM - Grid
+    :param planes: source points and attitudes of the planes - list of (Point, GPlane) tuples
+    :param radius: half side of the square window around each source point where traces are searched,
+                   the whole DEM when None - float
+    :param processes: number of pool processes, no pool when None or 1 - int
+    :param dtype: calculation dtype, by default the DEM dtype when floating point, otherwise float64
+    :return: list of Intersections, with neighbours and networks defined, in the planes order
+    """
+
+    terms = PlaneIntersectionTerms(grid, dtype)
+
+    executable = None
+    if processes is not None and processes > 1:
+        executable = pool_executable()
+        if executable is None:
+            logger.warning("No Python interpreter found for the pool processes: planes processed sequentially")
+
+    if executable is None:
+        return [plane_networks(terms, srcPt, srcPlaneAttitude, radius) for srcPt, srcPlaneAttitude in planes]
+
+    if sys.platform == 'win32':
+        multiprocessing.set_executable(executable)
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(terms,))
+    try:
+        return pool.map(_worker_plane_networks,
+                        [(srcPt, srcPlaneAttitude, radius) for srcPt, srcPlaneAttitude in planes])
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,220 @@
+from __future__ import division
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+
+MIRROR_DATA_EXT = ".f32"
+MIRROR_SIDECAR_EXT = ".json"
+MIRROR_STRIPE_MAX_CELLS = 8 * 1024 * 1024  # cells read from the source at each build step
+
+# raster parameters that must match those of the source for the mirror to be used
+MIRROR_GEOMETRY_KEYS = ('rows', 'cols', 'xMin', 'xMax', 'yMin', 'yMax', 'cellsizeEW', 'cellsizeNS')
+
+
+def default_cache_dir():
+    """
+    Return the default user directory storing the DEM mirrors.
+
+    :return: string
+    """
+
+    return os.path.join(os.path.expanduser("~"), ".qprof", "dem_cache")
+
+
+def source_signature(source):
+    """
+    Return the path, size and modification time identifying the state of a raster file,
+    or None when the source is not a local file.
+
+    :param source: raster layer source - string
+    :return: dict or None
+    """
+
+    path = os.path.abspath(source)
+    if not os.path.isfile(path):
+        return None
+
+    stat = os.stat(path)
+
+    return dict(path=path,
+                size=stat.st_size,
+                mtime=stat.st_mtime)
+
+
+class DEMMirror(object):
+    """
+    Raw float32 copy of a single-band DEM, accessed as a memory-mapped array,
+    with a JSON sidecar storing the source signature and the raster parameters.
+    No-data cells are stored as NaN.
+    """
+
+    def __init__(self, source, cache_dir=None):
+        """
+        :param source: raster layer source - string
+        :param cache_dir: directory storing the mirror files - string
+        """
+
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+
+        self.source = source
+        self.cache_dir = cache_dir
+
+        basename = hashlib.md5(os.path.abspath(source).encode('utf-8')).hexdigest()
+        self.data_path = os.path.join(cache_dir, basename + MIRROR_DATA_EXT)
+        self.sidecar_path = os.path.join(cache_dir, basename + MIRROR_SIDECAR_EXT)
+
+        self._data = None
+        self._sidecar = None
+
+    def read_sidecar(self):
+
+        try:
+            with open(self.sidecar_path) as sidecar_file:
+                return json.load(sidecar_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def is_valid(self):
+        """
+        Check that the mirror files exist and were created from the current state of the source.
+
+        :return: bool
+        """
+
+        sidecar = self.read_sidecar()
+        if sidecar is None or not os.path.isfile(self.data_path):
+            return False
+
+        signature = source_signature(self.source)
+        if signature is None:
+            return False
+
+        return self._same_source(sidecar, signature)
+
+    @staticmethod
+    def _same_source(sidecar, signature):
+
+        stored = sidecar['source']
+
+        return stored['path'] == signature['path'] and \
+            stored['size'] == signature['size'] and \
+            stored['mtime'] == signature['mtime']
+
+    def matches(self, params):
+        """
+        Check that the mirror was built from the current state of the source,
+        with the same raster geometry.
+        The sidecar is read once, the source file state at each call.
+
+        :param params: raster parameters, with the QGisRasterParameters argument names - dict
+        :return: bool
+        """
+
+        if self._sidecar is None:
+            if not self.is_valid():
+                return False
+            self._sidecar = self.read_sidecar()
+
+        signature = source_signature(self.source)
+        if signature is None or not self._same_source(self._sidecar, signature):
+            return False
+
+        stored_params = self._sidecar['params']
+
+        return all(stored_params[key] == params[key] for key in MIRROR_GEOMETRY_KEYS)
+
+    @property
+    def params(self):
+        """
+        Return the raster parameters stored in the sidecar, as a dict
+        with the QGisRasterParameters argument names, crs excluded.
+
+        :return: dict
+        """
+
+        return self.read_sidecar()['params']
+
+    def build(self, params, read_rows):
+        """
+        Create the mirror files, reading the source DEM by horizontal stripes.
+
+        :param params: raster parameters, with the QGisRasterParameters argument names (crs excluded) - dict
+        :param read_rows: function returning the 2D float array of the given (inclusive) row range,
+                          with NaN for no-data cells
+        """
+
+        signature = source_signature(self.source)
+        if signature is None:
+            raise IOError("DEM source is not a local file: {}".format(self.source))
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        self.close()
+        self._sidecar = None
+
+        rows, cols = params['rows'], params['cols']
+        stripe_rows = max(1, MIRROR_STRIPE_MAX_CELLS // cols)
+
+        temp_data_path = self.data_path + ".tmp"
+        data = np.memmap(temp_data_path, dtype=np.float32, mode='w+', shape=(rows, cols))
+        for row_min in range(0, rows, stripe_rows):
+            row_max = min(row_min + stripe_rows, rows) - 1
+            data[row_min:row_max + 1, :] = read_rows(row_min, row_max)
+        data.flush()
+        del data
+
+        if os.path.exists(self.data_path):
+            os.remove(self.data_path)
+        os.rename(temp_data_path, self.data_path)
+
+        with open(self.sidecar_path, 'w') as sidecar_file:
+            json.dump(dict(source=signature,
+                           params=params),
+                      sidecar_file)
+
+    @property
+    def data(self):
+        """
+        Return the read-only memory-mapped array of the DEM values.
+
+        :return: numpy.memmap, shape: rows x cols
+        """
+
+        if self._data is None:
+            params = self.params
+            self._data = np.memmap(self.data_path, dtype=np.float32, mode='r',
+                                   shape=(params['rows'], params['cols']))
+
+        return self._data
+
+    def read_window(self, row_min, row_max, col_min, col_max):
+        """
+        Return a window of DEM values as a float64 array.
+        Rows are counted from the raster top, bounds are inclusive.
+        """
+
+        return self.data[row_min:row_max + 1, col_min:col_max + 1].astype(np.float64)
+
+    def close(self):
+
+        self._data = None
+
+    def remove(self):
+        """
+        Delete the mirror files.
+        """
+
+        self.close()
+        for path in (self.data_path, self.sidecar_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# DEM mirrors in use, keyed by layer source
+dem_mirrors = {}
@@ -54,3 +54,10 @@ class OGRIOException(Exception):
     Exception for raster parameters.
     """
     pass
+
+
+class RasterIOException(Exception):
+    """
+    Exception for raster input/output.
+    """
+    pass
@@ -1,9 +1,11 @@
 
+from math import ceil
+
 import numpy as np
 
-from .qgs_tools import project_point
+from .qgs_tools import project_xy_array
 
-from ..gsf.geometry import Vect, Point
+from ..gsf.geometry import Vect, Point, MIN_SCALAR_VALUE
 
 MIN_2D_SEPARATION_THRESHOLD = 1e-10
 MINIMUM_SEPARATION_THRESHOLD = 1e-10
@@ -200,44 +202,304 @@ class Segment(object):
 
         assert generator_vector.len_2d > 0.0
 
-        interpolated_line = Line([self.start_pt])
-        n = 0
-        while True:
-            n += 1
-            new_pt = self.start_pt.vect_offset(generator_vector.scale(n))
-            distance = self.start_pt.dist_2d(new_pt)
-            if distance >= length2d:
-                break
-            interpolated_line.add_pt(new_pt)
-        interpolated_line.add_pt(self.end_pt)
+        # offsets of the candidate points, retaining those closer than the segment end
+
+        steps = np.arange(1, int(ceil(length2d / densify_distance)) + 2)
+        offsets = generator_vector.v[np.newaxis, :] * steps[:, np.newaxis]
+
+        start = self.start_pt.v
+        xs = start[0] + offsets[:, 0]
+        ys = start[1] + offsets[:, 1]
+        zs = start[2] + offsets[:, 2]
+
+        inner = np.sqrt((start[0] - xs) ** 2 + (start[1] - ys) ** 2) < length2d
+
+        xyzt = np.empty((np.count_nonzero(inner) + 2, 4), dtype=np.float64)
+        xyzt[0] = start
+        xyzt[1:-1, 0] = xs[inner]
+        xyzt[1:-1, 1] = ys[inner]
+        xyzt[1:-1, 2] = zs[inner]
+        xyzt[1:-1, 3] = start[3]
+        xyzt[-1] = self.end_pt.v
+
+        return Line.from_array(xyzt)
+
+
+def as_xyzt_array(coords):
+    """
+    Convert point coordinates to a float array with x, y, z and t columns.
+    Missing z and t columns are set to NaN.
+
+    :param coords: array-like of floats, shape: N x 2, N x 3 or N x 4
+    :return: numpy array of floats, shape: N x 4
+    """
+
+    coords = np.asarray(coords, dtype=np.float64)
+
+    if coords.size == 0:
+        return np.empty((0, 4), dtype=np.float64)
+
+    num_pts, num_dims = coords.shape
+    assert 2 <= num_dims <= 4
+
+    xyzt = np.empty((num_pts, 4), dtype=np.float64)
+    xyzt.fill(np.nan)
+    xyzt[:, :num_dims] = coords
+
+    return xyzt
+
+
+def coincident_xyzt(xyzt_a, xyzt_b, tolerance=MINIMUM_SEPARATION_THRESHOLD):
+    """
+    Vectorized counterpart of Point.coincident, for paired rows of two coordinate arrays.
+
+    :param xyzt_a: numpy array of floats, shape: N x 4
+    :param xyzt_b: numpy array of floats, shape: N x 4
+    :param tolerance: float
+    :return: numpy array of bools
+    """
+
+    delta = xyzt_a[:, :3] - xyzt_b[:, :3]
+
+    with np.errstate(invalid='ignore'):
+        dist_2d = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2)
+        dist_3d = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2 + delta[:, 2] ** 2)
+        return ~(dist_2d > tolerance) & ~(dist_3d > tolerance)
+
+
+def densify_2d_xyzt(xyzt, sample_distance):
+    """
+    Densify the segments of a line given as a coordinate array, in a single pass.
+    Each segment gets points spaced by sample_distance from its start,
+    with z interpolated and t of the segment start, plus its end vertex;
+    vertices shared by successive segments are stored once.
+    Results are the same as those of Segment.densify_2d_segment applied to each segment.
+
+    :param xyzt: numpy array of floats, shape: N x 4, N > 1
+    :param sample_distance: float
+    :return: numpy array of floats, shape: M x 4
+    """
+
+    assert sample_distance > 0.0
+
+    starts = xyzt[:-1]
+    deltas = xyzt[1:, :3] - starts[:, :3]
+
+    lengths_2d = np.sqrt(deltas[:, 0] * deltas[:, 0] + deltas[:, 1] * deltas[:, 1])
+    assert np.all(lengths_2d > 0.0)
+
+    # displacement between successive points of each segment (see Vect.versor_2d)
+
+    generators = deltas * (1.0 / lengths_2d)[:, np.newaxis] * sample_distance
+
+    # candidate points, by segment, with step numbers 1, 2, ...
+
+    num_segments = starts.shape[0]
+    num_candidates = np.ceil(lengths_2d / sample_distance).astype(np.int64) + 1
+    candidate_segments = np.repeat(np.arange(num_segments), num_candidates)
+    first_candidates = np.cumsum(num_candidates) - num_candidates
+    steps = np.arange(candidate_segments.size) - np.repeat(first_candidates, num_candidates) + 1
+
+    candidate_starts = starts[candidate_segments]
+    candidate_xyz = candidate_starts[:, :3] + generators[candidate_segments] * steps[:, np.newaxis]
+
+    distances = np.sqrt((candidate_starts[:, 0] - candidate_xyz[:, 0]) ** 2 +
+                        (candidate_starts[:, 1] - candidate_xyz[:, 1]) ** 2)
+    inner = distances < lengths_2d[candidate_segments]
+
+    inner_segments = candidate_segments[inner]
+
+    # output: first vertex, then inner points and end vertex of each segment
+
+    num_inner = np.bincount(inner_segments, minlength=num_segments)
+
+    densified = np.empty((1 + inner_segments.size + num_segments, 4), dtype=np.float64)
 
-        return interpolated_line
+    densified[0] = xyzt[0]
+
+    inner_positions = 1 + np.arange(inner_segments.size) + inner_segments
+    densified[inner_positions, :3] = candidate_xyz[inner]
+    densified[inner_positions, 3] = candidate_starts[inner, 3]
+
+    vertex_positions = 1 + np.cumsum(num_inner) + np.arange(num_segments)
+    densified[vertex_positions] = xyzt[1:]
+
+    return densified
+
+
+def step_lengths_2d(xs, ys):
+    """
+    Horizontal distances between successive points.
+
+    :param xs: array-like of floats
+    :param ys: array-like of floats
+    :return: numpy array of floats, with one element less than the points
+    """
+
+    return np.hypot(np.diff(np.asarray(xs, dtype=np.float64)),
+                    np.diff(np.asarray(ys, dtype=np.float64)))
+
+
+def step_lengths_3d(steps_2d, zs):
+    """
+    3D distances between successive points, from their horizontal distances.
+    NaN where any of the two points has a NaN z value.
+
+    :param steps_2d: horizontal distances, as from step_lengths_2d - numpy array of floats
+    :param zs: array-like of floats
+    :return: numpy array of floats
+    """
+
+    return np.hypot(steps_2d, np.diff(np.asarray(zs, dtype=np.float64)))
+
+
+def cumulative_lengths(step_lengths):
+    """
+    Progressive distances along a line, starting from 0.0.
+    A NaN step makes NaN all the following distances.
+
+    :param step_lengths: numpy array of floats
+    :return: numpy array of floats, with one element more than the steps
+    """
+
+    lengths = np.zeros(step_lengths.size + 1, dtype=np.float64)
+    np.cumsum(step_lengths, out=lengths[1:])
+
+    return lengths
+
+
+def directional_slopes(steps_2d, zs):
+    """
+    Slopes of the segments starting at each point, in degrees, positive when upward,
+    with the same values as Line.slopes.
+    As in Vect.slope, slopes not larger than MIN_SCALAR_VALUE, NaN included, are set to zero.
+    Slope value for last point is unknown (NaN).
+
+    :param steps_2d: horizontal distances, as from step_lengths_2d - numpy array of floats
+    :param zs: array-like of floats
+    :return: numpy array of floats, with the same size as zs
+    """
+
+    slopes = np.empty(steps_2d.size + 1, dtype=np.float64)
+
+    slopes[:-1] = np.degrees(np.arctan2(np.diff(np.asarray(zs, dtype=np.float64)), steps_2d))
+    with np.errstate(invalid='ignore'):
+        slopes[:-1][~(np.abs(slopes[:-1]) > MIN_SCALAR_VALUE)] = 0.0
+    slopes[-1] = np.nan
+
+    return slopes
 
 
 class Line(object):
     """
-    A list of Point objects.
+    A sequence of points, with the x, y, z and t coordinates
+    stored as rows of a float array.
+    Point objects are created only when explicitly requested.
+    Points added one at a time are collected in a list
+    and appended to the array when the coordinates are next read.
     """
 
     def __init__(self, pts=None):
+        """
+        :param pts: list of Point instances
+        """
 
         if pts is None:
             pts = []
-        self._pts = pts
+        self._xyzt = as_xyzt_array([pt.v for pt in pts])
+
+    @property
+    def _xyzt(self):
+
+        if self._pending_rows:
+            self._coords = np.vstack((self._coords, as_xyzt_array(self._pending_rows)))
+            self._pending_rows = []
+
+        return self._coords
+
+    @_xyzt.setter
+    def _xyzt(self, xyzt):
+
+        self._coords = xyzt
+        self._pending_rows = []
+
+    @classmethod
+    def from_array(cls, coords):
+        """
+        Create a Line from an array of point coordinates.
+        Missing z and t columns are set to NaN.
+
+        :param coords: array-like of floats, shape: N x 2, N x 3 or N x 4
+        :return: Line instance
+        """
+
+        return cls._wrap(as_xyzt_array(coords))
+
+    @classmethod
+    def from_arrays(cls, xs, ys, zs=None, ts=None):
+        """
+        Create a Line from the arrays of the point coordinates.
+
+        :param xs: array-like of floats
+        :param ys: array-like of floats
+        :param zs: array-like of floats or None
+        :param ts: array-like of floats or None
+        :return: Line instance
+        """
+
+        xs = np.asarray(xs, dtype=np.float64)
+
+        xyzt = np.empty((xs.size, 4), dtype=np.float64)
+        xyzt.fill(np.nan)
+        xyzt[:, 0] = xs
+        xyzt[:, 1] = ys
+        if zs is not None:
+            xyzt[:, 2] = zs
+        if ts is not None:
+            xyzt[:, 3] = ts
+
+        return cls._wrap(xyzt)
+
+    @classmethod
+    def _wrap(cls, xyzt):
+
+        line = cls()
+        line._xyzt = xyzt
+        return line
+
+    @property
+    def xyzt(self):
+        """
+        The point coordinates, not to be modified in place.
+
+        :return: numpy array of floats, shape: N x 4
+        """
+
+        return self._xyzt
 
     @property
     def pts(self):
+        """
+        The points of the line, as new Point instances at each access:
+        prefer xyzt or the coordinate arrays when iterating.
+
+        :return: list of Point instances
+        """
+
+        return [Point.from_array(row) for row in self._xyzt]
+
+    def pt(self, ndx):
 
-        return self._pts
+        return Point.from_array(self._xyzt[ndx])
 
     @property
     def num_pts(self):
 
-        return len(self.pts)
+        return self._coords.shape[0] + len(self._pending_rows)
 
     def clone(self):
 
-        return Line(map(lambda pt: pt.clone(), self.pts))
+        return Line._wrap(self._xyzt.copy())
 
     def add_pt(self, pt):
         """
@@ -248,7 +510,7 @@ class Line(object):
         :return: self
         """
 
-        self.pts.append(pt)
+        self._pending_rows.append((pt.x, pt.y, pt.z, pt.t))
 
     def add_pts(self, pt_list):
         """
@@ -259,60 +521,68 @@ class Line(object):
         :return: self
         """
 
-        self._pts += pt_list
+        self._pending_rows.extend((pt.x, pt.y, pt.z, pt.t) for pt in pt_list)
 
     @property
     def x_list(self):
 
-        return [pt.x for pt in self.pts]
+        return self._xyzt[:, 0].tolist()
 
     @property
     def y_list(self):
 
-        return [pt.y for pt in self.pts]
+        return self._xyzt[:, 1].tolist()
 
     @property
     def z_list(self):
 
-        return [pt.z for pt in self.pts]
+        return self._xyzt[:, 2].tolist()
 
     def xy_lists(self):
 
         return self.x_list, self.y_list
 
+    def x_array(self):
+
+        return self._xyzt[:, 0].copy()
+
+    def y_array(self):
+
+        return self._xyzt[:, 1].copy()
+
     @property
     def x_min(self):
 
-        return np.nanmin(self.x_list)
+        return np.nanmin(self._xyzt[:, 0])
 
     @property
     def x_max(self):
 
-        return np.nanmax(self.x_list)
+        return np.nanmax(self._xyzt[:, 0])
 
     @property
     def y_min(self):
 
-        return np.nanmin(self.y_list)
+        return np.nanmin(self._xyzt[:, 1])
 
     @property
     def y_max(self):
 
-        return np.nanmax(self.y_list)
+        return np.nanmax(self._xyzt[:, 1])
 
     @property
     def z_min(self):
 
-        return np.nanmin(self.z_list)
+        return np.nanmin(self._xyzt[:, 2])
 
     @property
     def z_max(self):
 
-        return np.nanmax(self.z_list)
+        return np.nanmax(self._xyzt[:, 2])
 
     def z_array(self):
 
-        return np.array(self.z_list)
+        return self._xyzt[:, 2].copy()
 
     @property
     def z_mean(self):
@@ -338,12 +608,28 @@ class Line(object):
 
         assert self.num_pts >= 2
 
-        new_line = Line(self.pts[:1])
-        for ndx in range(1, self.num_pts):
-            if not self.pts[ndx].coincident(new_line.pts[-1]):
-                new_line.add_pt(self.pts[ndx])
-
-        return new_line
+        xyzt = self._xyzt
+        close_to_previous = coincident_xyzt(xyzt[1:], xyzt[:-1])
+
+        # each point is compared with the last retained one: points are processed one by one
+        # only from a point coincident with its predecessor to the next retained point
+        # whose predecessor is retained too
+
+        keep = np.ones(self.num_pts, dtype=bool)
+        ndx = 1
+        for first_ndx in np.flatnonzero(close_to_previous) + 1:
+            if first_ndx < ndx:
+                continue
+            last_kept_ndx = first_ndx - 1
+            ndx = first_ndx
+            while ndx < self.num_pts and (ndx == first_ndx or last_kept_ndx != ndx - 1):
+                if coincident_xyzt(xyzt[ndx:ndx + 1], xyzt[last_kept_ndx:last_kept_ndx + 1])[0]:
+                    keep[ndx] = False
+                else:
+                    last_kept_ndx = ndx
+                ndx += 1
+
+        return Line._wrap(xyzt[keep])
 
     def as_segments(self):
         """
@@ -352,9 +638,10 @@ class Line(object):
         :return: list of Segment objects
         """
 
-        pts_pairs = zip(self.pts[:-1], self.pts[1:])
+        xyzt = self._xyzt
 
-        segments = [Segment(pt_a, pt_b) for (pt_a, pt_b) in pts_pairs]
+        segments = [Segment(Point.from_array(xyzt_a), Point.from_array(xyzt_b))
+                    for xyzt_a, xyzt_b in zip(xyzt[:-1], xyzt[1:])]
 
         return segments
 
@@ -370,19 +657,11 @@ class Line(object):
 
         assert sample_distance > 0.0
 
-        segments = self.as_segments()
+        assert self.num_pts > 1
 
-        densified_line_list = [segment.densify_2d_segment(sample_distance) for segment in segments]
+        densified_line = Line._wrap(densify_2d_xyzt(self._xyzt, sample_distance))
 
-        assert len(densified_line_list) > 0
-
-        densifyied_multiline = MultiLine(densified_line_list)
-
-        densifyied_line = densifyied_multiline.to_line()
-
-        densifyied_line_wo_coinc_pts = densifyied_line.remove_coincident_points()
-
-        return densifyied_line_wo_coinc_pts
+        return densified_line.remove_coincident_points()
 
     def join(self, another):
         """
@@ -391,62 +670,63 @@ class Line(object):
         and orientation mismatches between the two original lines
         """
 
-        return Line(self.pts + another.pts)
+        return Line._wrap(np.vstack((self._xyzt, another.xyzt)))
+
+    def step_deltas(self):
+        """
+        Coordinate differences between successive points.
+
+        :return: numpy array of floats, shape: (N - 1) x 3
+        """
+
+        return np.diff(self._xyzt[:, :3], axis=0)
+
+    def step_lengths_2d(self):
+
+        return step_lengths_2d(self._xyzt[:, 0], self._xyzt[:, 1])
+
+    def step_lengths_3d(self):
+
+        return step_lengths_3d(self.step_lengths_2d(), self._xyzt[:, 2])
 
     @property
     def length_3d(self):
 
-        length = 0.0
-        for ndx in range(self.num_pts - 1):
-            length += self.pts[ndx].dist_3d(self.pts[ndx + 1])
-        return length
+        return float(np.sum(self.step_lengths_3d()))
 
     @property
     def length_2d(self):
 
-        length = 0.0
-        for ndx in range(self.num_pts - 1):
-            length += self.pts[ndx].dist_2d(self.pts[ndx + 1])
-        return length
+        return float(np.sum(self.step_lengths_2d()))
 
     def incremental_length_3d(self):
 
-        incremental_length_list = []
-        length = 0.0
-        incremental_length_list.append(length)
-        for ndx in range(self.num_pts - 1):
-            length += self.pts[ndx].dist_3d(self.pts[ndx + 1])
-            incremental_length_list.append(length)
-
-        return incremental_length_list
+        return cumulative_lengths(self.step_lengths_3d()).tolist()
 
     def incremental_length_2d(self):
 
-        lIncrementalLengths = []
-        length = 0.0
-        lIncrementalLengths.append(length)
-        for ndx in range(self.num_pts - 1):
-            length += self.pts[ndx].dist_2d(self.pts[ndx + 1])
-            lIncrementalLengths.append(length)
-
-        return lIncrementalLengths
+        return cumulative_lengths(self.step_lengths_2d()).tolist()
 
     def reverse_direction(self):
 
-        new_line = self.clone()
-        new_line.pts.reverse()  # in-place operation on new_line
-
-        return new_line
+        return Line._wrap(self._xyzt[::-1].copy())
 
     def slopes(self):
+        """
+        Slopes of the segments starting at each point, in degrees,
+        positive when upward (see Vect.slope).
+        Slope value for last point is unknown (NaN).
+
+        :return: list of floats
+        """
 
-        lSlopes = []
-        for ndx in range(self.num_pts - 1):
-            vector = Segment(self.pts[ndx], self.pts[ndx + 1]).vector()
-            lSlopes.append(-vector.slope)  # minus because vector convetion is positive downward
-        lSlopes.append(np.nan)  # slope value for last point is unknown
+        lengths_2d = self.step_lengths_2d()
+        deltas_z = np.diff(self._xyzt[:, 2])
 
-        return lSlopes
+        if np.any((lengths_2d == 0.0) & ~(deltas_z > 0.0) & ~(deltas_z < 0.0)):
+            raise Exception("Zero-valued vector")
+
+        return directional_slopes(lengths_2d, self._xyzt[:, 2]).tolist()
 
     def absolute_slopes(self):
 
@@ -454,29 +734,67 @@ class Line(object):
 
     def crs_project(self, srcCrs, destCrs):
 
-        points = []
-        for point in self.pts:
-            destCrs_point = project_point(point, srcCrs, destCrs)
-            points.append(destCrs_point)
+        xy_array = project_xy_array(self._xyzt[:, :2], srcCrs, destCrs)
 
-        return Line(points)
+        return Line.from_array(xy_array)
 
 
 class MultiLine(object):
     """
-    MultiLine is a list of Line objects
+    MultiLine is a set of Line parts, with the point coordinates
+    stored in a single array and the part limits as offsets into it.
     """
 
     def __init__(self, lines_list=None):
+        """
+        :param lines_list: list of Line instances
+        """
 
         if lines_list is None:
             lines_list = []
-        self._lines = lines_list
+
+        if lines_list:
+            self._xyzt = np.vstack([line.xyzt for line in lines_list])
+        else:
+            self._xyzt = np.empty((0, 4), dtype=np.float64)
+        self._offsets = np.cumsum([0] + [line.num_pts for line in lines_list])
+
+    @classmethod
+    def from_array(cls, xyzt, offsets):
+        """
+        Create a MultiLine from the coordinates of all its points.
+
+        :param xyzt: numpy array of floats, shape: N x 4
+        :param offsets: indices of the first point of each part, plus the total number of points
+        :return: MultiLine instance
+        """
+
+        multiline = cls()
+        multiline._xyzt = xyzt
+        multiline._offsets = np.asarray(offsets)
+
+        return multiline
+
+    @property
+    def xyzt(self):
+        """
+        The coordinates of all the points, not to be modified in place.
+
+        :return: numpy array of floats, shape: N x 4
+        """
+
+        return self._xyzt
+
+    @property
+    def offsets(self):
+
+        return self._offsets
 
     @property
     def lines(self):
 
-        return self._lines
+        return [Line._wrap(self._xyzt[start_ndx:end_ndx]) for start_ndx, end_ndx in
+                zip(self._offsets[:-1], self._offsets[1:])]
 
     def add(self, line):
 
@@ -484,80 +802,78 @@ class MultiLine(object):
 
     def clone(self):
 
-        return MultiLine(self.lines)
+        return MultiLine.from_array(self._xyzt.copy(), self._offsets.copy())
 
     @property
     def num_parts(self):
 
-        return len(self.lines)
+        return len(self._offsets) - 1
 
     @property
     def num_points(self):
 
-        num_points = 0
-        for line in self.lines:
-            num_points += line.num_pts
-
-        return num_points
+        return self._xyzt.shape[0]
 
     @property
     def x_min(self):
 
-        return np.nanmin([line.x_min for line in self.lines])
+        return np.nanmin(self._xyzt[:, 0])
 
     @property
     def x_max(self):
 
-        return np.nanmax([line.x_max for line in self.lines])
+        return np.nanmax(self._xyzt[:, 0])
 
     @property
     def y_min(self):
 
-        return np.nanmin([line.y_min for line in self.lines])
+        return np.nanmin(self._xyzt[:, 1])
 
     @property
     def y_max(self):
 
-        return np.nanmax([line.y_max for line in self.lines])
+        return np.nanmax(self._xyzt[:, 1])
 
     @property
     def z_min(self):
 
-        return np.nanmin([line.z_min for line in self.lines])
+        return np.nanmin(self._xyzt[:, 2])
 
     @property
     def z_max(self):
 
-        return np.nanmax([line.z_max for line in self.lines])
+        return np.nanmax(self._xyzt[:, 2])
+
+    def _part_ends(self):
+
+        starts = self._xyzt[self._offsets[:-1]]
+        ends = self._xyzt[self._offsets[1:] - 1]
+
+        return starts, ends
 
     def is_continuous(self):
 
-        for line_ndx in range(len(self._lines) - 1):
-            if not self.lines[line_ndx].pts[-1].coincident(self.lines[line_ndx + 1].pts[0]) or \
-               not self.lines[line_ndx].pts[-1].coincident(self.lines[line_ndx + 1].pts[-1]):
-                return False
+        starts, ends = self._part_ends()
 
-        return True
+        return bool(np.all(coincident_xyzt(ends[:-1], starts[1:]) & coincident_xyzt(ends[:-1], ends[1:])))
 
     def is_unidirectional(self):
 
-        for line_ndx in range(len(self.lines) - 1):
-            if not self.lines[line_ndx].pts[-1].coincident(self.lines[line_ndx + 1].pts[0]):
-                return False
+        starts, ends = self._part_ends()
 
-        return True
+        return bool(np.all(coincident_xyzt(ends[:-1], starts[1:])))
 
     def to_line(self):
 
-        return Line([point for line in self.lines for point in line.pts])
+        return Line._wrap(self._xyzt.copy())
 
     def crs_project(self, srcCrs, destCrs):
 
-        lines = []
-        for line in self.lines:
-            lines.append(line.crs_project(srcCrs, destCrs))
+        # all the parts are projected with a single transform call
+
+        xy_array = project_xy_array(self._xyzt[:, :2], srcCrs, destCrs)
 
-        return MultiLine(lines)
+        return MultiLine.from_array(as_xyzt_array(xy_array), self._offsets.copy())
 
     def densify_2d_multiline(self, sample_distance):
 
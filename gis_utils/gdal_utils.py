@@ -1,9 +1,11 @@
 
 import os
 
+import numpy as np
+
 from osgeo import ogr, gdal, osr
 
-from .errors import RasterParametersException, OGRIOException
+from .errors import RasterParametersException, RasterIOException, OGRIOException
 
 
 from ..gsf.geometry import Point
@@ -297,6 +299,124 @@ class GDALParameters(object):
             return True
 
 
+def open_gdal_raster(raster_path):
+    """
+    Open a raster file in read-only mode.
+
+    @param raster_path: the raster source path.
+    @type raster_path: string.
+
+    @return: GDAL dataset.
+
+    @raise: RasterIOException.
+    """
+
+    dataset = gdal.Open(raster_path, gdal.GA_ReadOnly)
+    if dataset is None:
+        raise RasterIOException("Unable to open raster {} with GDAL".format(raster_path))
+
+    return dataset
+
+
+def read_gdal_band_window(dataset, row_min, row_max, col_min, col_max, band=1, overview=None):
+    """
+    Read a window of cells of a raster band, or of one of its overviews.
+    Rows are counted from the raster top, bounds are inclusive.
+    GDAL releases the GIL during the read, so that datasets opened
+    in different threads can be read concurrently.
+
+    @param dataset: GDAL dataset.
+    @param row_min, row_max, col_min, col_max: window bounds.
+    @type row_min, row_max, col_min, col_max: int.
+    @param band: band number (1-based).
+    @type band: int.
+    @param overview: overview index, None for the full resolution band.
+    @type overview: int or None.
+
+    @return: 2D numpy array of floats, with NaN for no-data cells.
+
+    @raise: RasterIOException.
+    """
+
+    raster_band = dataset.GetRasterBand(band)
+    nodata_value = raster_band.GetNoDataValue()
+
+    if overview is not None:
+        raster_band = raster_band.GetOverview(overview)
+
+    data = raster_band.ReadAsArray(col_min, row_min, col_max - col_min + 1, row_max - row_min + 1)
+    if data is None:
+        raise RasterIOException("Unable to read raster window with GDAL")
+
+    data = data.astype(np.float64)
+
+    if nodata_value is not None:
+        data[data == nodata_value] = np.nan
+
+    return data
+
+
+def gdal_overview_sizes(raster_path, band=1):
+    """
+    Return the sizes of the overviews of a raster band.
+
+    @param raster_path: the raster source path.
+    @type raster_path: string.
+    @param band: band number (1-based).
+    @type band: int.
+
+    @return: list of (columns, rows) tuples, in the overview index order.
+
+    @raise: RasterIOException.
+    """
+
+    raster_band = open_gdal_raster(raster_path).GetRasterBand(band)
+
+    sizes = []
+    for overview_ndx in range(raster_band.GetOverviewCount()):
+        overview_band = raster_band.GetOverview(overview_ndx)
+        sizes.append((overview_band.XSize, overview_band.YSize))
+
+    return sizes
+
+
+def gdal_raster_geotransform(raster_path):
+    """
+    Return the raster geotransform and size.
+
+    @param raster_path: the raster source path.
+    @type raster_path: string.
+
+    @return: tuple of the six-values geotransform tuple, the columns and the rows.
+
+    @raise: RasterIOException.
+    """
+
+    dataset = open_gdal_raster(raster_path)
+
+    return tuple(dataset.GetGeoTransform()), dataset.RasterXSize, dataset.RasterYSize
+
+
+def build_gdal_overviews(raster_path, factors, resampling="AVERAGE"):
+    """
+    Build raster overviews with the given decimation factors.
+    Opened in read-only mode, GDAL stores them in an external .ovr file.
+
+    @param raster_path: the raster source path.
+    @type raster_path: string.
+    @param factors: overview decimation factors.
+    @type factors: list of int.
+    @param resampling: GDAL resampling method.
+    @type resampling: string.
+
+    @raise: RasterIOException.
+    """
+
+    dataset = open_gdal_raster(raster_path)
+    if dataset.BuildOverviews(resampling, list(factors)) != 0:
+        raise RasterIOException("Unable to build overviews of raster {}".format(raster_path))
+
+
 def read_line_shapefile_via_ogr(line_shp_path):
     """
     Read line shapefile using OGR.
@@ -0,0 +1,189 @@
+from __future__ import division
+
+import numpy as np
+
+
+def unique_edges(sources, targets):
+    """
+    Undirected edges from node pairs, without self-loops and duplicates.
+
+    :param sources: numpy array of ints
+    :param targets: numpy array of ints
+    :return: tuple of two numpy arrays of ints, with the lower and the higher node of each edge
+    """
+
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+
+    lows = np.minimum(sources, targets)
+    highs = np.maximum(sources, targets)
+
+    not_loop = lows != highs
+    lows = lows[not_loop]
+    highs = highs[not_loop]
+
+    order = np.lexsort((highs, lows))
+    lows = lows[order]
+    highs = highs[order]
+
+    is_first = np.ones(lows.size, dtype=bool)
+    is_first[1:] = (lows[1:] != lows[:-1]) | (highs[1:] != highs[:-1])
+
+    return lows[is_first], highs[is_first]
+
+
+def csr_adjacency(num_nodes, sources, targets):
+    """
+    Compressed adjacency of an undirected graph:
+    the neighbours of node n are neighbours[offsets[n]:offsets[n + 1]],
+    connected by the edges edge_ndxs[offsets[n]:offsets[n + 1]].
+
+    :param num_nodes: int
+    :param sources: edge first nodes - numpy array of ints
+    :param targets: edge second nodes - numpy array of ints
+    :return: tuple of offsets, neighbours and edge indices, as numpy arrays of ints
+    """
+
+    num_edges = len(sources)
+
+    nodes = np.concatenate((sources, targets)).astype(np.int64)
+    neighbours = np.concatenate((targets, sources)).astype(np.int64)
+    edge_ndxs = np.tile(np.arange(num_edges, dtype=np.int64), 2)
+
+    order = np.argsort(nodes, kind='mergesort')
+
+    offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(nodes, minlength=num_nodes))
+
+    return offsets, neighbours[order], edge_ndxs[order]
+
+
+class UnionFind(object):
+    """
+    Disjoint sets of nodes, with union by size and path halving.
+    Parents and sizes are stored in lists, faster than arrays for single element access.
+    """
+
+    def __init__(self, num_nodes):
+
+        self.parents = list(range(num_nodes))
+        self.sizes = [1] * num_nodes
+
+    def find(self, node):
+
+        parents = self.parents
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+
+        return node
+
+    def union(self, node_a, node_b):
+
+        root_a = self.find(node_a)
+        root_b = self.find(node_b)
+
+        if root_a == root_b:
+            return
+
+        if self.sizes[root_a] < self.sizes[root_b]:
+            root_a, root_b = root_b, root_a
+
+        self.parents[root_b] = root_a
+        self.sizes[root_a] += self.sizes[root_b]
+
+    def labels(self):
+        """
+        Set label of each node, numbered from zero in the order of the first node of each set.
+
+        :return: numpy array of ints
+        """
+
+        roots = np.array([self.find(node) for node in range(len(self.parents))], dtype=np.int64)
+        _, first_ndxs, inverse = np.unique(roots, return_index=True, return_inverse=True)
+
+        # renumber the sets by their first node
+        ranks = np.empty(first_ndxs.size, dtype=np.int64)
+        ranks[np.argsort(first_ndxs, kind='mergesort')] = np.arange(first_ndxs.size)
+
+        return ranks[inverse]
+
+
+def connected_components(num_nodes, sources, targets):
+    """
+    Connected component of each node of an undirected graph.
+
+    :param num_nodes: int
+    :param sources: edge first nodes - numpy array of ints
+    :param targets: edge second nodes - numpy array of ints
+    :return: numpy array of ints
+    """
+
+    sets = UnionFind(num_nodes)
+    for source, target in zip(np.asarray(sources).tolist(), np.asarray(targets).tolist()):
+        sets.union(source, target)
+
+    return sets.labels()
+
+
+def graph_paths(num_nodes, sources, targets):
+    """
+    Decompose an undirected graph into ordered paths of nodes.
+    Paths run between nodes whose degree is not two (ends and branching nodes),
+    or are cycles, with the same first and last node.
+    Every edge belongs to just one path; isolated nodes are not returned.
+    Self-loops and duplicated edges are ignored.
+
+    :param num_nodes: int
+    :param sources: edge first nodes - numpy array of ints
+    :param targets: edge second nodes - numpy array of ints
+    :return: list of numpy arrays of ints
+    """
+
+    sources, targets = unique_edges(sources, targets)
+
+    offsets, neighbours, edge_ndxs = csr_adjacency(num_nodes, sources, targets)
+    degrees = np.diff(offsets)
+
+    end_nodes = np.flatnonzero((degrees > 0) & (degrees != 2))
+    inner_nodes = np.flatnonzero(degrees == 2)
+
+    # lists are faster than arrays for the element by element walk
+    offsets, neighbours, edge_ndxs, degrees = offsets.tolist(), neighbours.tolist(), edge_ndxs.tolist(), \
+        degrees.tolist()
+
+    visited = [False] * len(sources)
+
+    def walk(start_node, position):
+        """
+        Follow the path starting with the adjacency entry at position,
+        through nodes of degree two.
+        """
+
+        path = [start_node]
+        while True:
+            visited[edge_ndxs[position]] = True
+            node = neighbours[position]
+            path.append(node)
+            if degrees[node] != 2 or node == start_node:
+                return np.array(path, dtype=np.int64)
+            first = offsets[node]
+            position = first if not visited[edge_ndxs[first]] else first + 1
+
+    paths = []
+
+    # open paths, from end and branching nodes
+
+    for node in end_nodes.tolist():
+        for position in range(offsets[node], offsets[node + 1]):
+            if not visited[edge_ndxs[position]]:
+                paths.append(walk(node, position))
+
+    # cycles, the only edges left
+
+    for node in inner_nodes.tolist():
+        position = offsets[node]
+        if not visited[edge_ndxs[position]]:
+            paths.append(walk(node, position))
+
+    return paths
@@ -2,529 +2,544 @@
 from __future__ import division
 
 from math import *
+from itertools import chain
 
 import numpy as np
 
-from ..gsf.geometry import Point, GAxis, GVect, Vect
+from ..gsf.geometry import MIN_SCALAR_VALUE, Point, GAxis, GVect, Vect
 
-from .features import Segment, ParamLine3D
+from .features import MultiLine, as_xyzt_array
 from .profile import PlaneAttitude
-from .errors import ConnectionException
+from .graphs import connected_components, graph_paths
+from .spatial_index import polyline_distances
 
 
-def calculate_distance_with_sign(projected_point, section_init_pt, section_vector):
-
-    assert projected_point.z != np.nan
-    assert projected_point.z is not None
-
-    projected_vector = Segment(section_init_pt, projected_point).vector()
-    cos_alpha = section_vector.cos_angle(projected_vector)
+def attitude_versors(trends, plunges):
+    """
+    Versors of geological vectors, as in GVect.versor.
 
-    return projected_vector.len_3d * cos_alpha
+    :param trends: numpy array of floats, degrees
+    :param plunges: numpy array of floats, degrees
+    :return: numpy array of floats, shape: N x 3
+    """
 
+    trends = np.radians(trends)
+    plunges = np.radians(plunges)
 
-def get_intersection_slope(intersection_versor_3d, section_vector):
+    return np.column_stack((np.cos(plunges) * np.sin(trends),
+                            np.cos(plunges) * np.cos(trends),
+                            -np.sin(plunges)))
 
-    slope_radians = abs(radians(intersection_versor_3d.slope))
-    scalar_product_for_downward_sense = section_vector.sp(intersection_versor_3d.downward)
-    if scalar_product_for_downward_sense > 0.0:
-        intersection_downward_sense = "right"
-    elif scalar_product_for_downward_sense == 0.0:
-        intersection_downward_sense = "vertical"
-    else:
-        intersection_downward_sense = "left"
 
-    return slope_radians, intersection_downward_sense
+def section_plane_terms(section_data):
+    """
+    Section plane, with unit normal, and section start and unit vector, as arrays.
 
+    :param section_data: section initial point, Cartesian plane and vector - dictionary
+    :return: tuple of plane unit normal (numpy array of floats), plane d coefficient (float),
+             section start and section versor (numpy arrays of floats)
+    """
 
-def calculate_intersection_versor(section_cartes_plane, structural_cartes_plane):
+    section_init_pt, section_cartes_plane, section_vector = section_data['init_pt'], section_data['cartes_plane'], \
+                                                            section_data['vector']
 
-    return section_cartes_plane.inters_versor(structural_cartes_plane)
+    section_normal = np.array([section_cartes_plane.a, section_cartes_plane.b, section_cartes_plane.c])
+    section_normal_len = np.linalg.norm(section_normal)
 
+    section_vect = np.array([section_vector.x, section_vector.y, section_vector.z])
 
-def calculate_nearest_intersection(intersection_versor_3d, section_cartes_plane, structural_cartes_plane,
-                                   structural_pt):
+    return section_normal / section_normal_len, \
+        section_cartes_plane.d / section_normal_len, \
+        np.array([section_init_pt.x, section_init_pt.y, section_init_pt.z]), \
+        section_vect / np.linalg.norm(section_vect)
 
-    dummy_inters_point = section_cartes_plane.inters_point(structural_cartes_plane)
-    dummy_structural_vector = Segment(dummy_inters_point, structural_pt).vector()
-    dummy_distance = dummy_structural_vector.sp(intersection_versor_3d)
-    offset_vector = intersection_versor_3d.scale(dummy_distance)
 
-    return Point(dummy_inters_point.x + offset_vector.x,
-                 dummy_inters_point.y + offset_vector.y,
-                 dummy_inters_point.z + offset_vector.z)
+def axis_section_intersections(pts, axis_versors, section_normal, section_d):
+    """
+    Intersections with the section plane of the lines through a set of points,
+    parallel to the given axes, as in ParamLine3D.intersect_cartes_plane.
+
+    :param pts: numpy array of floats, shape: N x 3
+    :param axis_versors: numpy array of floats, shape: N x 3 or 3
+    :param section_normal: section plane unit normal - numpy array of floats
+    :param section_d: section plane d coefficient - float
+    :return: numpy array of floats, shape: N x 3, NaN for axes parallel to the section
+    """
 
+    with np.errstate(divide='ignore', invalid='ignore'):
 
-def calculate_axis_intersection(map_axis, section_cartes_plane, structural_pt):
+        denominators = np.dot(axis_versors, section_normal)
+        line_params = np.where(denominators != 0.0, (pts.dot(section_normal) + section_d) / denominators, np.nan)
 
-    axis_versor = map_axis.as_vect().versor
-    l, m, n = axis_versor.x, axis_versor.y, axis_versor.z
-    axis_param_line = ParamLine3D(structural_pt, l, m, n)
-    return axis_param_line.intersect_cartes_plane(section_cartes_plane)
+    return pts - axis_versors * np.reshape(line_params, (-1, 1))
 
 
-def map_measure_to_section(structural_rec, section_data, map_axis=None):
+def map_attitudes_on_section(xs, ys, zs, dip_dirs, dip_angles, section_data, axis_trends=None, axis_plunges=None):
+    """
+    Project a set of structural attitudes onto the section plane.
+    Attitudes are projected to the nearest point of their intersection with the section plane
+    or, when axes are provided, along them.
+
+    :param xs, ys, zs: structural point coordinates - numpy arrays of floats
+    :param dip_dirs, dip_angles: structural plane attitudes, in degrees - numpy arrays of floats
+    :param section_data: section initial point, Cartesian plane and vector - dictionary
+    :param axis_trends, axis_plunges: projection axes, in degrees - floats or numpy arrays of floats
+    :return: tuple of the valid projection flags (numpy array of bools), projected points (numpy array of floats,
+             shape: N x 3), slopes in radians (numpy array of floats), downward senses (list of strings)
+             and signed distances from the section start (numpy array of floats)
+    """
 
-    # extract source data
-    structural_pt, structural_plane, structural_pt_id = structural_rec
-    section_init_pt, section_cartes_plane, section_vector = section_data['init_pt'], section_data['cartes_plane'], \
-                                                            section_data['vector']
+    pts = np.column_stack((xs, ys, zs)).astype(np.float64)
 
-    # transform geological plane attitude into Cartesian plane      
-    structural_cartes_plane = structural_plane.plane(structural_pt)
+    section_normal, section_d, section_init_xyz, section_versor = section_plane_terms(section_data)
 
-    ## intersection versor
-    intersection_versor_3d = calculate_intersection_versor(section_cartes_plane, structural_cartes_plane)
+    # structural plane normals, as in GPlane.normal
 
-    # calculate slope of geological plane onto section plane
-    slope_radians, intersection_downward_sense = get_intersection_slope(intersection_versor_3d, section_vector)
+    structural_normals = attitude_versors(np.asarray(dip_dirs, dtype=np.float64) % 360.0,
+                                          np.asarray(dip_angles, dtype=np.float64) - 90.0)
 
-    # intersection point
-    if map_axis is None:
-        intersection_point_3d = calculate_nearest_intersection(intersection_versor_3d, section_cartes_plane,
-                                                               structural_cartes_plane, structural_pt)
-    else:
-        intersection_point_3d = calculate_axis_intersection(map_axis, section_cartes_plane, structural_pt)
+    with np.errstate(divide='ignore', invalid='ignore'):
 
-    # horizontal spat_distance between projected structural point and profile start
-    signed_distance_from_section_start = calculate_distance_with_sign(intersection_point_3d, section_init_pt,
-                                                                      section_vector)
+        # intersection versors
 
-    # solution for current structural point
-    return PlaneAttitude(structural_pt_id,
-                         structural_pt,
-                         structural_plane,
-                         intersection_point_3d,
-                         slope_radians,
-                         intersection_downward_sense,
-                         signed_distance_from_section_start)
+        intersection_versors = np.cross(section_normal, structural_normals)
+        intersection_versors /= np.linalg.norm(intersection_versors, axis=1)[:, np.newaxis]
 
+        valid = np.all(np.isfinite(intersection_versors), axis=1)
 
-def map_struct_pts_on_section(structural_data, section_data, mapping_method):
-    """
-    defines:
-        - 2D x-y location in section
-        - plane-plane segment intersection
-    """
+        # slope of geological plane onto section plane
 
-    if mapping_method['method'] == 'nearest':
-        return [map_measure_to_section(structural_rec, section_data) for structural_rec in structural_data]
+        horizontal_lengths = np.hypot(intersection_versors[:, 0], intersection_versors[:, 1])
+        slopes_radians = np.abs(np.arctan(intersection_versors[:, 2] / horizontal_lengths))
+        slopes_radians[np.abs(np.degrees(slopes_radians)) <= MIN_SCALAR_VALUE] = 0.0
 
-    if mapping_method['method'] == 'common axis':
-        map_axis = GAxis(mapping_method['trend'], mapping_method['plunge'])
-        return [map_measure_to_section(structural_rec, section_data, map_axis) for structural_rec in structural_data]
+        downward_versors = np.where((intersection_versors[:, 2] > 0.0)[:, np.newaxis],
+                                    -intersection_versors, intersection_versors)
+        downward_products = downward_versors.dot(section_versor)
+        intersection_downward_senses = np.where(downward_products > 0.0, "right",
+                                                np.where(downward_products == 0.0, "vertical", "left"))
 
-    if mapping_method['method'] == 'individual axes':
-        assert len(mapping_method['individual_axes_values']) == len(structural_data)
-        result = []
-        for structural_rec, (trend, plunge) in zip(structural_data, mapping_method['individual_axes_values']):
-            try:
-                map_axis = GAxis(trend, plunge)
-                result.append(map_measure_to_section(structural_rec, section_data, map_axis))
-            except:
-                continue
-        return result
+        # intersection points
 
+        if axis_trends is None:
 
-class IntersectionParameters(object):
-    """
-    IntersectionParameters class.
-    Manages the metadata for spdata results (DEM source filename, source point, plane attitude.
-    
-    """
+            # point of the intersection line nearest to the structural point:
+            # minimum norm correction satisfying both plane equations
 
-    def __init__(self, sourcename, srcPt, srcPlaneAttitude):
-        self._sourcename = sourcename
-        self._srcPt = srcPt
-        self._srcPlaneAttitude = srcPlaneAttitude
+            section_residuals = -(pts.dot(section_normal) + section_d)
+            normals_sp = structural_normals.dot(section_normal)
+            determinants = 1.0 - normals_sp * normals_sp
+            section_coeffs = section_residuals / determinants
+            structural_coeffs = - normals_sp * section_residuals / determinants
 
+            intersection_points = pts + section_coeffs[:, np.newaxis] * section_normal + \
+                                  structural_coeffs[:, np.newaxis] * structural_normals
 
-class Intersections(object):
+        else:
 
-    def __init__(self):
+            # common axis values are repeated for all the points
+            axis_trends = np.zeros(pts.shape[0]) + np.asarray(axis_trends, dtype=np.float64)
+            axis_plunges = np.zeros(pts.shape[0]) + np.asarray(axis_plunges, dtype=np.float64)
 
-        self.parameters = None
+            valid &= np.abs(axis_plunges) <= 90.0
 
-        self.xcoords_x = []
-        self.xcoords_y = []
-        self.ycoords_x = []
-        self.ycoords_y = []
+            intersection_points = axis_section_intersections(pts, attitude_versors(axis_trends, axis_plunges),
+                                                             section_normal, section_d)
 
-        self.links = None
-        self.networks = {}
+        valid &= np.all(np.isfinite(intersection_points), axis=1)
 
-    def get_intersections(self):
-        """
-        Initialize a structured array of the possible and found links for each intersection.
-        It will store a list of the possible connections for each intersection,
-        together with the found connections.       
-        """
+        # horizontal distance between projected structural point and profile start
 
-        # data type for structured array storing intersection parameters
-        dt = np.dtype([('id', np.uint16),
-                       ('i', np.uint16),
-                       ('j', np.uint16),
-                       ('pi_dir', np.str_, 1),
-                       ('conn_from', np.uint16),
-                       ('conn_to', np.uint16),
-                       ('start', np.bool_)
-                       ])
+        signed_distances = (intersection_points - section_init_xyz).dot(section_versor)
 
-        # number of valid intersections
-        num_intersections = len(list(self.xcoords_x[np.logical_not(np.isnan(self.xcoords_x))])) + \
-                            len(list(self.ycoords_y[np.logical_not(np.isnan(self.ycoords_y))]))
+    return valid, intersection_points, slopes_radians, intersection_downward_senses.tolist(), signed_distances
 
-        # creation and initialization of structured array of valid intersections in the x-direction
-        links = np.zeros((num_intersections), dtype=dt)
 
-        # filling array with values
+def map_struct_pts_on_section(structural_data, section_data, mapping_method):
+    """
+    defines:
+        - 2D x-y location in section
+        - plane-plane segment intersection
+    All the structural records are processed at once with map_attitudes_on_section.
+    Records that cannot be projected (e.g., with invalid individual axes) are skipped.
+    """
 
-        curr_ndx = 0
-        for i in xrange((self.xcoords_x.shape)[0]):
-            for j in xrange(self.xcoords_x.shape[1]):
-                if not isnan(self.xcoords_x[i, j]):
-                    links[curr_ndx] = (curr_ndx + 1, i, j, 'x', 0, 0, False)
-                    curr_ndx += 1
+    structural_data = list(structural_data)
 
-        for i in xrange(self.ycoords_y.shape[0]):
-            for j in xrange(self.ycoords_y.shape[1]):
-                if not isnan(self.ycoords_y[i, j]):
-                    links[curr_ndx] = (curr_ndx + 1, i, j, 'y', 0, 0, False)
-                    curr_ndx += 1
+    if mapping_method['method'] == 'nearest':
+        axis_trends, axis_plunges = None, None
+    elif mapping_method['method'] == 'common axis':
+        map_axis = GAxis(mapping_method['trend'], mapping_method['plunge'])
+        axis_trends, axis_plunges = map_axis.tp
+    elif mapping_method['method'] == 'individual axes':
+        assert len(mapping_method['individual_axes_values']) == len(structural_data)
 
-        return links
+        def float_or_nan(value):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return np.nan
 
-    def set_neighbours(self):
+        axis_trends = np.array([float_or_nan(trend) for trend, _ in mapping_method['individual_axes_values']])
+        axis_plunges = np.array([float_or_nan(plunge) for _, plunge in mapping_method['individual_axes_values']])
+    else:
+        return
 
-        # shape of input arrays (equal shapes)
-        num_rows, num_cols = self.xcoords_x.shape
+    if not structural_data:
+        return []
+
+    structural_pts = [structural_rec[0] for structural_rec in structural_data]
+    structural_planes = [structural_rec[1] for structural_rec in structural_data]
+
+    xs = np.array([pt.x for pt in structural_pts])
+    ys = np.array([pt.y for pt in structural_pts])
+
+    section_init_pt, section_vector = section_data['init_pt'], section_data['vector']
+    section_distances = polyline_distances(xs, ys, [(section_init_pt.x, section_init_pt.y),
+                                                    (section_init_pt.x + section_vector.x,
+                                                     section_init_pt.y + section_vector.y)])
+
+    valid, intersection_points, slopes_radians, intersection_downward_senses, signed_distances = \
+        map_attitudes_on_section(xs,
+                                 ys,
+                                 np.array([pt.z for pt in structural_pts]),
+                                 np.array([plane.dd for plane in structural_planes]),
+                                 np.array([plane.da for plane in structural_planes]),
+                                 section_data,
+                                 axis_trends,
+                                 axis_plunges)
+
+    return [PlaneAttitude(structural_pt_id,
+                          structural_pt,
+                          structural_plane,
+                          Point(*intersection_points[ndx]),
+                          slopes_radians[ndx],
+                          intersection_downward_senses[ndx],
+                          signed_distances[ndx],
+                          section_distances[ndx])
+            for ndx, (structural_pt, structural_plane, structural_pt_id) in enumerate(structural_data)
+            if valid[ndx]]
+
+
+def project_multilines_on_section(multilines, zs, section_data, axis_trend, axis_plunge):
+    """
+    Project the points of a set of lines onto the section plane along a common axis.
+    All the points are projected at once, from the flat coordinates array of the lines.
+
+    :param multilines: lines, in the section CRS - list of MultiLine
+    :param zs: z values of all the points of the lines, in order - array-like of floats
+    :param section_data: section initial point, Cartesian plane and vector - dictionary
+    :param axis_trend, axis_plunge: projection axis, in degrees - floats
+    :return: projected lines, with the signed distance from the section start as x
+             and the elevation as y - list of MultiLine
+    """
 
-        # dictionary storing intersection links
-        neighbours = {}
-
-        # search and connect intersection points   
-        for curr_ndx in xrange(self.links.shape[0]):
-
-            # get current point location (i, j) and direction type (pi_dir)
-            curr_id = self.links[curr_ndx]['id']
-            curr_i = self.links[curr_ndx]['i']
-            curr_j = self.links[curr_ndx]['j']
-            curr_dir = self.links[curr_ndx]['pi_dir']
-
-            # check possible connected spdata
-            near_intersections = []
-
-            if curr_dir == 'x':
-
-                if curr_i < num_rows - 1 and curr_j < num_cols - 1:
-
-                    try:  # -- A
-                        id_link = self.links[(self.links['i'] == curr_i + 1) & \
-                                             (self.links['j'] == curr_j + 1) & \
-                                             (self.links['pi_dir'] == 'y')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-                    try:  # -- B
-                        id_link = self.links[(self.links['i'] == curr_i + 1) & \
-                                             (self.links['j'] == curr_j) & \
-                                             (self.links['pi_dir'] == 'x')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-                    try:  # -- C
-                        id_link = self.links[(self.links['i'] == curr_i + 1) & \
-                                             (self.links['j'] == curr_j) & \
-                                             (self.links['pi_dir'] == 'y')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-
-                if curr_i > 0 and curr_j < num_cols - 1:
-
-                    try:  # -- E
-                        id_link = self.links[(self.links['i'] == curr_i) & \
-                                             (self.links['j'] == curr_j) & \
-                                             (self.links['pi_dir'] == 'y')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-                    try:  # -- F
-                        id_link = self.links[(self.links['i'] == curr_i - 1) & \
-                                             (self.links['j'] == curr_j) & \
-                                             (self.links['pi_dir'] == 'x')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-                    try:  # -- G
-                        id_link = self.links[(self.links['i'] == curr_i) & \
-                                             (self.links['j'] == curr_j + 1) & \
-                                             (self.links['pi_dir'] == 'y')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-
-            if curr_dir == 'y':
-
-                if curr_i > 0 and curr_j < num_cols - 1:
-
-                    try:  # -- D
-                        id_link = self.links[(self.links['i'] == curr_i) & \
-                                             (self.links['j'] == curr_j) & \
-                                             (self.links['pi_dir'] == 'x')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-                    try:  # -- F
-                        id_link = self.links[(self.links['i'] == curr_i - 1) & \
-                                             (self.links['j'] == curr_j) & \
-                                             (self.links['pi_dir'] == 'x')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-                    try:  # -- G
-                        id_link = self.links[(self.links['i'] == curr_i) & \
-                                             (self.links['j'] == curr_j + 1) & \
-                                             (self.links['pi_dir'] == 'y')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-
-                if curr_i > 0 and curr_j > 0:
-
-                    try:  # -- H
-                        id_link = self.links[(self.links['i'] == curr_i) & \
-                                             (self.links['j'] == curr_j - 1) & \
-                                             (self.links['pi_dir'] == 'x')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-                    try:  # -- I
-                        id_link = self.links[(self.links['i'] == curr_i) & \
-                                             (self.links['j'] == curr_j - 1) & \
-                                             (self.links['pi_dir'] == 'y')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-                    try:  # -- L
-                        id_link = self.links[(self.links['i'] == curr_i - 1) & \
-                                             (self.links['j'] == curr_j - 1) & \
-                                             (self.links['pi_dir'] == 'x')]['id']
-                        if len(list(id_link)) == 1:
-                            near_intersections.append(id_link[0])
-                    except:
-                        pass
-
-            neighbours[curr_id] = near_intersections
+    if not multilines:
+        return []
 
-        return neighbours
+    xy = np.vstack([multiline.xyzt[:, :2] for multiline in multilines])
+    pts = np.column_stack((xy, np.asarray(zs, dtype=np.float64)))
 
-    def follow_path(self, start_id):
-        """
-        Creates a path of connected intersections from a given start intersection.
-        
-        """
-        from_id = start_id
+    section_normal, section_d, section_init_xyz, section_versor = section_plane_terms(section_data)
 
-        while self.links[from_id - 1]['conn_to'] == 0:
+    axis_versor = attitude_versors(np.array([axis_trend]), np.array([axis_plunge]))[0]
+    section_pts = axis_section_intersections(pts, axis_versor, section_normal, section_d)
 
-            conns = self.neighbours[from_id]
-            num_conn = len(conns)
-            if num_conn == 0:
-                raise ConnectionException, 'no connected intersection'
-            elif num_conn == 1:
-                if self.links[conns[0] - 1]['conn_from'] == 0 and self.links[conns[0] - 1]['conn_to'] != from_id:
-                    to_id = conns[0]
-                else:
-                    raise ConnectionException, 'no free connection'
-            elif num_conn == 2:
-                if self.links[conns[0] - 1]['conn_from'] == 0 and self.links[conns[0] - 1]['conn_to'] != from_id:
-                    to_id = conns[0]
-                elif self.links[conns[1] - 1]['conn_from'] == 0 and self.links[conns[1] - 1]['conn_to'] != from_id:
-                    to_id = conns[1]
-                else:
-                    raise ConnectionException, 'no free connection'
-            else:
-                raise ConnectionException, 'multiple connection'
+    signed_distances = (section_pts - section_init_xyz).dot(section_versor)
+    section_coords = as_xyzt_array(np.column_stack((signed_distances, section_pts[:, 2])))
 
-            # set connection
-            self.links[to_id - 1]['conn_from'] = from_id
-            self.links[from_id - 1]['conn_to'] = to_id
+    projected_multilines = []
+    first_ndx = 0
+    for multiline in multilines:
+        last_ndx = first_ndx + multiline.num_points
+        projected_multilines.append(MultiLine.from_array(section_coords[first_ndx:last_ndx],
+                                                         multiline.offsets.copy()))
+        first_ndx = last_ndx
 
-            # prepare for next step
-            from_id = to_id
+    return projected_multilines
 
-    def path_closed(self, start_id):
 
-        from_id = start_id
+def intersection_cells(xcoords_x, xcoords_y, ycoords_x, ycoords_y, row_offset=0, col_offset=0):
+    """
+    Cells of the intersections found in a grid window, as returned by Grid.intersection_with_surface.
 
-        while self.links[from_id - 1]['conn_to'] != 0:
+    :param row_offset: grid row of the window first row - int
+    :param col_offset: grid column of the window first column - int
+    :return: tuple of the x- and y-direction intersection cells, each as
+             rows, columns, x and y coordinates numpy arrays
+    """
 
-            to_id = self.links[from_id - 1]['conn_to']
+    cells = []
+    for xs, ys, found in ((xcoords_x, xcoords_y, xcoords_x),
+                          (ycoords_x, ycoords_y, ycoords_y)):
 
-            if to_id == start_id: return True
+        rows, cols = np.nonzero(np.logical_not(np.isnan(found)))
 
-            from_id = to_id
+        cells.append((rows + row_offset,
+                      cols + col_offset,
+                      xs[rows, cols].astype(np.float64),
+                      ys[rows, cols].astype(np.float64)))
 
-        return False
+    return tuple(cells)
 
-    def invert_path(self, start_id):
 
-        self.links[start_id - 1]['start'] = False
+class IntersectionParameters(object):
+    """
+    IntersectionParameters class.
+    Manages the metadata for spdata results (DEM source filename, source point, plane attitude.
+    
+    """
 
-        curr_id = start_id
+    def __init__(self, sourcename, srcPt, srcPlaneAttitude):
+        self._sourcename = sourcename
+        self._srcPt = srcPt
+        self._srcPlaneAttitude = srcPlaneAttitude
 
-        while curr_id != 0:
 
-            prev_from_id = self.links[curr_id - 1]['conn_from']
-            prev_to_id = self.links[curr_id - 1]['conn_to']
+class Intersections(object):
 
-            self.links[curr_id - 1]['conn_from'] = prev_to_id
-            self.links[curr_id - 1]['conn_to'] = prev_from_id
+    def __init__(self):
 
-            if self.links[curr_id - 1]['conn_from'] == 0:
-                self.links[curr_id - 1]['start'] = True
+        self.parameters = None
 
-            curr_id = prev_to_id
+        self.xcoords_x = []
+        self.xcoords_y = []
+        self.ycoords_x = []
+        self.ycoords_y = []
 
-        return
+        self.links = None
+        self.neighbours = {}
+        self.networks = {}
 
-    def patch_path(self, start_id):
+        # grid shape and intersection coordinates, when created from sparse intersections
+        self.grid_shape = None
+        self.link_xy = None
 
-        if self.path_closed(start_id): return
+    @classmethod
+    def from_cells(cls, grid_shape, x_cells, y_cells):
+        """
+        Create the intersections from the grid cells where they were found,
+        without the full grid arrays, e.g. when collected tile by tile.
+        Links are initialized in the same order as with get_intersections.
+
+        :param grid_shape: grid rows and columns - tuple of two ints
+        :param x_cells: rows, columns, x and y coordinates of the x-direction intersections - tuple of numpy arrays
+        :param y_cells: rows, columns, x and y coordinates of the y-direction intersections - tuple of numpy arrays
+        :return: Intersections
+        """
 
-        from_id = start_id
+        intersections = cls()
+        intersections.grid_shape = tuple(grid_shape)
 
-        conns = self.neighbours[from_id]
-        try:
-            conns.remove(self.links[from_id - 1]['conn_to'])
-        except:
-            pass
+        cells = []
+        for rows, cols, xs, ys in (x_cells, y_cells):
+            order = np.lexsort((cols, rows))
+            cells.append((np.asarray(rows)[order], np.asarray(cols)[order],
+                          np.column_stack((np.asarray(xs)[order], np.asarray(ys)[order]))))
 
-        num_conn = len(conns)
+        (x_rows, x_cols, x_xy), (y_rows, y_cols, y_xy) = cells
 
-        if num_conn != 1: return
+        intersections.links = cls.init_links(x_rows, x_cols, y_rows, y_cols)
+        intersections.link_xy = np.vstack((x_xy, y_xy)).astype(np.float64)
 
-        new_toid = self.links[conns[0] - 1]
+        return intersections
 
-        if self.links[new_toid]['conn_to'] > 0 \
-                and self.links[new_toid]['conn_to'] != from_id \
-                and self.links[new_toid]['conn_from'] == 0:
+    @staticmethod
+    def init_links(x_rows, x_cols, y_rows, y_cols):
+        """
+        Structured array of the x- and y-direction intersections, given their grid positions.
+        """
 
-            if self.path_closed(new_toid): return
-            self.invert_path(from_id)
-            self.links[from_id - 1]['conn_to'] = new_toid
-            self.links[new_toid - 1]['conn_from'] = from_id
-            self.links[new_toid - 1]['start'] = False
+        # data type for structured array storing intersection parameters
+        dt = np.dtype([('id', np.uint32),
+                       ('i', np.uint32),
+                       ('j', np.uint32),
+                       ('pi_dir', np.str_, 1)
+                       ])
 
-    def define_paths(self):
+        # number of valid intersections
+        num_intersections = x_rows.size + y_rows.size
 
-        # simple networks starting from border
-        for ndx in xrange(self.links.shape[0]):
+        # creation and initialization of structured array of valid intersections
+        links = np.zeros((num_intersections), dtype=dt)
 
-            if len(self.neighbours[ndx + 1]) != 1 or \
-                            self.links[ndx]['conn_from'] > 0 or \
-                            self.links[ndx]['conn_to'] > 0:
-                continue
+        links['id'] = np.arange(1, num_intersections + 1)
+        links['i'] = np.concatenate((x_rows, y_rows))
+        links['j'] = np.concatenate((x_cols, y_cols))
+        links['pi_dir'][:x_rows.size] = 'x'
+        links['pi_dir'][x_rows.size:] = 'y'
 
-            try:
-                self.follow_path(ndx + 1)
-            except:
-                continue
+        return links
 
-        # inner, simple networks
+    def get_intersections(self):
+        """
+        Initialize a structured array of the found intersections,
+        storing their id, grid position (i, j) and direction.
+        Ids start from 1, following the x-direction and then the y-direction intersections,
+        each in row-major order.
+        """
 
-        for ndx in xrange(self.links.shape[0]):
+        x_rows, x_cols = np.nonzero(np.logical_not(np.isnan(self.xcoords_x)))
+        y_rows, y_cols = np.nonzero(np.logical_not(np.isnan(self.ycoords_y)))
+
+        return self.init_links(x_rows, x_cols, y_rows, y_cols)
+
+    # neighbour rules, in search order:
+    # (direction of the current intersection, condition on its position,
+    #  row and column offsets and direction of the neighbour)
+    NEIGHBOUR_RULES = [('x', 'lower_right', 1, 1, 'y'),  # -- A
+                       ('x', 'lower_right', 1, 0, 'x'),  # -- B
+                       ('x', 'lower_right', 1, 0, 'y'),  # -- C
+                       ('x', 'upper_right', 0, 0, 'y'),  # -- E
+                       ('x', 'upper_right', -1, 0, 'x'),  # -- F
+                       ('x', 'upper_right', 0, 1, 'y'),  # -- G
+                       ('y', 'upper_right', 0, 0, 'x'),  # -- D
+                       ('y', 'upper_right', -1, 0, 'x'),  # -- F
+                       ('y', 'upper_right', 0, 1, 'y'),  # -- G
+                       ('y', 'upper_left', 0, -1, 'x'),  # -- H
+                       ('y', 'upper_left', 0, -1, 'y'),  # -- I
+                       ('y', 'upper_left', -1, -1, 'x')]  # -- L
 
-            if len(self.neighbours[ndx + 1]) != 2 or \
-                            self.links[ndx]['conn_to'] > 0 or \
-                            self.links[ndx]['start'] == True:
-                continue
+    def set_neighbours(self):
+        """
+        Find the connectable intersections of each intersection.
+        Intersection ids are looked up by their sorted (i, j, direction) keys,
+        so that the search does not need arrays with the grid shape.
 
-            try:
-                self.links[ndx]['start'] = True
-                self.follow_path(ndx + 1)
-            except:
-                continue
+        :return: dictionary of the neighbour ids of each intersection id
+        """
 
-        # inner, simple networks, connection of FROM
+        # shape of input arrays (equal shapes)
+        if self.grid_shape is not None:
+            num_rows, num_cols = self.grid_shape
+        else:
+            num_rows, num_cols = self.xcoords_x.shape
+
+        ids = self.links['id']
+        rows = self.links['i'].astype(np.int64)
+        cols = self.links['j'].astype(np.int64)
+        dirs = self.links['pi_dir']
+
+        def cell_keys(key_rows, key_cols, direction):
+            return (key_rows * num_cols + key_cols) * 2 + (0 if direction == 'x' else 1)
+
+        # intersection ids sorted by key
+        keys = np.where(dirs == 'x', cell_keys(rows, cols, 'x'), cell_keys(rows, cols, 'y'))
+        key_order = np.argsort(keys, kind='mergesort')
+        sorted_keys = keys[key_order]
+        sorted_ids = ids[key_order]
+
+        def find_ids(searched_keys):
+            # ids of the intersections with the searched keys, zero where missing
+            positions = np.minimum(np.searchsorted(sorted_keys, searched_keys), max(sorted_keys.size - 1, 0))
+            found_ids = np.zeros(searched_keys.size, dtype=ids.dtype)
+            if sorted_keys.size > 0:
+                is_found = sorted_keys[positions] == searched_keys
+                found_ids[is_found] = sorted_ids[positions[is_found]]
+            return found_ids
+
+        position_conditions = {'lower_right': (rows < num_rows - 1) & (cols < num_cols - 1),
+                               'upper_right': (rows > 0) & (cols < num_cols - 1),
+                               'upper_left': (rows > 0) & (cols > 0)}
+
+        # found (link index, rule number, neighbour id) triplets
+        link_ndxs = []
+        rule_ndxs = []
+        near_ids = []
+        for rule_ndx, (curr_dir, position, d_i, d_j, near_dir) in enumerate(self.NEIGHBOUR_RULES):
+
+            candidates = np.flatnonzero((dirs == curr_dir) & position_conditions[position])
+            candidate_near_ids = find_ids(cell_keys(rows[candidates] + d_i, cols[candidates] + d_j, near_dir))
+            found = candidate_near_ids != 0
+
+            link_ndxs.append(candidates[found])
+            rule_ndxs.append(np.repeat(rule_ndx, np.count_nonzero(found)))
+            near_ids.append(candidate_near_ids[found])
+
+        link_ndxs = np.concatenate(link_ndxs)
+        near_ids = np.concatenate(near_ids)
+        order = np.lexsort((np.concatenate(rule_ndxs), link_ndxs))
+        link_ndxs = link_ndxs[order]
+        near_ids = near_ids[order]
 
-        for ndx in xrange(self.links.shape[0]):
+        # dictionary storing intersection links
+        neighbours = dict((curr_id, []) for curr_id in ids)
+        for link_ndx, near_id in zip(link_ndxs, near_ids):
+            neighbours[ids[link_ndx]].append(near_id)
 
-            if len(self.neighbours[ndx + 1]) == 2 and \
-                            self.links[ndx]['conn_from'] == 0:
-                try:
-                    self.patch_path(ndx + 1)
-                except:
-                    continue
+        return neighbours
 
-    def define_networks(self):
+    def neighbour_edges(self):
         """
-        Creates list of connected intersections,
-        to output as line shapefile
-        
-        
+        Pairs of neighbour intersections, as link indices (intersection id - 1).
+
+        :return: tuple of two numpy arrays of ints
         """
 
-        pid = 0
-        networks = {}
+        curr_ids = list(self.neighbours.keys())
+        near_ids = [self.neighbours[curr_id] for curr_id in curr_ids]
 
-        # open, simple networks
-        for ndx in xrange(self.links.shape[0]):
+        sources = np.repeat(np.array(curr_ids, dtype=np.int64), [len(ids) for ids in near_ids])
+        targets = np.fromiter(chain.from_iterable(near_ids), dtype=np.int64, count=sources.size)
 
-            if len(self.neighbours[ndx + 1]) != 1: continue
+        return sources - 1, targets - 1
 
-            network_list = []
+    def define_networks(self):
+        """
+        Creates the paths of connected intersections, from the intersection neighbours,
+        to output as line shapefile.
+        Paths run between end or branching intersections, or are closed,
+        and are numbered by connected network.
 
-            to_ndx = ndx + 1
+        :return: dictionary of path id: (network id, list of intersection ids)
+        """
 
-            while to_ndx != 0:
-                network_list.append(to_ndx)
+        num_links = self.links.shape[0]
+        sources, targets = self.neighbour_edges()
 
-                to_ndx = self.links[to_ndx - 1]['conn_to']
+        network_ndxs = connected_components(num_links, sources, targets).tolist()
+        paths = [(path + 1).tolist() for path in graph_paths(num_links, sources, targets)]
 
-            if len(network_list) > 1:
-                pid += 1
+        # paths ordered by network, then by discovery
+        paths.sort(key=lambda path: network_ndxs[path[0] - 1])
 
-                networks[pid] = network_list
+        networks = {}
+        for pid, path in enumerate(paths):
+            networks[pid + 1] = (network_ndxs[path[0] - 1] + 1, path)
 
-        # closed, simple networks
-        for ndx in xrange(self.links.shape[0]):
+        return networks
 
-            if len(self.neighbours[ndx + 1]) != 2 or \
-                            self.links[ndx]['start'] == False:
-                continue
+    def link_coords(self):
+        """
+        Coordinates of the intersections, in link order.
 
-            start_id = ndx + 1
+        :return: numpy array of floats, shape: N x 2
+        """
 
-            network_list = []
+        if self.link_xy is not None:
+            return self.link_xy
 
-            to_ndx = ndx + 1
+        rows = self.links['i'].astype(np.int64)
+        cols = self.links['j'].astype(np.int64)
+        is_x = self.links['pi_dir'] == 'x'
 
-            while to_ndx != 0:
+        xs = np.where(is_x, self.xcoords_x[rows, cols], self.ycoords_x[rows, cols])
+        ys = np.where(is_x, self.xcoords_y[rows, cols], self.ycoords_y[rows, cols])
 
-                network_list.append(to_ndx)
+        return np.column_stack((xs, ys))
 
-                to_ndx = self.links[to_ndx - 1]['conn_to']
+    def networks_polylines(self, networks=None):
+        """
+        Polylines of the network paths.
 
-                if to_ndx == start_id:
-                    network_list.append(to_ndx)
-                    break
+        :param networks: paths, as returned by define_networks
+        :return: list of (path id, network id, numpy array of floats with shape N x 2)
+        """
 
-            if len(network_list) > 1:
-                pid += 1
+        if networks is None:
+            networks = self.define_networks()
 
-                networks[pid] = network_list
+        coords = self.link_coords()
 
-        return networks
+        return [(pid, network_id, coords[np.array(ids, dtype=np.int64) - 1])
+                for pid, (network_id, ids) in sorted(networks.items())]
@@ -0,0 +1,126 @@
+from __future__ import division
+
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class StagedPipeline(object):
+    """
+    Sequence of named processing stages, each one memoizing its last output,
+    keyed by the fingerprint of its inputs: the stage parameters and the fingerprint
+    of the upstream stage inputs.
+    When a parameter changes, just the stages from the one using it onwards are recomputed.
+    Cache hits and misses are reported in the debug log.
+    """
+
+    def __init__(self, name, stage_names):
+        """
+        :param name: pipeline name, for the log messages - string
+        :param stage_names: names of the stages, in their running order - list of strings
+        """
+
+        self.name = name
+        self.stage_names = tuple(stage_names)
+
+        self.hits = 0
+        self.misses = 0
+
+        self._outputs = {}  # stage name -> (fingerprint, output)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start a new run through the stages.
+
+        :return: PipelineRun
+        """
+
+        return PipelineRun(self)
+
+    def invalidate(self, stage_name=None):
+        """
+        Remove the outputs of a stage and of the downstream ones,
+        or of all the stages when stage_name is None.
+
+        :param stage_name: string or None
+        """
+
+        first_ndx = 0 if stage_name is None else self.stage_names.index(stage_name)
+
+        with self._lock:
+            for name in self.stage_names[first_ndx:]:
+                self._outputs.pop(name, None)
+
+    def run_stage(self, stage_name, fingerprint, compute):
+        """
+        Return the stored output of the stage when computed with the same fingerprint,
+        otherwise compute and store it.
+        A None fingerprint means that the stage inputs cannot be tracked: the output is not stored.
+
+        :param stage_name: string
+        :param fingerprint: comparable, or None
+        :param compute: function returning the stage output
+        :return: the stage output
+        """
+
+        if fingerprint is not None:
+            with self._lock:
+                cached = self._outputs.get(stage_name)
+                if cached is not None and cached[0] == fingerprint:
+                    self.hits += 1
+                    logger.debug("%s pipeline, %s stage: cache hit", self.name, stage_name)
+                    return cached[1]
+                self.misses += 1
+
+            logger.debug("%s pipeline, %s stage: cache miss", self.name, stage_name)
+        else:
+            logger.debug("%s pipeline, %s stage: inputs not tracked, not cached", self.name, stage_name)
+
+        output = compute()
+
+        with self._lock:
+            if fingerprint is None:
+                self._outputs.pop(stage_name, None)
+            else:
+                self._outputs[stage_name] = (fingerprint, output)
+
+        return output
+
+
+class PipelineRun(object):
+    """
+    One run through the stages of a pipeline, in their order,
+    chaining the parameters of each stage to those of the upstream stages.
+    """
+
+    def __init__(self, pipeline):
+
+        self.pipeline = pipeline
+
+        self._next_stage_ndx = 0
+        self._fingerprint = ()
+
+    def stage(self, stage_name, params, compute):
+        """
+        Run the next stage of the pipeline.
+
+        :param stage_name: name of the next stage - string
+        :param params: stage parameters - comparable (e.g., a tuple),
+                       or None when they cannot be tracked, so that this stage and the downstream ones
+                       are always recomputed
+        :param compute: function returning the stage output, from the outputs of the upstream stages
+        :return: the stage output
+        """
+
+        assert stage_name == self.pipeline.stage_names[self._next_stage_ndx]
+        self._next_stage_ndx += 1
+
+        if self._fingerprint is None or params is None:
+            self._fingerprint = None
+        else:
+            self._fingerprint = (self._fingerprint, params)
+
+        return self.pipeline.run_stage(stage_name, self._fingerprint, compute)
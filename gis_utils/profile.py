@@ -3,14 +3,25 @@ from __future__ import division
 
 import copy
 import xml.dom.minidom
+from multiprocessing.pool import ThreadPool
 
-from .features import Line, xytuple_l2_to_MultiLine
+from .features import Line, xytuple_l2_to_MultiLine, step_lengths_2d, step_lengths_3d, cumulative_lengths, \
+    directional_slopes
 
 from .qgs_tools import *
 
-from .geodetic import TrackPointGPX
+from .gdal_utils import open_gdal_raster, read_gdal_band_window, gdal_overview_sizes, build_gdal_overviews
+
+from .sampling import sample_spacing, choose_overview, missing_overview_factors, grid_crossings, \
+    NODATA_PROPAGATE
+
+from .segment_intersections import multilines_segments, line_segments_intersections
 
-from .errors import GPXIOException
+from .spatial_index import polyline_distances, segments_point_distances
+
+from .errors import GPXIOException, RasterIOException
+
+from .geodetic import TrackPointGPX
 
 
 class GeoProfilesSet(object):
@@ -198,6 +209,7 @@ class ProfileElevations(object):
         self.profile_s3ds = []
         self.profile_zs = []
         self.profile_dirslopes = []
+        self.profile_masked_counts = []  # number of samples involving DEM no-data cells
 
         self.inverted = None
 
@@ -232,7 +244,8 @@ class DEMParams(object):
 
 class PlaneAttitude(object):
 
-    def __init__(self, rec_id, source_point_3d, source_geol_plane, point_3d, slope_rad, dwnwrd_sense, sign_hor_dist):
+    def __init__(self, rec_id, source_point_3d, source_geol_plane, point_3d, slope_rad, dwnwrd_sense, sign_hor_dist,
+                 section_dist=None):
 
         self.id = rec_id
         self.src_pt_3d = source_point_3d
@@ -241,28 +254,161 @@ class PlaneAttitude(object):
         self.slope_rad = slope_rad
         self.dwnwrd_sense = dwnwrd_sense
         self.sign_hor_dist = sign_hor_dist
+        self.section_dist = section_dist  # horizontal distance of the source point from the section trace
 
 
-def topoline_from_dem(resampled_trace2d, bOnTheFlyProjection, project_crs, dem, dem_params):
+def dem_overview_for_spacing(dem, dem_params, spacing, build_missing=False):
+    """
+    Return the index and the parameters of the coarsest DEM overview
+    whose cells are not larger than the sample spacing,
+    or (None, dem_params) when the full resolution DEM is required.
+    Overviews are read via GDAL, so other sources are sampled at full resolution.
+
+    :param dem: qgis._core.QgsRasterLayer
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :param spacing: distance between samples, in the DEM CRS - float
+    :param build_missing: build the missing power-of-two overviews before choosing - bool
+    :return: tuple of overview index (int or None) and QGisRasterParameters
+    """
+
+    try:
+        overview_sizes = gdal_overview_sizes(dem.source())
+        if build_missing:
+            factors = missing_overview_factors(dem_params, overview_sizes, spacing)
+            if factors:
+                build_gdal_overviews(dem.source(), factors)
+                invalidate_raster_cache(dem)
+                overview_sizes = gdal_overview_sizes(dem.source())
+    except RasterIOException:
+        return None, dem_params
+
+    overview = choose_overview(dem_params, overview_sizes, spacing)
+    if overview is None:
+        return None, dem_params
+
+    return overview, dem_params.resampled(*overview_sizes[overview])
+
+
+def trace_in_dem_crs(resampled_trace2d, bOnTheFlyProjection, project_crs, dem):
 
     if bOnTheFlyProjection and dem.crs() != project_crs:
-        trace2d_in_dem_crs = resampled_trace2d.crs_project(project_crs, dem.crs())
+        return resampled_trace2d.crs_project(project_crs, dem.crs())
     else:
-        trace2d_in_dem_crs = resampled_trace2d
+        return resampled_trace2d
+
+
+def topoline_from_dem(resampled_trace2d, bOnTheFlyProjection, project_crs, dem, dem_params, read_extent=None,
+                      use_overviews=False, build_overviews=False, nodata_policy=NODATA_PROPAGATE):
+    """
+    Sample the DEM elevations along the trace.
+
+    :return: tuple of the 3D line, in the project CRS,
+             and of the number of samples involving DEM no-data cells
+    """
+
+    trace2d_in_dem_crs = trace_in_dem_crs(resampled_trace2d, bOnTheFlyProjection, project_crs, dem)
+
+    # sample a coarser overview when the trace sampling is sparser than the DEM cells
+
+    overview, sampling_params = None, dem_params
+    if use_overviews:
+        spacing = sample_spacing(trace2d_in_dem_crs.x_list, trace2d_in_dem_crs.y_list)
+        overview, sampling_params = dem_overview_for_spacing(dem, dem_params, spacing, build_overviews)
+
+    interpolated_zs, masked_count = interpolate_z_array_masked(dem,
+                                                               sampling_params,
+                                                               trace2d_in_dem_crs.x_list,
+                                                               trace2d_in_dem_crs.y_list,
+                                                               read_extent=read_extent,
+                                                               overview=overview,
+                                                               nodata_policy=nodata_policy)
+
+    topoline = Line.from_arrays(resampled_trace2d.x_array(),
+                                resampled_trace2d.y_array(),
+                                interpolated_zs)
+
+    return topoline, masked_count
+
+
+def topoline_from_dem_gdal(resampled_trace2d, bOnTheFlyProjection, project_crs, dem, dem_params,
+                           use_overviews=False, build_overviews=False, nodata_policy=NODATA_PROPAGATE):
+    """
+    Thread-safe version of topoline_from_dem, reading the DEM cells
+    through a GDAL dataset private to the calling thread.
+    Raises RasterIOException when GDAL cannot open the DEM source.
+    """
+
+    dataset = open_gdal_raster(dem.source())
+
+    try:
+        return topoline_from_dem(resampled_trace2d,
+                                 bOnTheFlyProjection,
+                                 project_crs,
+                                 dem,
+                                 dem_params,
+                                 read_extent=lambda row_min, row_max, col_min, col_max, overview:
+                                     read_gdal_band_window(dataset, row_min, row_max, col_min, col_max,
+                                                           overview=overview),
+                                 use_overviews=use_overviews,
+                                 build_overviews=build_overviews,
+                                 nodata_policy=nodata_policy)
+    finally:
+        dataset = None  # closes the GDAL dataset
+
+
+def cell_crossings_line(line, bOnTheFlyProjection, project_crs, dems, dems_params):
+    """
+    Resample a line with a point at each crossing of the cell edges of the DEMs,
+    plus the original vertices.
+    Crossings are located on the line segments in the DEM CRSs
+    and transferred to the line CRS by their parameter along the segment.
+
+    :param line: qProf.gis_utils.features.Line, in the project CRS
+    :param bOnTheFlyProjection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param dems: list of qgis._core.QgsRasterLayer
+    :param dems_params: list of qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :return: qProf.gis_utils.features.Line
+    """
 
-    ln3dtProfile = Line()
-    for trace_pt2d_dem_crs, trace_pt2d_project_crs in zip(trace2d_in_dem_crs.pts, resampled_trace2d.pts):
-        fInterpolatedZVal = interpolate_z(dem, dem_params, trace_pt2d_dem_crs)
-        pt3dtPoint = Point(trace_pt2d_project_crs.x,
-                           trace_pt2d_project_crs.y,
-                           fInterpolatedZVal)
-        ln3dtProfile.add_pt(pt3dtPoint)
+    assert line.num_pts > 1
 
-    return ln3dtProfile
+    xyzt = line.xyzt
+    num_segments = line.num_pts - 1
+
+    # segment starts, as crossings with null parameter
+
+    segments_list = [np.arange(num_segments)]
+    params_list = [np.zeros(num_segments)]
+
+    for dem, dem_params in zip(dems, dems_params):
+
+        if bOnTheFlyProjection and dem.crs() != project_crs:
+            xy_dem_crs = project_xy_array(xyzt[:, :2], project_crs, dem.crs())
+        else:
+            xy_dem_crs = xyzt[:, :2]
+
+        segments, params = grid_crossings(xy_dem_crs[:, 0], xy_dem_crs[:, 1], dem_params)
+        segments_list.append(segments)
+        params_list.append(params)
+
+    segments = np.concatenate(segments_list)
+    params = np.concatenate(params_list)
+
+    order = np.lexsort((params, segments))
+    segments, params = segments[order], params[order]
+
+    resampled = np.empty((segments.size + 1, 4), dtype=np.float64)
+    resampled[:-1, :3] = xyzt[segments, :3] + (xyzt[segments + 1, :3] - xyzt[segments, :3]) * params[:, np.newaxis]
+    resampled[:-1, 3] = xyzt[segments, 3]
+    resampled[-1] = xyzt[-1]
+
+    return Line.from_array(resampled).remove_coincident_points()
 
 
 def topoprofiles_from_dems(canvas, source_profile_line, sample_distance, selected_dems, selected_dem_parameters,
-                           invert_profile):
+                           invert_profile, parallel=False, use_overviews=False, build_overviews=False,
+                           cell_crossings=False, nodata_policy=NODATA_PROPAGATE):
     # get project CRS information
     on_the_fly_projection, project_crs = get_on_the_fly_projection(canvas)
 
@@ -271,30 +417,88 @@ def topoprofiles_from_dems(canvas, source_profile_line, sample_distance, selecte
     else:
         line = source_profile_line
 
-    resampled_line = line.densify_2d_line(sample_distance)  # line resampled by sample distance
+    if cell_crossings:  # line resampled at the DEM cell edges
+        resampled_line = cell_crossings_line(line, on_the_fly_projection, project_crs,
+                                             selected_dems, selected_dem_parameters)
+    else:  # line resampled by sample distance
+        resampled_line = line.densify_2d_line(sample_distance)
 
     # calculate 3D profiles from DEMs
 
-    dem_topolines3d = []
-    for dem, dem_params in zip(selected_dems, selected_dem_parameters):
-        dem_topoline3d = topoline_from_dem(resampled_line,
-                                           on_the_fly_projection,
-                                           project_crs,
-                                           dem,
-                                           dem_params)
-        dem_topolines3d.append(dem_topoline3d)
+    def provider_topoline(dem, dem_params):
+
+        return topoline_from_dem(resampled_line,
+                                 on_the_fly_projection,
+                                 project_crs,
+                                 dem,
+                                 dem_params,
+                                 use_overviews=use_overviews,
+                                 build_overviews=build_overviews,
+                                 nodata_policy=nodata_policy)
+
+    if parallel and len(selected_dems) > 1:
+
+        # missing overviews are built once, on this thread, since the worker threads read the DEM files
+
+        if use_overviews and build_overviews:
+            for dem, dem_params in zip(selected_dems, selected_dem_parameters):
+                dem_trace = trace_in_dem_crs(resampled_line, on_the_fly_projection, project_crs, dem)
+                dem_overview_for_spacing(dem,
+                                         dem_params,
+                                         sample_spacing(dem_trace.x_list, dem_trace.y_list),
+                                         build_missing=True)
+
+        # one worker thread per DEM; map returns the results in the DEM order
+
+        def dem_topoline(dem_and_params):
+
+            dem, dem_params = dem_and_params
+            try:
+                return topoline_from_dem_gdal(resampled_line,
+                                              on_the_fly_projection,
+                                              project_crs,
+                                              dem,
+                                              dem_params,
+                                              use_overviews,
+                                              False,
+                                              nodata_policy)
+            except RasterIOException:  # source not readable by GDAL (e.g., web services)
+                return None
+
+        pool = ThreadPool(len(selected_dems))
+        try:
+            dem_results = pool.map(dem_topoline, zip(selected_dems, selected_dem_parameters))
+        finally:
+            pool.close()
+            pool.join()
+
+        # DEMs not readable by GDAL are sampled through their providers, on this thread
 
-    # setup topoprofiles properties
+        dem_results = [provider_topoline(dem, dem_params) if dem_result is None else dem_result
+                       for dem_result, dem, dem_params in zip(dem_results, selected_dems, selected_dem_parameters)]
+
+    else:
+
+        dem_results = [provider_topoline(dem, dem_params) for dem, dem_params in
+                       zip(selected_dems, selected_dem_parameters)]
+
+    # setup topoprofiles properties, from the coordinate arrays
+    # shared by the DEM profiles and their z arrays
 
     topo_profiles = ProfileElevations()
 
-    topo_profiles.planar_xs = np.asarray(resampled_line.x_list)
-    topo_profiles.planar_ys = np.asarray(resampled_line.y_list)
-    topo_profiles.surface_names = map(lambda dem: dem.name(), selected_dems)
-    topo_profiles.profile_s = np.asarray(resampled_line.incremental_length_2d())
-    topo_profiles.profile_s3ds = map(lambda cl3dt: np.asarray(cl3dt.incremental_length_3d()), dem_topolines3d)
-    topo_profiles.profile_zs = map(lambda cl3dt: cl3dt.z_array(), dem_topolines3d)
-    topo_profiles.profile_dirslopes = map(lambda cl3dt: np.asarray(cl3dt.slopes()), dem_topolines3d)
+    topo_profiles.planar_xs = resampled_line.x_array()
+    topo_profiles.planar_ys = resampled_line.y_array()
+
+    steps_2d = step_lengths_2d(topo_profiles.planar_xs, topo_profiles.planar_ys)
+
+    topo_profiles.surface_names = [dem.name() for dem in selected_dems]
+    topo_profiles.profile_s = cumulative_lengths(steps_2d)
+    topo_profiles.profile_zs = [topoline3d.z_array() for topoline3d, _ in dem_results]
+    topo_profiles.profile_s3ds = [cumulative_lengths(step_lengths_3d(steps_2d, zs))
+                                  for zs in topo_profiles.profile_zs]
+    topo_profiles.profile_dirslopes = [directional_slopes(steps_2d, zs) for zs in topo_profiles.profile_zs]
+    topo_profiles.profile_masked_counts = [masked_count for _, masked_count in dem_results]
     topo_profiles.dem_params = [DEMParams(dem, params) for (dem, params) in
                                 zip(selected_dems, selected_dem_parameters)]
 
@@ -411,91 +615,98 @@ def intersect_with_dem(demLayer, demParams, on_the_fly_projection, project_crs,
     """
 
     # project to Dem CRS
+    xy_array = np.array([(pt.x, pt.y) for pt in lIntersPts], dtype=np.float64).reshape(-1, 2)
     if on_the_fly_projection and demParams.crs != project_crs:
-        lQgsPoints = [QgsPoint(pt.x, pt.y) for pt in lIntersPts]
-        lDemCrsIntersQgsPoints = [project_qgs_point(qgsPt, project_crs, demParams.crs) for qgsPt in
-                                               lQgsPoints]
-        lDemCrsIntersPts = [Point(qgispt.x(), qgispt.y()) for qgispt in lDemCrsIntersQgsPoints]
-    else:
-        lDemCrsIntersPts = lIntersPts
+        xy_array = project_xy_array(xy_array, project_crs, demParams.crs)
 
     # interpolate z values from Dem
-    lZVals = [interpolate_z(demLayer, demParams, pt) for pt in lDemCrsIntersPts]
+    lZVals = interpolate_z_array(demLayer, demParams, xy_array[:, 0], xy_array[:, 1])
 
     lXYZVals = [(pt2d.x, pt2d.y, z) for pt2d, z in zip(lIntersPts, lZVals)]
 
     return [Point(x, y, z) for x, y, z in lXYZVals]
 
 
-def calculate_profile_lines_intersection(multilines2d_list, id_list, profile_line2d):
+def profile_lines_intersections(multilines2d_list, id_list, profile_line2d):
+    """
+    Intersect a profile line, made up by one or more segments, with a set of multilines,
+    solving the intersections of all the segments at once.
+
+    :param multilines2d_list: list of qProf.gis_utils.features.MultiLine
+    :param id_list: multiline ids, or None
+    :param profile_line2d: qProf.gis_utils.features.Line
+    :return: tuple of distances from the profile start along the profile (numpy array of floats),
+             multiline ids (list), x and y coordinates (numpy arrays of floats), ordered by distance
+    """
 
-    profile_segment2d_list = profile_line2d.as_segments()
+    seg_starts, seg_ends, multiline_ndxs, seg_is_last = multilines_segments(multilines2d_list)
 
-    profile_segment2d = profile_segment2d_list[0]
+    profile_xy = np.column_stack((profile_line2d.x_array(), profile_line2d.y_array()))
 
-    intersection_list = []
-    for ndx, multiline2d in enumerate(multilines2d_list):
-        if id_list is None:
-            multiline_id = ''
-        else:
-            multiline_id = id_list[ndx]
-        for line2d in multiline2d.lines:
-            for line_segment2d in line2d.as_segments():
-                try:
-                    intersection_point2d = profile_segment2d.intersection_2d_pt(line_segment2d)
-                except ZeroDivisionError:
-                    continue
-                if intersection_point2d is None:
-                    continue
-                if line_segment2d.contains_2d_pt(intersection_point2d) and \
-                   profile_segment2d.contains_2d_pt(intersection_point2d):
-                    intersection_list.append([intersection_point2d, multiline_id])
+    distances, seg_ndxs, xs, ys = line_segments_intersections(profile_xy, seg_starts, seg_ends, seg_is_last)
 
-    return intersection_list
+    if id_list is None:
+        ids = [''] * seg_ndxs.size
+    else:
+        ids = [id_list[multiline_ndx] for multiline_ndx in multiline_ndxs[seg_ndxs]]
 
+    return distances, ids, xs, ys
 
-def intersection_distances_by_profile_start_list(profile_line, intersections):
 
-    # convert the profile line
-    # from a CartesianLine2DT to a CartesianSegment2DT
-    profile_segment2d_list = profile_line.as_segments()
-    # debug
-    assert len(profile_segment2d_list) == 1
-    profile_segment2d = profile_segment2d_list[0]
+def distances_along_profile(profile_line2d, xs, ys):
+    """
+    Distances from the profile start, measured along the profile, of points lying on it,
+    each one located on the nearest profile segment.
 
-    # determine distances for each point in intersection list
-    # creating a list of float values
-    distance_from_profile_start_list = []
-    for intersection in intersections:
-        distance_from_profile_start_list.append(profile_segment2d.start_pt.dist_2d(intersection[0]))
+    :param profile_line2d: qProf.gis_utils.features.Line
+    :param xs: numpy array of floats
+    :param ys: numpy array of floats
+    :return: numpy array of floats
+    """
+
+    profile_xy = np.column_stack((profile_line2d.x_array(), profile_line2d.y_array()))
+    seg_starts = profile_xy[:-1]
+    seg_deltas = profile_xy[1:] - seg_starts
+
+    seg_lengths = np.hypot(seg_deltas[:, 0], seg_deltas[:, 1])
+    start_distances = np.concatenate(([0.0], np.cumsum(seg_lengths)[:-1]))
+
+    distances = np.zeros(np.shape(xs))
+    nearest = np.empty(np.shape(xs))
+    nearest.fill(np.inf)
+
+    for (x0, y0), (dx, dy), length, start_distance in zip(seg_starts, seg_deltas, seg_lengths, start_distances):
 
-    return distance_from_profile_start_list
+        if length == 0.0:
+            continue
+
+        params = np.clip(((xs - x0) * dx + (ys - y0) * dy) / (length * length), 0.0, 1.0)
+        seg_distances = np.hypot(xs - (x0 + params * dx), ys - (y0 + params * dy))
+
+        closer = seg_distances < nearest
+        nearest[closer] = seg_distances[closer]
+        distances[closer] = start_distance + params[closer] * length
+
+    return distances
 
 
 def calculate_pts_in_projection(pts_in_orig_crs, srcCrs, destCrs):
 
-    pts_in_prj_crs = []
-    for pt in pts_in_orig_crs:
-        qgs_pt = QgsPoint(pt.x, pt.y)
-        qgs_pt_prj_crs = project_qgs_point(qgs_pt, srcCrs, destCrs)
-        pts_in_prj_crs.append(Point(qgs_pt_prj_crs.x(), qgs_pt_prj_crs.y()))
-    return pts_in_prj_crs
+    xy_array = project_xy_array([(pt.x, pt.y) for pt in pts_in_orig_crs], srcCrs, destCrs)
+
+    return [Point(x, y) for x, y in xy_array]
 
 
 def profile_polygon_intersection(profile_qgsgeometry, polygon_layer, inters_polygon_classifaction_field_ndx):
 
     intersection_polyline_polygon_crs_list = []
 
-    if polygon_layer.selectedFeatureCount() > 0:
-        features = polygon_layer.selectedFeatures()
-    else:
-        features = polygon_layer.getFeatures()
+    # (selected) features whose envelope is crossed by the profile, with their geometry and attributes
 
-    for polygon_feature in features:
-        # retrieve every (selected) feature with its geometry and attributes
+    polygon_index = polygon_layer_index(polygon_layer)
+    profile_xy = [(qgspoint.x(), qgspoint.y()) for qgspoint in profile_qgsgeometry.asPolyline()]
 
-        # fetch geometry
-        poly_geom = polygon_feature.geometry()
+    for poly_geom, attrs in polygon_index.corridor_records(profile_xy, 0.0):
 
         intersection_qgsgeometry = poly_geom.intersection(profile_qgsgeometry)
 
@@ -510,7 +721,6 @@ def profile_polygon_intersection(profile_qgsgeometry, polygon_layer, inters_poly
                 return False, "Missing function for checking empty geometries.\nPlease upgrade QGIS"
 
         if inters_polygon_classifaction_field_ndx >= 0:
-            attrs = polygon_feature.attributes()
             polygon_classification = attrs[inters_polygon_classifaction_field_ndx]
         else:
             polygon_classification = None
@@ -526,9 +736,40 @@ def profile_polygon_intersection(profile_qgsgeometry, polygon_layer, inters_poly
     return True, intersection_polyline_polygon_crs_list
 
 
-def extract_multiline2d_list(structural_line_layer, on_the_fly_projection, project_crs):
+def profile_path_in_crs(profile_line, sample_distance, on_the_fly_projection, project_crs, dest_crs):
+    """
+    Return the vertices of a profile line in another CRS, for corridor queries
+    on the spatial index of a layer, with the distance tolerance
+    accounting for the profile segments becoming curved in the other CRS.
+
+    :param profile_line: qProf.gis_utils.features.Line, in the project CRS
+    :param sample_distance: densify distance, in the project CRS units - float
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param dest_crs: qgis._core.QgsCoordinateReferenceSystem
+    :return: tuple of numpy array of floats (shape: N x 2) and float
+    """
+
+    if not on_the_fly_projection or dest_crs == project_crs:
+        return np.column_stack((profile_line.x_array(), profile_line.y_array())), 0.0
+
+    densified_line = profile_line.densify_2d_line(sample_distance).crs_project(project_crs, dest_crs)
+
+    return np.column_stack((densified_line.x_array(), densified_line.y_array())), \
+        float(np.max(densified_line.step_lengths_2d()))
+
+
+def extract_multiline2d_list(structural_line_layer, on_the_fly_projection, project_crs, line_orig_crs_geoms_attrs=None):
+    """
+    Read the (selected) features of a line layer as multilines in the project CRS.
+
+    :param line_orig_crs_geoms_attrs: line_geoms_attrs records to convert,
+                                      by default all the records of the layer spatial index
+    :return: list of qProf.gis_utils.features.MultiLine
+    """
 
-    line_orig_crs_geoms_attrs = line_geoms_attrs(structural_line_layer)
+    if line_orig_crs_geoms_attrs is None:
+        line_orig_crs_geoms_attrs = line_layer_index(structural_line_layer).records
 
     line_orig_geom_list3 = [geom_data[0] for geom_data in line_orig_crs_geoms_attrs]
     line_orig_crs_MultiLine2D_list = [xytuple_l2_to_MultiLine(xy_list2) for xy_list2 in line_orig_geom_list3]
@@ -548,6 +789,96 @@ def extract_multiline2d_list(structural_line_layer, on_the_fly_projection, proje
     return line_proj_crs_MultiLine2D_list
 
 
+def section_corridor_indices(pt_index, pt_layer_crs, on_the_fly_projection, project_crs, section_lines,
+                             max_distance):
+    """
+    Indices of the point records within a distance from any of the section traces,
+    in the layer reading order, to be evaluated before any DEM sampling.
+    The layer spatial index prefilters the records when they are in the project CRS,
+    otherwise all the records are projected at once.
+
+    :param pt_index: point layer index, with pt_geoms_attrs records - qProf.gis_utils.spatial_index.LayerIndex
+    :param pt_layer_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param on_the_fly_projection: bool
+    :param project_crs: qgis._core.QgsCoordinateReferenceSystem
+    :param section_lines: section traces, in the project CRS - list of qProf.gis_utils.features.Line
+    :param max_distance: corridor half-width, in the project CRS units - float
+    :return: list of ints
+    """
+
+    sections_xy = [np.column_stack((section_line.x_array(), section_line.y_array())) for section_line in
+                   section_lines]
+
+    reprojected = on_the_fly_projection and pt_layer_crs != project_crs
+
+    if reprojected:
+        candidate_ndxs = list(range(len(pt_index.records)))
+    else:
+        candidate_ndxs = sorted(set(ndx for section_xy in sections_xy
+                                    for ndx in pt_index.corridor_indices(section_xy, max_distance)))
+
+    if not candidate_ndxs:
+        return []
+
+    candidates_xy = np.array([(float(pt_index.records[ndx][0]), float(pt_index.records[ndx][1]))
+                              for ndx in candidate_ndxs])
+    if reprojected:
+        candidates_xy = project_xy_array(candidates_xy, pt_layer_crs, project_crs)
+
+    within = np.zeros(len(candidate_ndxs), dtype=bool)
+    for section_xy in sections_xy:
+        within |= polyline_distances(candidates_xy[:, 0], candidates_xy[:, 1], section_xy) <= max_distance
+
+    return [ndx for ndx, is_within in zip(candidate_ndxs, within.tolist()) if is_within]
+
+
+def multilines_section_distances(multilines, section_line):
+    """
+    Minimum distance of each line from the section trace, as the minimum distance
+    between their segments: zero for lines crossing the trace, otherwise
+    the minimum among the line vertices distances from the trace
+    and the trace vertices distances from the line.
+    All the vertices are processed at once.
+
+    :param multilines: lines, in the project CRS - list of qProf.gis_utils.features.MultiLine
+    :param section_line: section trace, in the project CRS - qProf.gis_utils.features.Line
+    :return: numpy array of floats, infinite for lines without vertices
+    """
+
+    distances = np.empty(len(multilines))
+    distances.fill(np.inf)
+
+    vertices_nums = np.array([multiline.xyzt.shape[0] for multiline in multilines], dtype=np.int64)
+    with_vertices = vertices_nums > 0
+    if not np.any(with_vertices):
+        return distances
+
+    section_xy = np.column_stack((section_line.x_array(), section_line.y_array()))
+
+    xy = np.vstack([multiline.xyzt[:, :2] for multiline in multilines])
+    vertex_distances = polyline_distances(xy[:, 0], xy[:, 1], section_xy)
+
+    offsets = np.concatenate(([0], np.cumsum(vertices_nums)[:-1]))
+    distances[with_vertices] = np.minimum.reduceat(vertex_distances, offsets[with_vertices])
+
+    seg_starts, seg_ends, multiline_ndxs, _ = multilines_segments(multilines)
+    if seg_starts.shape[0] == 0:
+        return distances
+
+    # trace vertices closer to a line segment than to the line vertices
+
+    for x, y in section_xy:
+        np.minimum.at(distances, multiline_ndxs, segments_point_distances(seg_starts, seg_ends, x, y))
+
+    # lines crossing the trace between their vertices
+
+    if section_xy.shape[0] > 1:
+        _, crossed_seg_ndxs, _, _ = line_segments_intersections(section_xy, seg_starts, seg_ends)
+        distances[multiline_ndxs[crossed_seg_ndxs]] = 0.0
+
+    return distances
+
+
 def define_plot_structural_segment(structural_attitude, profile_length, vertical_exaggeration, segment_scale_factor=70.0):
 
     ve = float(vertical_exaggeration)
@@ -584,12 +915,12 @@ def define_plot_structural_segment(structural_attitude, profile_length, vertical
     return structural_segment_s, structural_segment_z
 
 
-def calculate_projected_3d_pts(canvas, struct_pts, structural_pts_crs, demObj):
-
-    demCrs = demObj.params.crs
+def structural_pts_in_crs(struct_pts, structural_pts_crs, on_the_fly_projection, project_crs, demCrs):
+    """
+    Structural points in the project CRS and in the DEM CRS.
 
-    # check if on-the-fly-projection is set on
-    on_the_fly_projection, project_crs = get_on_the_fly_projection(canvas)
+    :return: tuple of two lists of qProf.gsf.geometry.Point
+    """
 
     # set points in the project crs
     if on_the_fly_projection and structural_pts_crs != project_crs:
@@ -604,9 +935,31 @@ def calculate_projected_3d_pts(canvas, struct_pts, structural_pts_crs, demObj):
     else:
         struct_pts_in_dem_crs = copy.deepcopy(struct_pts)
 
-        # - 3D structural points, with x, y, and z extracted from the current DEM
+    return struct_pts_in_prj_crs, struct_pts_in_dem_crs
+
+
+def structural_pts_3d(struct_pts_in_prj_crs, struct_pts_in_dem_crs, demObj):
+    """
+    3D structural points, in the project CRS, with z extracted from the DEM.
+
+    :return: list of qProf.gsf.geometry.Point
+    """
+
     struct_pts_z = get_zs_from_dem(struct_pts_in_dem_crs, demObj)
 
     assert len(struct_pts_in_prj_crs) == len(struct_pts_z)
 
-    return [Point(pt.x, pt.y, z) for (pt, z) in zip(struct_pts_in_prj_crs, struct_pts_z)]
\ No newline at end of file
+    return [Point(pt.x, pt.y, z) for (pt, z) in zip(struct_pts_in_prj_crs, struct_pts_z)]
+
+
+def calculate_projected_3d_pts(canvas, struct_pts, structural_pts_crs, demObj):
+
+    # check if on-the-fly-projection is set on
+    on_the_fly_projection, project_crs = get_on_the_fly_projection(canvas)
+
+    struct_pts_in_prj_crs, struct_pts_in_dem_crs = structural_pts_in_crs(struct_pts, structural_pts_crs,
+                                                                         on_the_fly_projection, project_crs,
+                                                                         demObj.params.crs)
+
+    # - 3D structural points, with x, y, and z extracted from the current DEM
+    return structural_pts_3d(struct_pts_in_prj_crs, struct_pts_in_dem_crs, demObj)
\ No newline at end of file
@@ -1,22 +1,36 @@
 from __future__ import division
 
+import threading
+
 from math import isnan, sin, cos, asin, radians, degrees, floor, ceil, sqrt
 
 import numpy as np
 
 from osgeo import ogr, osr
 
-from qgis.core import QgsMapLayerRegistry, QgsMapLayer, QGis, QgsCoordinateTransform, QgsPoint, QgsRaster
+from qgis.core import QgsMapLayerRegistry, QgsMapLayer, QGis, QgsCoordinateTransform, QgsPoint, QgsRaster, \
+    QgsRectangle, QgsGeometry
 from qgis.gui import *
 
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
-from .errors import VectorIOException
+from .errors import VectorIOException, RasterIOException
+from .sampling import AffineGeoTransform, BilinearSamples, BlockCells, NODATA_PROPAGATE
+from .gdal_utils import open_gdal_raster, read_gdal_band_window, gdal_raster_geotransform
+from .raster_cache import raster_block_cache, RASTER_BLOCK_SIZE
+from .dem_mirror import DEMMirror, dem_mirrors, source_signature
+from .spatial_index import LayerIndex, layer_indices
 from ..gsf.geometry import Point
 
 
 def get_on_the_fly_projection(canvas):
+    """
+    On-the-fly projection state and project CRS of the canvas.
+    The datum transforms chosen in the project are also passed to the shared coordinate transforms.
+    """
+
+    crs_transforms.set_datum_transforms(canvas_datum_transforms(canvas))
 
     on_the_fly_projection = True if canvas.hasCrsTransformEnabled() else False
 
@@ -147,6 +161,142 @@ def line_geoms_attrs(line_layer, field_list=None):
     return lines
 
 
+def vector_layer_state(layer):
+    """
+    Return the state of a file-based vector layer, changing when its source file
+    is modified or its feature selection changes.
+    None when the state cannot be tracked, i.e. for layers with unsaved edits
+    and for non-file sources.
+
+    :param layer: qgis._core.QgsVectorLayer
+    :return: tuple or None
+    """
+
+    if layer.isModified():
+        return None
+
+    signature = source_signature(layer.source().split('|')[0])
+    if signature is None:
+        return None
+
+    return (signature['path'],
+            signature['size'],
+            signature['mtime'],
+            layer.featureCount(),
+            tuple(sorted(layer.selectedFeaturesIds())))
+
+
+def raster_layer_state(layer):
+    """
+    Return the state of a file-based raster layer, changing when its source file is modified.
+    None when the state cannot be tracked, i.e. for non-file sources.
+
+    :param layer: qgis._core.QgsRasterLayer
+    :return: tuple or None
+    """
+
+    signature = source_signature(layer.source())
+    if signature is None:
+        return None
+
+    return signature['path'], signature['size'], signature['mtime']
+
+
+def crs_fingerprint(crs):
+    """
+    Return a comparable description of a CRS, None when missing.
+
+    :param crs: qgis._core.QgsCoordinateReferenceSystem or None
+    :return: string or None
+    """
+
+    if crs is None:
+        return None
+
+    return unicode(crs.toWkt())
+
+
+def xy_envelope(xy_list):
+    """
+    Return the (x_min, y_min, x_max, y_max) envelope of a list of (x, y) tuples.
+    """
+
+    xy = np.asarray(xy_list, dtype=np.float64).reshape(-1, 2)
+
+    return xy[:, 0].min(), xy[:, 1].min(), xy[:, 0].max(), xy[:, 1].max()
+
+
+def point_layer_index(pt_layer, field_list=None):
+    """
+    Return the spatial index of the (selected) features of a point layer,
+    with the pt_geoms_attrs records, reusing it while the layer is unchanged.
+
+    :param pt_layer: qgis._core.QgsVectorLayer
+    :param field_list: names of the attribute fields to read - list of strings
+    :return: qProf.gis_utils.spatial_index.LayerIndex
+    """
+
+    if field_list is None:
+        field_list = []
+
+    def build():
+        records = pt_geoms_attrs(pt_layer, field_list)
+        envelopes = [(rec[0], rec[1], rec[0], rec[1]) for rec in records]
+        return LayerIndex(records, envelopes)
+
+    return layer_indices.get((pt_layer.id(), 'point', tuple(field_list)), vector_layer_state(pt_layer), build)
+
+
+def line_layer_index(line_layer, field_list=None):
+    """
+    Return the spatial index of the (selected) features of a line layer,
+    with the line_geoms_attrs records, reusing it while the layer is unchanged.
+
+    :param line_layer: qgis._core.QgsVectorLayer
+    :param field_list: names of the attribute fields to read - list of strings
+    :return: qProf.gis_utils.spatial_index.LayerIndex
+    """
+
+    if field_list is None:
+        field_list = []
+
+    def build():
+        records = line_geoms_attrs(line_layer, field_list)
+        envelopes = [xy_envelope([xy for xy_list in rec_geom for xy in xy_list]) for rec_geom, _ in records]
+        return LayerIndex(records, envelopes)
+
+    return layer_indices.get((line_layer.id(), 'line', tuple(field_list)), vector_layer_state(line_layer), build)
+
+
+def polygon_layer_index(polygon_layer):
+    """
+    Return the spatial index of the (selected) features of a polygon layer,
+    with (geometry, attributes) records, reusing it while the layer is unchanged.
+
+    :param polygon_layer: qgis._core.QgsVectorLayer
+    :return: qProf.gis_utils.spatial_index.LayerIndex
+    """
+
+    def build():
+
+        if polygon_layer.selectedFeatureCount() > 0:
+            features = polygon_layer.selectedFeatures()
+        else:
+            features = polygon_layer.getFeatures()
+
+        records = []
+        envelopes = []
+        for feature in features:
+            geometry = QgsGeometry(feature.geometry())
+            bbox = geometry.boundingBox()
+            records.append((geometry, feature.attributes()))
+            envelopes.append((bbox.xMinimum(), bbox.yMinimum(), bbox.xMaximum(), bbox.yMaximum()))
+
+        return LayerIndex(records, envelopes)
+
+    return layer_indices.get((polygon_layer.id(), 'polygon', ()), vector_layer_state(polygon_layer), build)
+
+
 def line_geoms_with_id(line_layer, curr_field_ndx):
 
     lines = []
@@ -257,9 +407,155 @@ def qgs_pt(x, y):
     return QgsPoint(x, y)
 
 
+def canvas_datum_transforms(canvas):
+    """
+    Datum transforms chosen in the QGIS project between the layer CRSs and the canvas CRS, in both directions.
+
+    :param canvas: qgis.gui.QgsMapCanvas
+    :return: dictionary of (source datum transform id, destination datum transform id) tuples,
+             keyed by (source CRS WKT, destination CRS WKT)
+    """
+
+    datum_transforms = {}
+
+    if not hasattr(canvas, 'mapSettings'):  # QGIS < 2.4
+        return datum_transforms
+
+    map_settings = canvas.mapSettings()
+    if not hasattr(map_settings, 'datumTransformStore'):
+        return datum_transforms
+
+    store = map_settings.datumTransformStore()
+    for layer in QgsMapLayerRegistry.instance().mapLayers().values():
+        if not store.hasEntryForLayer(layer):
+            continue
+        transform = store.transformation(layer)
+        if transform is None:
+            continue
+        src_datum, dest_datum = transform.sourceDatumTransform(), transform.destinationDatumTransform()
+        if src_datum == -1 and dest_datum == -1:
+            continue
+        src_wkt, dest_wkt = transform.sourceCrs().toWkt(), transform.destCRS().toWkt()
+        datum_transforms[(src_wkt, dest_wkt)] = (src_datum, dest_datum)
+        datum_transforms[(dest_wkt, src_wkt)] = (dest_datum, src_datum)
+
+    return datum_transforms
+
+
+class CrsTransformRegistry(object):
+    """
+    Coordinate transforms keyed by (source CRS, destination CRS), built once and then reused.
+    Transforms are not thread-safe, so each thread has its own set.
+    """
+
+    def __init__(self):
+
+        self._local = threading.local()
+        self._datum_transforms = {}
+
+    def _transforms(self):
+
+        try:
+            return self._local.transforms
+        except AttributeError:
+            self._local.transforms = {}
+            return self._local.transforms
+
+    def set_datum_transforms(self, datum_transforms):
+        """
+        Set the datum transforms chosen in the QGIS project, as returned by canvas_datum_transforms.
+
+        :param datum_transforms: dictionary of (source, destination) datum transform ids, keyed by CRS WKTs
+        """
+
+        self._datum_transforms = dict(datum_transforms)
+
+    def datum_transform(self, srcCrs, destCrs):
+        """
+        Return the datum transform ids chosen in the QGIS project between two CRSs, or None.
+
+        :param srcCrs: qgis._core.QgsCoordinateReferenceSystem
+        :param destCrs: qgis._core.QgsCoordinateReferenceSystem
+        :return: tuple of source and destination datum transform ids, or None
+        """
+
+        return self._datum_transforms.get((srcCrs.toWkt(), destCrs.toWkt()))
+
+    def qgs_transform(self, srcCrs, destCrs):
+        """
+        Return the QGIS transform between two CRSs, applying the datum transforms chosen in the QGIS project.
+
+        :param srcCrs: qgis._core.QgsCoordinateReferenceSystem
+        :param destCrs: qgis._core.QgsCoordinateReferenceSystem
+        :return: qgis._core.QgsCoordinateTransform
+        """
+
+        datum_transform = self.datum_transform(srcCrs, destCrs)
+
+        key = ('qgs', srcCrs.toWkt(), destCrs.toWkt(), datum_transform)
+        transforms = self._transforms()
+        if key not in transforms:
+            transform = QgsCoordinateTransform(srcCrs, destCrs)
+            if datum_transform is not None:
+                transform.setSourceDatumTransform(datum_transform[0])
+                transform.setDestinationDatumTransform(datum_transform[1])
+                transform.initialise()
+            transforms[key] = transform
+
+        return transforms[key]
+
+    def osr_transform(self, srcCrs, destCrs):
+        """
+        Return the OSR transform between two CRSs, built from their Proj.4 definitions as in QGIS,
+        or None when OSR cannot create it or a datum transform is chosen for them in the QGIS project,
+        since the Proj.4 definitions do not carry it.
+
+        :param srcCrs: qgis._core.QgsCoordinateReferenceSystem
+        :param destCrs: qgis._core.QgsCoordinateReferenceSystem
+        :return: osgeo.osr.CoordinateTransformation or None
+        """
+
+        def spatial_reference(crs):
+
+            srs = osr.SpatialReference()
+            if srs.ImportFromProj4(str(crs.toProj4())) != 0:
+                return None
+            if hasattr(srs, 'SetAxisMappingStrategy'):  # GDAL >= 3
+                srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            return srs
+
+        if self.datum_transform(srcCrs, destCrs) is not None:
+            return None
+
+        key = ('osr', srcCrs.toWkt(), destCrs.toWkt())
+        transforms = self._transforms()
+        if key not in transforms:
+            try:
+                src_srs, dest_srs = spatial_reference(srcCrs), spatial_reference(destCrs)
+                if src_srs is None or dest_srs is None:
+                    transforms[key] = None
+                else:
+                    transforms[key] = osr.CoordinateTransformation(src_srs, dest_srs)
+            except Exception:
+                transforms[key] = None
+
+        return transforms[key]
+
+    def clear(self):
+        """
+        Discard the transforms of the calling thread.
+        """
+
+        self._local.transforms = {}
+
+
+# transforms shared by the reprojection functions
+crs_transforms = CrsTransformRegistry()
+
+
 def project_qgs_point(qgsPt, srcCrs, destCrs):
 
-    return QgsCoordinateTransform(srcCrs, destCrs).transform(qgsPt)
+    return crs_transforms.qgs_transform(srcCrs, destCrs).transform(qgsPt)
 
 
 def project_point(pt, srcCrs, destCrs):
@@ -271,15 +567,44 @@ def project_point(pt, srcCrs, destCrs):
     return Point(proj_x, proj_y)
 
 
-def project_xy_list(src_crs_xy_list, srcCrs, destCrs):
+def project_xy_array(xy_array, srcCrs, destCrs):
+    """
+    Project a set of points with a single transform call.
+
+    :param xy_array: x and y coordinates - array-like of floats, shape: N x 2
+    :param srcCrs: qgis._core.QgsCoordinateReferenceSystem
+    :param destCrs: qgis._core.QgsCoordinateReferenceSystem
+    :return: numpy array of floats, shape: N x 2
+    """
+
+    xy_array = np.asarray(xy_array, dtype=np.float64).reshape(-1, 2)
+
+    if xy_array.shape[0] == 0:
+        return xy_array.copy()
+
+    osr_transform = crs_transforms.osr_transform(srcCrs, destCrs)
+    if osr_transform is not None:
+        try:
+            projected = np.asarray(osr_transform.TransformPoints(xy_array.tolist()), dtype=np.float64)
+            return projected[:, :2]
+        except Exception:
+            pass
 
-    pt_list_dest_crs = []
-    for x, y in src_crs_xy_list.pts:
-        srcPt = QgsPoint(x, y)
-        destPt = project_qgs_point(srcPt, srcCrs, destCrs)
-        pt_list_dest_crs = pt_list_dest_crs.append([destPt.x(), destPt.y()])
+    # fallback on the QGIS transform, point by point
 
-    return pt_list_dest_crs
+    qgs_transform = crs_transforms.qgs_transform(srcCrs, destCrs)
+
+    projected = np.empty_like(xy_array)
+    for ndx, (x, y) in enumerate(xy_array):
+        dest_pt = qgs_transform.transform(QgsPoint(x, y))
+        projected[ndx] = dest_pt.x(), dest_pt.y()
+
+    return projected
+
+
+def project_xy_list(src_crs_xy_list, srcCrs, destCrs):
+
+    return project_xy_array(src_crs_xy_list, srcCrs, destCrs).tolist()
 
 
 def qcolor2rgbmpl(qcolor):
@@ -381,7 +706,12 @@ class MapDigitizeTool(QgsMapTool):
 
 class QGisRasterParameters(object):
 
-    def __init__(self, name, cellsizeEW, cellsizeNS, rows, cols, xMin, xMax, yMin, yMax, nodatavalue, crs):
+    def __init__(self, name, cellsizeEW, cellsizeNS, rows, cols, xMin, xMax, yMin, yMax, nodatavalue, crs,
+                 geotransform=None):
+        """
+        For rotated grids, geotransform is the AffineGeoTransform of the raster cells,
+        the x/y limits define the bounding box and the cell sizes are the cell side lengths.
+        """
 
         self.name = name
         self.cellsizeEW = cellsizeEW
@@ -394,6 +724,43 @@ class QGisRasterParameters(object):
         self.yMax = yMax
         self.nodatavalue = nodatavalue
         self.crs = crs
+        self.geotransform = geotransform
+
+    def resampled(self, cols, rows):
+        """
+        Return the parameters of a raster with the same extent and the given size,
+        e.g. a raster overview.
+
+        :param cols: int
+        :param rows: int
+        :return: qProf.gis_utils.qgs_tools.QGisRasterParameters
+        """
+
+        factor_x = self.cols / float(cols)
+        factor_y = self.rows / float(rows)
+
+        if self.geotransform is None:
+            geotransform = None
+        else:
+            geotransform = self.geotransform.scaled(factor_x, factor_y)
+
+        return QGisRasterParameters(self.name,
+                                    self.cellsizeEW * factor_x,
+                                    self.cellsizeNS * factor_y,
+                                    rows,
+                                    cols,
+                                    self.xMin,
+                                    self.xMax,
+                                    self.yMin,
+                                    self.yMax,
+                                    self.nodatavalue,
+                                    self.crs,
+                                    geotransform)
+
+    @property
+    def is_rotated(self):
+
+        return self.geotransform is not None
 
     def point_in_dem_area(self, point):
         """
@@ -458,83 +825,375 @@ class QGisRasterParameters(object):
         return Point(x, y)
 
 
-def get_z(dem_layer, point):
+def rotated_raster_params(raster_layer, raster_params):
+    """
+    Return the parameters of a raster with a rotated or sheared geotransform,
+    expressed in its native cells, that QGIS serves resampled on a north-up grid.
+    Parameters are returned unchanged for north-up rasters
+    and for sources that cannot be opened with GDAL.
+
+    :param raster_layer: qgis._core.QgsRasterLayer
+    :param raster_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :return: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    """
+
+    try:
+        geotransform, cols, rows = gdal_raster_geotransform(raster_layer.source())
+    except RasterIOException:
+        return raster_params
+
+    affine_transform = AffineGeoTransform(geotransform)
+    if affine_transform.is_north_up:
+        return raster_params
+
+    corner_xs, corner_ys = affine_transform.forward([0, cols, cols, 0], [0, 0, rows, rows])
+
+    return QGisRasterParameters(raster_params.name,
+                                affine_transform.cellsize_x,
+                                affine_transform.cellsize_y,
+                                rows,
+                                cols,
+                                float(corner_xs.min()),
+                                float(corner_xs.max()),
+                                float(corner_ys.min()),
+                                float(corner_ys.max()),
+                                raster_params.nodatavalue,
+                                raster_params.crs,
+                                affine_transform)
+
+
+def gdal_extent_reader(raster_layer, band=1):
+    """
+    Return a function reading raster cell windows through a GDAL dataset,
+    in the native cells of the raster, also when rotated.
+
+    :param raster_layer: qgis._core.QgsRasterLayer
+    :param band: band number (1-based) - int
+    :return: function with (row_min, row_max, col_min, col_max, overview) arguments
+    """
+
+    dataset = open_gdal_raster(raster_layer.source())
+
+    def read_extent(row_min, row_max, col_min, col_max, overview=None):
+
+        return read_gdal_band_window(dataset, row_min, row_max, col_min, col_max, band, overview)
+
+    return read_extent
+
+
+def interpolate_z(dem, dem_params, point):
+    """
+        dem_params: type qProf.gis_utils.qgs_tools.QGisRasterParameters
+        point: type qProf.gis_utils.features.Point
+    """
+
+    return float(interpolate_z_array(dem, dem_params, [point.x], [point.y])[0])
+
+
+def raster_block_dtype(qgis_data_type):
+    """
+    NumPy dtype of a raster block data type, None when not supported.
+    """
+
+    dtypes = {QGis.Byte: np.uint8,
+              QGis.UInt16: np.uint16,
+              QGis.Int16: np.int16,
+              QGis.UInt32: np.uint32,
+              QGis.Int32: np.int32,
+              QGis.Float32: np.float32,
+              QGis.Float64: np.float64}
+
+    return dtypes.get(qgis_data_type)
+
+
+def raster_block_to_array(block, height, width):
+    """
+    Convert a raster block into a 2D float array,
+    with no-data cells set to NaN.
+
+    :param block: qgis._core.QgsRasterBlock
+    :param height: int
+    :param width: int
+    :return: numpy array of floats
+    """
+
+    def cell_values():
+
+        cell_data = np.empty((height, width), dtype=np.float64)
+        for row in range(height):
+            for col in range(width):
+                cell_data[row, col] = np.nan if block.isNoData(row, col) else block.value(row, col)
+
+        return cell_data
+
+    dtype = raster_block_dtype(block.dataType())
+
+    # data type without a matching dtype: read cell by cell
+    if dtype is None:
+        return cell_values()
+
+    try:
+        raw_data = np.frombuffer(bytes(block.data()), dtype=dtype)
+        data = raw_data.reshape((height, width)).astype(np.float64)
+    except Exception:  # block data not exposed by the bindings: read cell by cell
+        return cell_values()
+
+    if block.hasNoDataValue():
+        data[data == block.noDataValue()] = np.nan
+
+    return data
+
+
+def read_raster_extent(raster_layer, raster_params, row_min, row_max, col_min, col_max, band=1):
+    """
+    Read a window of raster cells with a single provider request.
+    Rows are counted from the raster top, bounds are inclusive.
+    Assume grid has no rotation.
+
+    :param raster_layer: qgis._core.QgsRasterLayer
+    :param raster_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :return: numpy array of floats, with NaN for no-data cells
+    """
+
+    width = col_max - col_min + 1
+    height = row_max - row_min + 1
+
+    extent = QgsRectangle(raster_params.xMin + col_min * raster_params.cellsizeEW,
+                          raster_params.yMax - (row_max + 1) * raster_params.cellsizeNS,
+                          raster_params.xMin + (col_max + 1) * raster_params.cellsizeEW,
+                          raster_params.yMax - row_min * raster_params.cellsizeNS)
+
+    block = raster_layer.dataProvider().block(band, extent, width, height)
+
+    return raster_block_to_array(block, height, width)
+
+
+def raster_block_bounds(raster_params, block_row, block_col):
+    """
+    Return the (row_min, row_max, col_min, col_max) inclusive cell bounds of a raster block.
+
+    :param raster_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :return: tuple of four ints
+    """
+
+    row_min = block_row * RASTER_BLOCK_SIZE
+    col_min = block_col * RASTER_BLOCK_SIZE
+    row_max = min(row_min + RASTER_BLOCK_SIZE, raster_params.rows) - 1
+    col_max = min(col_min + RASTER_BLOCK_SIZE, raster_params.cols) - 1
+
+    return row_min, row_max, col_min, col_max
+
+
+def read_raster_cached_block(raster_layer, raster_params, block_row, block_col, band=1, read_extent=None,
+                             overview=None):
+    """
+    Return a raster block of RASTER_BLOCK_SIZE x RASTER_BLOCK_SIZE cells (smaller along the raster edges),
+    reading it only when not already in the shared block cache.
+
+    :param raster_params: qProf.gis_utils.qgs_tools.QGisRasterParameters, of the overview when provided
+    :param read_extent: function reading the (row_min, row_max, col_min, col_max, overview) cell window,
+                        by default through the layer data provider
+    :param overview: raster overview index, None for the full resolution
+    :return: numpy array of floats, with NaN for no-data cells
+    """
+
+    # overviews are keyed by their size, that does not change when other overviews are added
+
+    overview_size = None if overview is None else (raster_params.rows, raster_params.cols)
+    key = (raster_layer.source(), band, overview_size, block_row, block_col)
+
+    data = raster_block_cache.get(key)
+    if data is None:
+        row_min, row_max, col_min, col_max = raster_block_bounds(raster_params, block_row, block_col)
+        if read_extent is None:
+            data = read_raster_extent(raster_layer, raster_params, row_min, row_max, col_min, col_max, band)
+        else:
+            data = read_extent(row_min, row_max, col_min, col_max, overview)
+        raster_block_cache.put(key, data)
+
+    return data
+
+
+def read_raster_block(raster_layer, raster_params, block_row, block_col, band=1, read_extent=None,
+                      overview=None):
+    """
+    Read a raster block from the registered DEM mirror, when present,
+    otherwise from the shared block cache.
+
+    :param raster_layer: qgis._core.QgsRasterLayer
+    :param raster_params: qProf.gis_utils.qgs_tools.QGisRasterParameters, of the overview when provided
+    :param read_extent: function reading the (row_min, row_max, col_min, col_max, overview) cell window,
+                        by default through the layer data provider
+    :param overview: raster overview index, None for the full resolution
+    :return: numpy array of floats, with NaN for no-data cells
+    """
+
+    mirror = dem_mirrors.get(raster_layer.source())
+    if mirror is not None and band == 1 and overview is None:
+        if mirror.matches(raster_params_dict(raster_params)):
+            return mirror.read_window(*raster_block_bounds(raster_params, block_row, block_col))
+
+        # source rewritten since the mirror was built: read it again through the provider
+        unregister_dem_mirror(raster_layer)
+        invalidate_raster_cache(raster_layer)
 
-    identification = dem_layer.dataProvider().identify(QgsPoint(point.x, point.y), QgsRaster.IdentifyFormatValue)
-    if not identification.isValid():
-        return np.nan
+    return read_raster_cached_block(raster_layer, raster_params, block_row, block_col, band, read_extent, overview)
+
+
+def invalidate_raster_cache(raster_layer=None):
+    """
+    Discard the cached blocks of a raster layer (e.g., after it has been reloaded),
+    or of all the rasters when no layer is provided.
+
+    :param raster_layer: qgis._core.QgsRasterLayer or None
+    """
+
+    if raster_layer is None:
+        raster_block_cache.invalidate()
     else:
-        try:
-            result_map = identification.results()
-            return float(result_map[1])
-        except:
-            return np.nan
+        raster_block_cache.invalidate(raster_layer.source())
+
+
+def raster_cache_stats():
+    """
+    Return hit/miss counters and size of the shared raster block cache.
+
+    :return: dict
+    """
+
+    return raster_block_cache.stats()
+
 
+def raster_params_dict(raster_params):
+    """
+    Return the raster parameters, crs excluded, as a dictionary
+    with the QGisRasterParameters argument names.
+
+    :param raster_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :return: dict
+    """
+
+    return dict(name=raster_params.name,
+                cellsizeEW=raster_params.cellsizeEW,
+                cellsizeNS=raster_params.cellsizeNS,
+                rows=raster_params.rows,
+                cols=raster_params.cols,
+                xMin=raster_params.xMin,
+                xMax=raster_params.xMax,
+                yMin=raster_params.yMin,
+                yMax=raster_params.yMax,
+                nodatavalue=float(raster_params.nodatavalue))
+
+
+def register_dem_mirror(raster_layer, raster_params, cache_dir=None):
+    """
+    Make the samplers read a DEM through its memory-mapped on-disk mirror.
+    The mirror is (re)built when missing, older than the source file or with a different raster geometry.
+    It is unregistered when the source file changes afterwards.
+
+    :param raster_layer: qgis._core.QgsRasterLayer
+    :param raster_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :param cache_dir: directory storing the mirrors - string
+    :return: qProf.gis_utils.dem_mirror.DEMMirror
+    """
+
+    source = raster_layer.source()
+
+    unregister_dem_mirror(raster_layer)
+
+    mirror = DEMMirror(source, cache_dir)
+    if not mirror.matches(raster_params_dict(raster_params)):
+        if raster_params.is_rotated:
+            read_extent = gdal_extent_reader(raster_layer)
+        else:
+            read_extent = lambda row_min, row_max, col_min, col_max: \
+                read_raster_extent(raster_layer, raster_params, row_min, row_max, col_min, col_max)
+        mirror.build(raster_params_dict(raster_params),
+                     lambda row_min, row_max: read_extent(row_min, row_max, 0, raster_params.cols - 1))
+
+    dem_mirrors[source] = mirror
+
+    return mirror
+
+
+def unregister_dem_mirror(raster_layer):
+    """
+    Make the samplers read a DEM again through its data provider.
+    Mirror files are kept for later sessions.
+
+    :param raster_layer: qgis._core.QgsRasterLayer
+    """
+
+    mirror = dem_mirrors.pop(raster_layer.source(), None)
+    if mirror is not None:
+        mirror.close()
+
+
+def interpolate_z_array_masked(dem, dem_params, xs, ys, read_extent=None, overview=None,
+                               nodata_policy=NODATA_PROPAGATE):
+    """
+    Interpolate the z values of a set of points, reading just the DEM blocks
+    containing the cells required by the points,
+    and count the points whose interpolation involves no-data cells.
+    Cells with the DEM no-data value are masked even when the provider does not flag them.
 
-def interpolate_bilinear(dem, qrpDemParams, point):
-    """        
     :param dem: qgis._core.QgsRasterLayer
-    :param qrpDemParams: qProf.gis_utils.qgs_tools.QGisRasterParameters
-    :param point: qProf.gis_utils.features.Point
-    :return: float
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters, of the overview when provided
+    :param xs: x coordinates, in the DEM CRS - array-like of floats
+    :param ys: y coordinates, in the DEM CRS - array-like of floats
+    :param read_extent: function reading the (row_min, row_max, col_min, col_max, overview) cell window,
+                        by default through the DEM data provider, or through GDAL for rotated DEMs and overviews
+    :param overview: DEM overview index, None for the full resolution
+    :param nodata_policy: qProf.gis_utils.sampling.NODATA_PROPAGATE or NODATA_RENORMALIZE
+    :return: tuple of numpy array of floats and int
     """
 
-    dArrayCoords = qrpDemParams.geogr2raster(point)
+    samples = BilinearSamples(dem_params, xs, ys)
 
-    floor_x_raster = floor(dArrayCoords["x"])
-    ceil_x_raster = ceil(dArrayCoords["x"])
-    floor_y_raster = floor(dArrayCoords["y"])
-    ceil_y_raster = ceil(dArrayCoords["y"])
+    if samples.window() is None:
+        return samples.interpolate(None), 0
 
-    # bottom-left center
-    p1 = qrpDemParams.raster2geogr(dict(x=floor_x_raster,
-                                        y=floor_y_raster))
-    # bottom-right center
-    p2 = qrpDemParams.raster2geogr(dict(x=ceil_x_raster,
-                                        y=floor_y_raster))
-    # top-left center
-    p3 = qrpDemParams.raster2geogr(dict(x=floor_x_raster,
-                                        y=ceil_y_raster))
-    # top-right center
-    p4 = qrpDemParams.raster2geogr(dict(x=ceil_x_raster,
-                                        y=ceil_y_raster))
+    if read_extent is None and (dem_params.is_rotated or overview is not None):
+        read_extent = gdal_extent_reader(dem)
 
-    z1 = get_z(dem, p1)
-    z2 = get_z(dem, p2)
-    z3 = get_z(dem, p3)
-    z4 = get_z(dem, p4)
+    def read_block(block_row, block_col):
 
-    delta_x = point.x - p1.x
-    delta_y = point.y - p1.y
+        return read_raster_block(dem, dem_params, block_row, block_col, read_extent=read_extent, overview=overview)
 
-    z_x_a = z1 + (z2 - z1) * delta_x / qrpDemParams.cellsizeEW
-    z_x_b = z3 + (z4 - z3) * delta_x / qrpDemParams.cellsizeEW
+    cells = BlockCells(read_block, RASTER_BLOCK_SIZE, dem_params.nodatavalue)
 
-    return z_x_a + (z_x_b - z_x_a) * delta_y / qrpDemParams.cellsizeNS
+    zs = samples.interpolate(cells.values, nodata_policy)
 
+    return zs, samples.masked_count
 
-def interpolate_z(dem, dem_params, point):
+
+def interpolate_z_array(dem, dem_params, xs, ys, read_extent=None, overview=None):
     """
-        dem_params: type qProf.gis_utils.qgs_tools.QGisRasterParameters
-        point: type qProf.gis_utils.features.Point
+    Interpolate the z values of a set of points, with the same results of interpolate_z,
+    reading just the DEM blocks containing the cells required by the points.
+    No-data cells result in NaN values.
+
+    :param dem: qgis._core.QgsRasterLayer
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters, of the overview when provided
+    :param xs: x coordinates, in the DEM CRS - array-like of floats
+    :param ys: y coordinates, in the DEM CRS - array-like of floats
+    :param read_extent: function reading the (row_min, row_max, col_min, col_max, overview) cell window,
+                        by default through the DEM data provider
+    :param overview: DEM overview index, None for the full resolution
+    :return: numpy array of floats
     """
 
-    if dem_params.point_in_interpolation_area(point):
-        return interpolate_bilinear(dem, dem_params, point)
-    elif dem_params.point_in_dem_area(point):
-        return get_z(dem, point)
-    else:
-        return np.nan
+    zs, _ = interpolate_z_array_masked(dem, dem_params, xs, ys, read_extent, overview)
+
+    return zs
 
 
 def get_zs_from_dem(struct_pts_2d, demObj):
 
-    z_list = []
-    for point_2d in struct_pts_2d:
-        interp_z = interpolate_z(demObj.layer, demObj.params, point_2d)
-        z_list.append(interp_z)
+    xs = [point_2d.x for point_2d in struct_pts_2d]
+    ys = [point_2d.y for point_2d in struct_pts_2d]
 
-    return z_list
+    return list(interpolate_z_array(demObj.layer, demObj.params, xs, ys))
 
 
 def xy_from_canvas(canvas, position):
@@ -0,0 +1,105 @@
+from __future__ import division
+
+import threading
+from collections import OrderedDict
+
+
+RASTER_BLOCK_SIZE = 256  # rows and columns of a cached raster block
+RASTER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class RasterBlockCache(object):
+    """
+    Least-recently-used cache of raster blocks, bounded by the total size of the stored arrays.
+    Blocks are keyed by (layer source, band, block row, block column).
+    """
+
+    def __init__(self, max_bytes=RASTER_CACHE_MAX_BYTES):
+
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached block array, or None when missing.
+
+        :param key: (source, band, block_row, block_col) tuple
+        :return: numpy array or None
+        """
+
+        with self._lock:
+            try:
+                data = self._blocks.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._blocks[key] = data  # move to most recently used position
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """
+        Store a block array, evicting the least recently used blocks when over size.
+
+        :param key: (source, band, block_row, block_col) tuple
+        :param data: numpy array
+        """
+
+        with self._lock:
+            previous = self._blocks.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.nbytes
+
+            if data.nbytes > self.max_bytes:
+                return
+
+            self._blocks[key] = data
+            self.current_bytes += data.nbytes
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._blocks.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def invalidate(self, source=None):
+        """
+        Remove the cached blocks of a raster source, or all blocks when source is None.
+
+        :param source: the raster layer source - string or None
+        """
+
+        with self._lock:
+            if source is None:
+                self._blocks.clear()
+                self.current_bytes = 0
+                return
+
+            for key in [key for key in self._blocks if key[0] == source]:
+                self.current_bytes -= self._blocks.pop(key).nbytes
+
+    def reset_counters(self):
+
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return the cache counters as a dictionary.
+        """
+
+        with self._lock:
+            return dict(hits=self.hits,
+                        misses=self.misses,
+                        blocks=len(self._blocks),
+                        bytes=self.current_bytes,
+                        max_bytes=self.max_bytes)
+
+
+# process-wide cache shared by the DEM samplers
+raster_block_cache = RasterBlockCache()
@@ -70,8 +70,8 @@ class ArrCoord(object):
     j = property(g_j, s_j)
 
     def grid2geogcoord(self, currGeoGrid):
-        currPt_geogr_y = currGeoGrid.domain.trcorner.p_y - self.i * currGeoGrid.cellsize_y
-        currPt_geogr_x = currGeoGrid.domain.llcorner.p_x + self.j * currGeoGrid.cellsize_x
+        currPt_geogr_y = currGeoGrid.domain.trcorner.y - self.i * currGeoGrid.cellsize_y
+        currPt_geogr_x = currGeoGrid.domain.llcorner.x + self.j * currGeoGrid.cellsize_x
 
         return Point(currPt_geogr_x, currPt_geogr_y)
 
@@ -121,7 +121,7 @@ class RectangularDomain(object):
 
         @return:  x range - float.
         """
-        return self.trcorner.p_x - self.llcorner.p_x
+        return self.trcorner.x - self.llcorner.x
 
     @property
     def yrange(self):
@@ -130,7 +130,7 @@ class RectangularDomain(object):
 
         @return:  y range - float.
         """
-        return self.trcorner.p_y - self.llcorner.p_y
+        return self.trcorner.y - self.llcorner.y
 
     @property
     def zrange(self):
@@ -139,7 +139,7 @@ class RectangularDomain(object):
 
         @return:  z range - float.
         """
-        return self.trcorner.p_z - self.llcorner.p_z
+        return self.trcorner.z - self.llcorner.z
 
     @property
     def horiz_area(self):
@@ -158,7 +158,7 @@ class Grid(object):
 
     """
 
-    def __init__(self, source_filename=None, grid_params=None, grid_data=None):
+    def __init__(self, source_filename=None, grid_params=None, grid_data=None, copy_data=True):
         """
         Grid class constructor.
 
@@ -168,14 +168,16 @@ class Grid(object):
         @type  grid_params:  class GDALParameters.
         @param  grid_data:  the array storing the data.
         @type  grid_data:  2D np.array.
+        @param  copy_data:  whether to store a copy of grid_data, or grid_data itself.
+        @type  copy_data:  bool.
 
         @return:  self.
         """
         self._sourcename = source_filename
 
         if grid_params is not None:
-            pt_llc = grid_params.llcorner
-            pt_trc = grid_params.trcorner
+            pt_llc = grid_params.llcorner()
+            pt_trc = grid_params.trcorner()
         else:
             pt_llc = None
             pt_trc = None
@@ -183,7 +185,7 @@ class Grid(object):
         self._grid_domain = RectangularDomain(pt_llc, pt_trc)
 
         if grid_data is not None:
-            self._grid_data = grid_data.copy()
+            self._grid_data = grid_data.copy() if copy_data else grid_data
         else:
             self._grid_data = None
 
@@ -261,10 +263,10 @@ class Grid(object):
         Return the xmin, xmax and ymin, ymax values as a dictionary
         """
 
-        return dict(xmin=self.domain.llcorner.p_x,
-                    xmax=self.domain.trcorner.p_x,
-                    ymin=self.domain.llcorner.p_y,
-                    ymax=self.domain.trcorner.p_y)
+        return dict(xmin=self.domain.llcorner.x,
+                    xmax=self.domain.trcorner.x,
+                    ymin=self.domain.llcorner.y,
+                    ymax=self.domain.trcorner.y)
 
     @property
     def xmin(self):
@@ -345,8 +347,8 @@ class Grid(object):
 
         @return: point coordinates in raster (array) frame - class ArrCoord.
         """
-        currArrCoord_grid_i = (self.domain.trcorner.p_y - curr_Pt.p_y) / self.cellsize_y
-        currArrCoord_grid_j = (curr_Pt.p_x - self.domain.llcorner.p_x) / self.cellsize_x
+        currArrCoord_grid_i = (self.domain.trcorner.y - curr_Pt.y) / self.cellsize_y
+        currArrCoord_grid_j = (curr_Pt.x - self.domain.llcorner.x) / self.cellsize_x
 
         return ArrCoord(currArrCoord_grid_i, currArrCoord_grid_j)
 
@@ -358,7 +360,7 @@ class Grid(object):
         @return: numpy.array, shape: 1 x col_num.
         """
 
-        x_values = self.domain.llcorner.p_x + self.cellsize_x * (0.5 + np.arange(self.col_num))
+        x_values = self.domain.llcorner.x + self.cellsize_x * (0.5 + np.arange(self.col_num))
 
         return x_values[np.newaxis, :]
 
@@ -370,7 +372,7 @@ class Grid(object):
         @return: numpy.array, shape: row_num x 1.
         """
 
-        y_values = self.domain.trcorner.p_y - self.cellsize_y * (0.5 + np.arange(self.row_num))
+        y_values = self.domain.trcorner.y - self.cellsize_y * (0.5 + np.arange(self.row_num))
 
         return y_values[:, np.newaxis]
 
@@ -429,10 +431,13 @@ class Grid(object):
 
         return grid_val_interp
 
-    def intersection_with_surface(self, surf_type, srcPt, srcPlaneAttitude):
+    def intersection_with_surface(self, surf_type, srcPt, srcPlaneAttitude, dtype=None):
         """
         Calculates the intersections (as points) between DEM (the self object) and an analytical surface.
-        Currently it works only with planes.
+        Currently it works only with non-vertical planes.
+        Intersections are searched along the segments joining successive cell centers,
+        in the x (rightward) and y (upward) directions. Intersections at cell centers
+        found in both directions are retained only in the x-direction results.
 
         @param surf_type: type of considered surface (i.e., plane, the only case implemented at present).
         @type surf_type: String.
@@ -440,72 +445,192 @@ class Grid(object):
         @type srcPt: Point.
         @param srcPlaneAttitude: orientation of the surface (currently only planes).
         @type srcPlaneAttitude: class GPlane.
+        @param dtype: float type of the calculations, by default
+                      the grid data type when floating point, otherwise float64.
+        @type dtype: numpy.float32 or numpy.float64.
 
-        @return: tuple of four arrays
+        @return: tuple of four float64 arrays: x and y coordinates of the x-direction intersections,
+                 x and y coordinates of the y-direction intersections, NaN where missing.
         """
 
-        if surf_type == 'plane':
+        if surf_type != 'plane':
+            return
 
-            # closures to compute the geographic coordinates (in x- and y-) of a cell center
-            # the grid coordinates of the cell center are expressed by i and j
-            grid_coord_to_geogr_coord_x_closure = lambda j: self.domain.llcorner.p_x + self.cellsize_x * (0.5 + j)
-            grid_coord_to_geogr_coord_y_closure = lambda i: self.domain.trcorner.p_y - self.cellsize_y * (0.5 + i)
+        return PlaneIntersectionTerms(self, dtype).intersections(srcPt, srcPlaneAttitude)
 
-            # arrays storing the geographical coordinates of the cell centers along the x- and y- axes
-            cell_center_x_array = self.x()
-            cell_center_y_array = self.y()
 
-            ycoords_x, xcoords_y = np.broadcast_arrays(cell_center_x_array, cell_center_y_array)
+class PlaneIntersectionTerms(object):
+    """
+    DEM terms of the plane intersections, independent from the plane:
+    cell center coordinates and the parameters of the segments joining successive cell centers.
+    Computed once, they are reused to intersect any number of planes with the DEM.
+
+    """
 
-            #### x-axis direction intersections
+    def __init__(self, grid, dtype=None):
+        """
+        @param grid: the DEM.
+        @type grid: class Grid.
+        @param dtype: float type of the calculations, by default
+                      the grid data type when floating point, otherwise float64.
+        @type dtype: numpy.float32 or numpy.float64.
+
+        @return: self.
+        """
 
-            # 2D array of DEM segment parameters
-            x_dem_m = self.grad_forward_x()
-            x_dem_q = self.data - cell_center_x_array * x_dem_m
+        if dtype is None:
+            dtype = grid.data.dtype if np.issubdtype(grid.data.dtype, np.floating) else np.float64
+        self.dtype = np.dtype(dtype)
 
-            # closure for the planar surface that, given (x,y), will be used to derive z
-            plane_z_closure = srcPlaneAttitude.plane_from_geo(srcPt)
+        data = grid.data.astype(self.dtype, copy=False)
 
-            # 2D array of plane segment parameters
-            x_plane_m = srcPlaneAttitude.plane_x_coeff()
-            x_plane_q = np.array_from_function(self.row_num(), 1, lambda j: 0, grid_coord_to_geogr_coord_y_closure,
-                                               plane_z_closure)
+        # coordinates are relative to the grid lower-left corner, to preserve precision with float32
 
-            # 2D array that defines denominator for intersections between local segments
-            x_inters_denomin = np.where(x_dem_m != x_plane_m, x_dem_m - x_plane_m, np.NaN)
+        self.x0, self.y0 = grid.domain.llcorner.x, grid.domain.llcorner.y
+        self.y_top = grid.domain.trcorner.y
 
-            coincident_x = np.where(x_dem_q != x_plane_q, np.NaN, ycoords_x)
+        self.row_num, self.col_num = data.shape
+        self.cellsize_x = self.dtype.type(grid.cellsize_x)
+        self.cellsize_y = self.dtype.type(grid.cellsize_y)
 
-            xcoords_x = np.where(x_dem_m != x_plane_m, (x_plane_q - x_dem_q) / x_inters_denomin, coincident_x)
-            xcoords_x = np.where(xcoords_x < ycoords_x, np.NaN, xcoords_x)
-            xcoords_x = np.where(xcoords_x >= ycoords_x + self.cellsize_x, np.NaN, xcoords_x)
+        nan = self.dtype.type(np.nan)
 
-            #### y-axis direction intersections
+        # relative coordinates of the cell centers along the x- and y- axes
 
-            # 2D array of DEM segment parameters
-            y_dem_m = self.grad_forward_y()
-            y_dem_q = self.data - cell_center_y_array * y_dem_m
+        self.cell_center_x_array = (self.cellsize_x * (self.dtype.type(0.5) +
+                                                       np.arange(self.col_num, dtype=self.dtype)))[np.newaxis, :]
+        self.cell_center_y_array = (self.dtype.type(grid.domain.yrange) -
+                                    self.cellsize_y * (self.dtype.type(0.5) +
+                                                       np.arange(self.row_num, dtype=self.dtype)))[:, np.newaxis]
 
-            # 2D array of plane segment parameters
-            y_plane_m = srcPlaneAttitude.plane_y_coeff()
-            y_plane_q = np.array_from_function(1, self.col_num, grid_coord_to_geogr_coord_x_closure, lambda i: 0,
-                                               plane_z_closure)
+        with np.errstate(divide='ignore', invalid='ignore'):
 
-            # 2D array that defines denominator for intersections between local segments
-            y_inters_denomin = np.where(y_dem_m != y_plane_m, y_dem_m - y_plane_m, np.NaN)
-            coincident_y = np.where(y_dem_q != y_plane_q, np.NaN, xcoords_y)
+            # DEM segments from each cell center to the right one, as z = x_dem_m * x + x_dem_q
 
-            ycoords_y = np.where(y_dem_m != y_plane_m, (y_plane_q - y_dem_q) / y_inters_denomin, coincident_y)
+            self.x_dem_m = np.empty_like(data)
+            self.x_dem_m[:, :-1] = (data[:, 1:] - data[:, :-1]) / self.cellsize_x
+            self.x_dem_m[:, -1] = nan
+            self.x_dem_q = data - self.cell_center_x_array * self.x_dem_m
+
+            # DEM segments from each cell center to the upper one, as z = y_dem_m * y + y_dem_q
+
+            self.y_dem_m = np.empty_like(data)
+            self.y_dem_m[1:, :] = (data[:-1, :] - data[1:, :]) / self.cellsize_y
+            self.y_dem_m[0, :] = nan
+            self.y_dem_q = data - self.cell_center_y_array * self.y_dem_m
+
+    def window(self, srcPt, radius):
+        """
+        Row and column ranges of the cells within a square window around a point.
+
+        @param srcPt: window center.
+        @type srcPt: Point.
+        @param radius: half side of the window.
+        @type radius: float.
+
+        @return: tuple of row_min, row_max, col_min, col_max, max bounds exclusive.
+        """
+
+        col_min = int(floor((srcPt.x - radius - self.x0) / float(self.cellsize_x)))
+        col_max = int(ceil((srcPt.x + radius - self.x0) / float(self.cellsize_x)))
+        row_min = int(floor((self.y_top - srcPt.y - radius) / float(self.cellsize_y)))
+        row_max = int(ceil((self.y_top - srcPt.y + radius) / float(self.cellsize_y)))
+
+        return max(row_min, 0), min(max(row_max, 0), self.row_num), \
+            max(col_min, 0), min(max(col_max, 0), self.col_num)
+
+    def intersections(self, srcPt, srcPlaneAttitude, window=None):
+        """
+        Calculates the intersections of a non-vertical plane with the DEM, or with a window of it.
+        See Grid.intersection_with_surface.
+
+        @param srcPt: point, expressed in geographical coordinates, that the plane must contain.
+        @type srcPt: Point.
+        @param srcPlaneAttitude: orientation of the plane.
+        @type srcPlaneAttitude: class GPlane.
+        @param window: row_min, row_max, col_min, col_max, max bounds exclusive; the whole DEM when None.
+        @type window: tuple of int.
+
+        @return: tuple of four float64 arrays, with the window shape: x and y coordinates of the x-direction
+                 intersections, x and y coordinates of the y-direction intersections, NaN where missing.
+        """
+
+        dtype = self.dtype
+
+        if window is None:
+            window = (0, self.row_num, 0, self.col_num)
+        row_min, row_max, col_min, col_max = window
+
+        rows = slice(row_min, row_max)
+        cols = slice(col_min, col_max)
+
+        cell_center_x_array = self.cell_center_x_array[:, cols]
+        cell_center_y_array = self.cell_center_y_array[rows, :]
+
+        # plane as z = m_x * x + m_y * y + q, in coordinates relative to the grid lower-left corner
+
+        plane = srcPlaneAttitude.plane(srcPt)
+        plane_m_x = -plane.a / plane.c
+        plane_m_y = -plane.b / plane.c
+        plane_q = -(plane.a * self.x0 + plane.b * self.y0 + plane.d) / plane.c
+
+        cellsize_x = self.cellsize_x
+        cellsize_y = self.cellsize_y
+        nan = dtype.type(np.nan)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+
+            #### x-axis direction intersections, on the segments from each cell center to the right one
+
+            # plane lines along rows as z = plane_m_x * x + plane_q_x
+
+            x_dem_m = self.x_dem_m[rows, cols]
+            x_dem_q = self.x_dem_q[rows, cols]
+
+            x_plane_m = dtype.type(plane_m_x)
+            x_plane_q = (dtype.type(plane_q) + dtype.type(plane_m_y) * cell_center_y_array).astype(dtype)
+
+            xcoords_x = (x_plane_q - x_dem_q) / (x_dem_m - x_plane_m)
+
+            # segments lying on the plane intersect it at their start
+            xcoords_x = np.where(x_dem_m == x_plane_m,
+                                 np.where(x_dem_q == x_plane_q, cell_center_x_array, nan),
+                                 xcoords_x)
 
             # filter out cases where intersection is outside cell range
-            ycoords_y = np.where(ycoords_y < xcoords_y, np.NaN, ycoords_y)
-            ycoords_y = np.where(ycoords_y >= xcoords_y + self.cellsize_y, np.NaN, ycoords_y)
+            xcoords_x[~((xcoords_x >= cell_center_x_array) & (xcoords_x < cell_center_x_array + cellsize_x))] = nan
+
+            #### y-axis direction intersections, on the segments from each cell center to the upper one
+
+            y_dem_m = self.y_dem_m[rows, cols]
+            y_dem_q = self.y_dem_q[rows, cols]
+
+            y_plane_m = dtype.type(plane_m_y)
+            y_plane_q = (dtype.type(plane_q) + dtype.type(plane_m_x) * cell_center_x_array).astype(dtype)
+
+            ycoords_y = (y_plane_q - y_dem_q) / (y_dem_m - y_plane_m)
+
+            ycoords_y = np.where(y_dem_m == y_plane_m,
+                                 np.where(y_dem_q == y_plane_q, cell_center_y_array, nan),
+                                 ycoords_y)
+
+            ycoords_y[~((ycoords_y >= cell_center_y_array) & (ycoords_y < cell_center_y_array + cellsize_y))] = nan
+
+            # intersections at cell centers, found in both directions, are kept in the x-direction results
+
+            coincident = (np.abs(xcoords_x - cell_center_x_array) < MIN_SEPARATION_THRESHOLD) & \
+                         (np.abs(ycoords_y - cell_center_y_array) < MIN_SEPARATION_THRESHOLD)
+            ycoords_y[coincident] = nan
+            del coincident
+
+        # back to geographic coordinates, in float64 since the calculation dtype
+        # may not resolve absolute coordinates (float32 steps are 0.25 m at 4e6 m)
+
+        xcoords_x = xcoords_x.astype(np.float64) + self.x0
+        ycoords_y = ycoords_y.astype(np.float64) + self.y0
 
-            for i in xrange(xcoords_x.shape[0]):
-                for j in xrange(xcoords_x.shape[1]):
-                    if abs(xcoords_x[i, j] - ycoords_x[i, j]) < MIN_SEPARATION_THRESHOLD and abs(
-                                    ycoords_y[i, j] - xcoords_y[i, j]) < MIN_SEPARATION_THRESHOLD:
-                        ycoords_y[i, j] = np.NaN
+        ycoords_x, xcoords_y = np.broadcast_arrays(cell_center_x_array.astype(np.float64) + self.x0,
+                                                   cell_center_y_array.astype(np.float64) + self.y0)
 
-            return xcoords_x, xcoords_y, ycoords_x, ycoords_y
+        return xcoords_x, xcoords_y, ycoords_x, ycoords_y
 
@@ -0,0 +1,559 @@
+from __future__ import division
+
+import numpy as np
+
+
+# policies for interpolations involving no-data cells
+NODATA_PROPAGATE = "propagate"  # result is NaN
+NODATA_RENORMALIZE = "renormalize"  # weights renormalized over the valid cells
+
+
+class AffineGeoTransform(object):
+    """
+    Affine transformation between raster pixel/line coordinates (cell edges at integer values,
+    lines counted from the raster top) and geographic coordinates,
+    defined by a GDAL geotransform:
+      x = gt[0] + col * gt[1] + line * gt[2]
+      y = gt[3] + col * gt[4] + line * gt[5]
+    """
+
+    def __init__(self, geotransform):
+        """
+        :param geotransform: GDAL geotransform - sequence of six floats
+        """
+
+        gt = [float(val) for val in geotransform]
+        assert len(gt) == 6
+
+        self.geotransform = tuple(gt)
+
+        self.forward_matrix = np.array([[gt[1], gt[2], gt[0]],
+                                        [gt[4], gt[5], gt[3]]])
+
+        linear = self.forward_matrix[:, :2]
+        inverse_linear = np.linalg.inv(linear)
+        self.inverse_matrix = np.column_stack((inverse_linear,
+                                               -np.dot(inverse_linear, self.forward_matrix[:, 2])))
+
+    @property
+    def is_north_up(self):
+
+        return self.geotransform[2] == 0.0 and self.geotransform[4] == 0.0
+
+    @property
+    def cellsize_x(self):
+        """
+        Length of the cell sides along the raster columns direction.
+        """
+
+        return float(np.hypot(self.geotransform[1], self.geotransform[4]))
+
+    @property
+    def cellsize_y(self):
+        """
+        Length of the cell sides along the raster lines direction.
+        """
+
+        return float(np.hypot(self.geotransform[2], self.geotransform[5]))
+
+    def forward(self, cols, lines):
+        """
+        Convert pixel/line coordinates to geographic coordinates.
+
+        :param cols: array-like of floats
+        :param lines: array-like of floats
+        :return: tuple of two numpy arrays of floats
+        """
+
+        cols = np.asarray(cols, dtype=np.float64)
+        lines = np.asarray(lines, dtype=np.float64)
+
+        m = self.forward_matrix
+
+        return m[0, 0] * cols + m[0, 1] * lines + m[0, 2], \
+            m[1, 0] * cols + m[1, 1] * lines + m[1, 2]
+
+    def inverse(self, xs, ys):
+        """
+        Convert geographic coordinates to pixel/line coordinates.
+
+        :param xs: array-like of floats
+        :param ys: array-like of floats
+        :return: tuple of two numpy arrays of floats
+        """
+
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+
+        m = self.inverse_matrix
+
+        return m[0, 0] * xs + m[0, 1] * ys + m[0, 2], \
+            m[1, 0] * xs + m[1, 1] * ys + m[1, 2]
+
+    def scaled(self, factor_x, factor_y):
+        """
+        Return the transform of a raster with the same extent
+        and cells scaled by the given factors, e.g. a raster overview.
+
+        :param factor_x: scale factor along the columns - float
+        :param factor_y: scale factor along the lines - float
+        :return: AffineGeoTransform
+        """
+
+        gt = self.geotransform
+
+        return AffineGeoTransform((gt[0], gt[1] * factor_x, gt[2] * factor_y,
+                                   gt[3], gt[4] * factor_x, gt[5] * factor_y))
+
+
+class BilinearSamples(object):
+    """
+    Vectorized counterpart of qgs_tools.interpolate_z,
+    for a set of points expressed in the DEM CRS.
+
+    Points within the area defined by the extreme cell centers are bilinearly interpolated,
+    points on the DEM border stripe take the value of the cell containing them,
+    points outside the DEM area are NaN.
+    No-data cells are expected as NaN values.
+    Row indices are counted from the raster top, as in the raster data provider.
+    Rotated grids are handled in pixel/line coordinates, via their affine geotransform.
+    """
+
+    def __init__(self, dem_params, xs, ys):
+        """
+        :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+        :param xs: x coordinates of the points - array-like of floats
+        :param ys: y coordinates of the points - array-like of floats
+        """
+
+        self.params = dem_params
+
+        self.xs = np.asarray(xs, dtype=np.float64)
+        self.ys = np.asarray(ys, dtype=np.float64)
+
+        self.masked_count = 0
+
+        if dem_params.geotransform is not None:
+            self._init_affine(dem_params.geotransform)
+            return
+
+        p = dem_params
+
+        self.cellsize_x = p.cellsizeEW
+        self.cellsize_y = p.cellsizeNS
+
+        with np.errstate(invalid='ignore'):
+
+            in_dem_area = (p.xMin <= self.xs) & (self.xs <= p.xMax) & \
+                          (p.yMin <= self.ys) & (self.ys <= p.yMax)
+
+            in_interpolation_area = (p.xMin + p.cellsizeEW / 2.0 <= self.xs) & \
+                                    (self.xs <= p.xMax - p.cellsizeEW / 2.0) & \
+                                    (p.yMin + p.cellsizeNS / 2.0 <= self.ys) & \
+                                    (self.ys <= p.yMax - p.cellsizeNS / 2.0)
+
+        self.interp_ndxs = np.flatnonzero(in_interpolation_area)
+        self.border_ndxs = np.flatnonzero(in_dem_area & ~in_interpolation_area)
+
+        # raster coordinates of the interpolated points (see QGisRasterParameters.geogr2raster)
+
+        interp_xs = self.xs[self.interp_ndxs]
+        interp_ys = self.ys[self.interp_ndxs]
+
+        raster_x = (interp_xs - (p.xMin + p.cellsizeEW / 2.0)) / p.cellsizeEW
+        raster_y = (interp_ys - (p.yMin + p.cellsizeNS / 2.0)) / p.cellsizeNS
+
+        floor_x_raster = np.floor(raster_x)
+        ceil_x_raster = np.ceil(raster_x)
+        floor_y_raster = np.floor(raster_y)
+        ceil_y_raster = np.ceil(raster_y)
+
+        # offsets from the bottom-left cell center (see QGisRasterParameters.raster2geogr)
+        self.delta_x = interp_xs - (p.xMin + (floor_x_raster + 0.5) * p.cellsizeEW)
+        self.delta_y = interp_ys - (p.yMin + (floor_y_raster + 0.5) * p.cellsizeNS)
+
+        # raster y axis is upward, provider rows are downward
+        self.floor_col = floor_x_raster.astype(np.int64)
+        self.ceil_col = ceil_x_raster.astype(np.int64)
+        self.floor_row = (p.rows - 1) - floor_y_raster.astype(np.int64)
+        self.ceil_row = (p.rows - 1) - ceil_y_raster.astype(np.int64)
+
+        # cells containing the border points; points on the outer DEM edges
+        # are attributed to the edge cells
+
+        border_xs = self.xs[self.border_ndxs]
+        border_ys = self.ys[self.border_ndxs]
+
+        self.border_col = np.clip(np.floor((border_xs - p.xMin) / p.cellsizeEW).astype(np.int64), 0, p.cols - 1)
+        self.border_row = np.clip(np.floor((p.yMax - border_ys) / p.cellsizeNS).astype(np.int64), 0, p.rows - 1)
+
+    def _init_affine(self, geotransform):
+        """
+        Locate the points in a rotated or sheared grid.
+        Interpolation works on pixel/line coordinates, with unit cell sizes.
+
+        :param geotransform: AffineGeoTransform
+        """
+
+        p = self.params
+
+        self.cellsize_x = 1.0
+        self.cellsize_y = 1.0
+
+        cols, lines = geotransform.inverse(self.xs, self.ys)
+
+        # offsets from the first cell center
+        u = cols - 0.5
+        v = lines - 0.5
+
+        with np.errstate(invalid='ignore'):
+
+            in_dem_area = (0.0 <= cols) & (cols <= p.cols) & \
+                          (0.0 <= lines) & (lines <= p.rows)
+
+            in_interpolation_area = (0.0 <= u) & (u <= p.cols - 1) & \
+                                    (0.0 <= v) & (v <= p.rows - 1)
+
+        self.interp_ndxs = np.flatnonzero(in_interpolation_area)
+        self.border_ndxs = np.flatnonzero(in_dem_area & ~in_interpolation_area)
+
+        interp_u = u[self.interp_ndxs]
+        interp_v = v[self.interp_ndxs]
+
+        floor_u = np.floor(interp_u)
+        ceil_v = np.ceil(interp_v)
+
+        # "floor" rows are the lower ones, as in the north-up case
+        self.floor_col = floor_u.astype(np.int64)
+        self.ceil_col = np.ceil(interp_u).astype(np.int64)
+        self.floor_row = ceil_v.astype(np.int64)
+        self.ceil_row = np.floor(interp_v).astype(np.int64)
+
+        self.delta_x = interp_u - floor_u
+        self.delta_y = ceil_v - interp_v
+
+        self.border_col = np.clip(np.floor(cols[self.border_ndxs]).astype(np.int64), 0, p.cols - 1)
+        self.border_row = np.clip(np.floor(lines[self.border_ndxs]).astype(np.int64), 0, p.rows - 1)
+
+    @property
+    def num_pts(self):
+
+        return self.xs.size
+
+    def window(self):
+        """
+        Return the raster window (row_min, row_max, col_min, col_max), inclusive,
+        storing all the cells required by the interpolation,
+        or None when no point falls within the DEM area.
+
+        :return: tuple of four ints or None
+        """
+
+        rows = np.concatenate((self.floor_row, self.ceil_row, self.border_row))
+        cols = np.concatenate((self.floor_col, self.ceil_col, self.border_col))
+
+        if rows.size == 0:
+            return None
+
+        return int(rows.min()), int(rows.max()), int(cols.min()), int(cols.max())
+
+    def interpolate(self, cell_values, nodata_policy=NODATA_PROPAGATE):
+        """
+        Calculate the z values of all the points.
+        The number of points with no-data cells among the interpolated ones
+        is stored in the masked_count attribute.
+
+        :param cell_values: function returning the float values of the cells
+                            given two integer arrays of rows and columns,
+                            called once with all the cells required by the points
+        :param nodata_policy: NODATA_PROPAGATE or NODATA_RENORMALIZE
+        :return: numpy array of floats
+        """
+
+        zs = np.empty(self.num_pts, dtype=np.float64)
+        zs.fill(np.nan)
+
+        self.masked_count = 0
+
+        if self.interp_ndxs.size + self.border_ndxs.size == 0:
+            return zs
+
+        # bottom-left, bottom-right, top-left and top-right centers, then the border cells
+
+        all_zs = cell_values(np.concatenate((self.floor_row, self.floor_row, self.ceil_row, self.ceil_row,
+                                             self.border_row)),
+                             np.concatenate((self.floor_col, self.ceil_col, self.floor_col, self.ceil_col,
+                                             self.border_col)))
+
+        num_interp = self.interp_ndxs.size
+        z1, z2, z3, z4 = np.split(all_zs[:4 * num_interp], 4)
+        border_zs = all_zs[4 * num_interp:]
+
+        if num_interp > 0:
+
+            z_x_a = z1 + (z2 - z1) * self.delta_x / self.cellsize_x
+            z_x_b = z3 + (z4 - z3) * self.delta_x / self.cellsize_x
+
+            interp_zs = z_x_a + (z_x_b - z_x_a) * self.delta_y / self.cellsize_y
+
+            corner_zs = np.column_stack((z1, z2, z3, z4))
+            valid_corners = ~np.isnan(corner_zs)
+            masked = ~np.all(valid_corners, axis=1)
+
+            if nodata_policy == NODATA_RENORMALIZE and np.any(masked):
+
+                frac_x = self.delta_x[masked] / self.cellsize_x
+                frac_y = self.delta_y[masked] / self.cellsize_y
+
+                weights = np.column_stack(((1.0 - frac_x) * (1.0 - frac_y),
+                                           frac_x * (1.0 - frac_y),
+                                           (1.0 - frac_x) * frac_y,
+                                           frac_x * frac_y))
+                weights[~valid_corners[masked]] = 0.0
+
+                weights_sums = np.sum(weights, axis=1)
+                weighted_sums = np.sum(weights * np.where(valid_corners[masked], corner_zs[masked], 0.0), axis=1)
+
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    interp_zs[masked] = np.where(weights_sums > 0.0, weighted_sums / weights_sums, np.nan)
+
+            zs[self.interp_ndxs] = interp_zs
+            self.masked_count += int(np.count_nonzero(masked))
+
+        if self.border_ndxs.size > 0:
+
+            zs[self.border_ndxs] = border_zs
+            self.masked_count += int(np.count_nonzero(np.isnan(border_zs)))
+
+        return zs
+
+
+class BlockCells(object):
+    """
+    Values of scattered raster cells, read block by block:
+    just the blocks containing the requested cells are read,
+    and the cells are indexed within each block.
+    """
+
+    def __init__(self, read_block, block_size, nodata_value=None):
+        """
+        :param read_block: function returning the 2D numpy array of floats of a block,
+                           given its block row and column, with NaN for no-data cells
+        :param block_size: block rows and columns - int
+        :param nodata_value: cell value to be masked as no-data, besides NaN - float or None
+        """
+
+        self.read_block = read_block
+        self.block_size = block_size
+        self.nodata_value = nodata_value
+
+    def values(self, rows, cols):
+        """
+        Return the values of the cells with the given raster rows and columns.
+
+        :param rows: numpy array of ints
+        :param cols: numpy array of ints
+        :return: numpy array of floats
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+
+        values = np.empty(rows.shape, dtype=np.float64)
+        if rows.size == 0:
+            return values
+
+        block_rows = rows // self.block_size
+        block_cols = cols // self.block_size
+
+        # cells grouped by block
+
+        block_ids = block_rows * (int(block_cols.max()) + 1) + block_cols
+        order = np.argsort(block_ids, kind='mergesort')
+        sorted_ids = block_ids[order]
+        group_starts = np.flatnonzero(np.concatenate(([True], sorted_ids[1:] != sorted_ids[:-1])))
+        group_ends = np.concatenate((group_starts[1:], [sorted_ids.size]))
+
+        mask_nodata = self.nodata_value is not None and not np.isnan(self.nodata_value)
+
+        for group_start, group_end in zip(group_starts, group_ends):
+
+            ndxs = order[group_start:group_end]
+            block_row = int(block_rows[ndxs[0]])
+            block_col = int(block_cols[ndxs[0]])
+
+            block_values = self.read_block(block_row, block_col)[rows[ndxs] - block_row * self.block_size,
+                                                                 cols[ndxs] - block_col * self.block_size]
+
+            if mask_nodata:
+                block_values[block_values == self.nodata_value] = np.nan
+
+            values[ndxs] = block_values
+
+        return values
+
+
+def sample_spacing(xs, ys):
+    """
+    Return the median distance between consecutive points,
+    or 0.0 when less than two points are provided.
+
+    :param xs: x coordinates - array-like of floats
+    :param ys: y coordinates - array-like of floats
+    :return: float
+    """
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+
+    if xs.size < 2:
+        return 0.0
+
+    return float(np.median(np.hypot(np.diff(xs), np.diff(ys))))
+
+
+def overview_cellsize(dem_params, cols, rows):
+    """
+    Return the larger cell size of a raster overview.
+
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters of the full resolution raster
+    :param cols: overview columns - int
+    :param rows: overview rows - int
+    :return: float
+    """
+
+    return max(dem_params.cellsizeEW * dem_params.cols / cols,
+               dem_params.cellsizeNS * dem_params.rows / rows)
+
+
+def choose_overview(dem_params, overview_sizes, spacing):
+    """
+    Return the index of the coarsest overview whose cells are not larger than the sample spacing,
+    or None when the full resolution raster is required.
+
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters of the full resolution raster
+    :param overview_sizes: list of (columns, rows) tuples
+    :param spacing: distance between samples, in the raster CRS - float
+    :return: int or None
+    """
+
+    chosen_ndx, chosen_cellsize = None, max(dem_params.cellsizeEW, dem_params.cellsizeNS)
+
+    for ndx, (cols, rows) in enumerate(overview_sizes):
+        cellsize = overview_cellsize(dem_params, cols, rows)
+        if chosen_cellsize < cellsize <= spacing:
+            chosen_ndx, chosen_cellsize = ndx, cellsize
+
+    return chosen_ndx
+
+
+def missing_overview_factors(dem_params, overview_sizes, spacing):
+    """
+    Return the power-of-two decimation factors of the overviews
+    not coarser than the sample spacing that the raster lacks.
+
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters of the full resolution raster
+    :param overview_sizes: list of (columns, rows) tuples
+    :param spacing: distance between samples, in the raster CRS - float
+    :return: list of ints
+    """
+
+    existing_factors = set(int(round(dem_params.cols / cols)) for cols, _ in overview_sizes)
+    cellsize = max(dem_params.cellsizeEW, dem_params.cellsizeNS)
+
+    factors = []
+    factor = 2
+    while cellsize * factor <= spacing and \
+            dem_params.cols // factor > 0 and dem_params.rows // factor > 0:
+        if factor not in existing_factors:
+            factors.append(factor)
+        factor *= 2
+
+    return factors
+
+
+def axis_crossings(starts, ends, origin, cellsize, num_cells):
+    """
+    Find where segments cross the grid lines orthogonal to an axis,
+    i.e. the coordinates origin + k * cellsize, with k in [0, num_cells].
+
+    :param starts: segment start coordinates along the axis - numpy array of floats
+    :param ends: segment end coordinates along the axis - numpy array of floats
+    :param origin: coordinate of the first grid line - float
+    :param cellsize: grid line spacing - float
+    :param num_cells: number of cells along the axis - int
+    :return: tuple of the segment indices (numpy array of ints)
+             and of the crossing parameters in ]0, 1[ (numpy array of floats)
+    """
+
+    with np.errstate(invalid='ignore'):
+        first_lines = np.ceil((np.minimum(starts, ends) - origin) / cellsize)
+        last_lines = np.floor((np.maximum(starts, ends) - origin) / cellsize)
+
+    first_lines = np.clip(np.nan_to_num(first_lines), 0, num_cells).astype(np.int64)
+    last_lines = np.clip(np.nan_to_num(last_lines), -1, num_cells).astype(np.int64)
+
+    num_crossings = np.where(starts != ends, np.maximum(last_lines - first_lines + 1, 0), 0)
+
+    segments = np.repeat(np.arange(starts.size), num_crossings)
+    first_crossings = np.cumsum(num_crossings) - num_crossings
+    lines = first_lines[segments] + np.arange(segments.size) - np.repeat(first_crossings, num_crossings)
+
+    params = (origin + lines * cellsize - starts[segments]) / (ends - starts)[segments]
+
+    inner = (params > 0.0) & (params < 1.0)
+
+    return segments[inner], params[inner]
+
+
+def grid_crossings(xs, ys, dem_params):
+    """
+    Vectorized cell traversal (as in the Amanatides-Woo algorithm) of a polyline through a DEM:
+    find where the line segments cross the cell edges within the DEM extent.
+
+    :param xs: x coordinates of the line vertices, in the DEM CRS - array-like of floats
+    :param ys: y coordinates of the line vertices, in the DEM CRS - array-like of floats
+    :param dem_params: qProf.gis_utils.qgs_tools.QGisRasterParameters
+    :return: tuple of the segment indices (numpy array of ints)
+             and of the crossing parameters in ]0, 1[ along the segments (numpy array of floats),
+             sorted by segment and parameter
+    """
+
+    p = dem_params
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+
+    # rotated grids are traversed in pixel/line coordinates,
+    # where the segment parameters are unchanged
+
+    if p.geotransform is not None:
+        xs, ys = p.geotransform.inverse(xs, ys)
+        x_min, x_max, y_min, y_max = 0.0, float(p.cols), 0.0, float(p.rows)
+        cellsize_x, cellsize_y = 1.0, 1.0
+    else:
+        x_min, x_max, y_min, y_max = p.xMin, p.xMax, p.yMin, p.yMax
+        cellsize_x, cellsize_y = p.cellsizeEW, p.cellsizeNS
+
+    x_starts, x_ends = xs[:-1], xs[1:]
+    y_starts, y_ends = ys[:-1], ys[1:]
+
+    # crossings of the vertical and horizontal cell edges
+
+    x_segments, x_params = axis_crossings(x_starts, x_ends, x_min, cellsize_x, p.cols)
+    y_segments, y_params = axis_crossings(y_starts, y_ends, y_min, cellsize_y, p.rows)
+
+    # retain the crossings within the DEM extent along the other axis
+
+    cross_ys = y_starts[x_segments] + x_params * (y_ends - y_starts)[x_segments]
+    in_dem_x = (y_min <= cross_ys) & (cross_ys <= y_max)
+
+    cross_xs = x_starts[y_segments] + y_params * (x_ends - x_starts)[y_segments]
+    in_dem_y = (x_min <= cross_xs) & (cross_xs <= x_max)
+
+    segments = np.concatenate((x_segments[in_dem_x], y_segments[in_dem_y]))
+    params = np.concatenate((x_params[in_dem_x], y_params[in_dem_y]))
+
+    order = np.lexsort((params, segments))
+
+    return segments[order], params[order]
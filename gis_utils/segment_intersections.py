@@ -0,0 +1,149 @@
+from __future__ import division
+
+import numpy as np
+
+from .spatial_index import GridIndex
+
+
+def multilines_segments(multilines):
+    """
+    Pack the segments of the parts of a set of multilines into coordinate arrays.
+
+    :param multilines: list of qProf.gis_utils.features.MultiLine
+    :return: tuple of segment starts and ends (numpy arrays of floats, shape: N x 2),
+             multiline indices (numpy array of ints) and flags of the last segment
+             of each part (numpy array of bools)
+    """
+
+    xy_arrays = []
+    part_ends = []
+    multiline_ndxs = []
+
+    num_pts = 0
+    for multiline_ndx, multiline in enumerate(multilines):
+        xy_arrays.append(multiline.xyzt[:, :2])
+        part_ends.append(num_pts + multiline.offsets[1:] - 1)
+        multiline_ndxs.append(np.repeat(multiline_ndx, multiline.num_points))
+        num_pts += multiline.num_points
+
+    if num_pts == 0:
+        empty_xy = np.empty((0, 2), dtype=np.float64)
+        return empty_xy, empty_xy, np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+
+    xy = np.vstack(xy_arrays)
+    part_ends = np.concatenate(part_ends)
+    multiline_ndxs = np.concatenate(multiline_ndxs)
+
+    # segments start at every point except the last of each part
+
+    is_start = np.ones(num_pts, dtype=bool)
+    is_start[part_ends] = False
+    start_ndxs = np.flatnonzero(is_start)
+
+    is_last = np.zeros(num_pts, dtype=bool)
+    is_last[part_ends - 1] = True
+
+    return xy[start_ndxs], xy[start_ndxs + 1], multiline_ndxs[start_ndxs], is_last[start_ndxs]
+
+
+def envelope_candidates(a_starts, a_ends, b_starts, b_ends):
+    """
+    Find the pairs of segments with intersecting envelopes,
+    querying a grid index of the envelopes of the second set.
+    Segments of the first set are expected to be few, e.g. those of a profile.
+
+    :param a_starts: numpy array of floats, shape: M x 2
+    :param a_ends: numpy array of floats, shape: M x 2
+    :param b_starts: numpy array of floats, shape: N x 2
+    :param b_ends: numpy array of floats, shape: N x 2
+    :return: tuple of two numpy arrays of ints, with the indices of the paired segments
+    """
+
+    b_index = GridIndex(np.hstack((np.minimum(b_starts, b_ends), np.maximum(b_starts, b_ends))))
+
+    a_mins = np.minimum(a_starts, a_ends)
+    a_maxs = np.maximum(a_starts, a_ends)
+
+    a_ndxs = []
+    b_ndxs = []
+    for a_ndx in range(a_starts.shape[0]):
+        overlapping = b_index.query_envelope(a_mins[a_ndx, 0], a_mins[a_ndx, 1], a_maxs[a_ndx, 0], a_maxs[a_ndx, 1])
+        a_ndxs.append(np.repeat(a_ndx, overlapping.size))
+        b_ndxs.append(overlapping)
+
+    if not a_ndxs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    return np.concatenate(a_ndxs).astype(np.int64), np.concatenate(b_ndxs).astype(np.int64)
+
+
+def segments_intersection_params(a_starts, a_ends, b_starts, b_ends):
+    """
+    Parametric intersections of paired segments: the intersection point is
+    a_start + t * (a_end - a_start) = b_start + u * (b_end - b_start).
+    Parallel segments get NaN parameters.
+
+    :param a_starts: numpy array of floats, shape: N x 2
+    :param a_ends: numpy array of floats, shape: N x 2
+    :param b_starts: numpy array of floats, shape: N x 2
+    :param b_ends: numpy array of floats, shape: N x 2
+    :return: tuple of the t and u numpy arrays of floats
+    """
+
+    r = a_ends - a_starts
+    s = b_ends - b_starts
+    q = b_starts - a_starts
+
+    denominators = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ts = np.where(denominators != 0.0, (q[:, 0] * s[:, 1] - q[:, 1] * s[:, 0]) / denominators, np.nan)
+        us = np.where(denominators != 0.0, (q[:, 0] * r[:, 1] - q[:, 1] * r[:, 0]) / denominators, np.nan)
+
+    return ts, us
+
+
+def line_segments_intersections(line_xy, seg_starts, seg_ends, seg_is_last=None):
+    """
+    Intersect a polyline with a set of segments.
+    Points shared by successive segments are reported once:
+    segments include their end point only when last of the line or of their part.
+
+    :param line_xy: polyline vertices - numpy array of floats, shape: P x 2
+    :param seg_starts: numpy array of floats, shape: N x 2
+    :param seg_ends: numpy array of floats, shape: N x 2
+    :param seg_is_last: flags of the last segment of each part, all True when None - numpy array of bools
+    :return: tuple of distances along the polyline, segment indices, x and y coordinates,
+             as numpy arrays ordered by distance
+    """
+
+    line_starts = line_xy[:-1]
+    line_ends = line_xy[1:]
+
+    line_lengths = np.hypot(line_ends[:, 0] - line_starts[:, 0], line_ends[:, 1] - line_starts[:, 1])
+    line_distances = np.concatenate(([0.0], np.cumsum(line_lengths)))
+
+    line_ndxs, seg_ndxs = envelope_candidates(line_starts, line_ends, seg_starts, seg_ends)
+
+    ts, us = segments_intersection_params(line_starts[line_ndxs], line_ends[line_ndxs],
+                                          seg_starts[seg_ndxs], seg_ends[seg_ndxs])
+
+    line_is_last = line_ndxs == line_starts.shape[0] - 1
+    if seg_is_last is None:
+        seg_is_last = np.ones(seg_starts.shape[0], dtype=bool)
+
+    with np.errstate(invalid='ignore'):
+        valid = (ts >= 0.0) & ((ts < 1.0) | ((ts == 1.0) & line_is_last)) & \
+                (us >= 0.0) & ((us < 1.0) | ((us == 1.0) & seg_is_last[seg_ndxs]))
+
+    line_ndxs = line_ndxs[valid]
+    seg_ndxs = seg_ndxs[valid]
+    ts = ts[valid]
+
+    xs = line_starts[line_ndxs, 0] + ts * (line_ends[line_ndxs, 0] - line_starts[line_ndxs, 0])
+    ys = line_starts[line_ndxs, 1] + ts * (line_ends[line_ndxs, 1] - line_starts[line_ndxs, 1])
+    distances = line_distances[line_ndxs] + ts * line_lengths[line_ndxs]
+
+    order = np.argsort(distances, kind='mergesort')
+
+    return distances[order], seg_ndxs[order], xs[order], ys[order]
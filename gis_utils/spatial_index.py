@@ -0,0 +1,350 @@
+from __future__ import division
+
+import threading
+from math import floor, sqrt
+
+import numpy as np
+
+
+GRID_FEATURES_PER_CELL = 4  # average number of features per grid cell
+GRID_MAX_CELLS_PER_FEATURE = 256  # larger features are checked at every query
+
+
+def point_segment_distances(xs, ys, start, end):
+    """
+    Distances of a set of points from a segment.
+
+    :param xs: numpy array of floats
+    :param ys: numpy array of floats
+    :param start: segment start - (x, y) floats
+    :param end: segment end - (x, y) floats
+    :return: numpy array of floats
+    """
+
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    length_sq = dx * dx + dy * dy
+
+    if length_sq == 0.0:
+        return np.hypot(xs - start[0], ys - start[1])
+
+    params = np.clip(((xs - start[0]) * dx + (ys - start[1]) * dy) / length_sq, 0.0, 1.0)
+
+    return np.hypot(xs - (start[0] + params * dx), ys - (start[1] + params * dy))
+
+
+def segments_point_distances(starts, ends, x, y):
+    """
+    Distances of a point from a set of segments.
+
+    :param starts: segment starts - numpy array of floats, shape: N x 2
+    :param ends: segment ends - numpy array of floats, shape: N x 2
+    :param x: float
+    :param y: float
+    :return: numpy array of floats
+    """
+
+    dxs = ends[:, 0] - starts[:, 0]
+    dys = ends[:, 1] - starts[:, 1]
+    lengths_sq = dxs * dxs + dys * dys
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        params = np.where(lengths_sq > 0.0,
+                          ((x - starts[:, 0]) * dxs + (y - starts[:, 1]) * dys) / lengths_sq,
+                          0.0)
+    params = np.clip(params, 0.0, 1.0)
+
+    return np.hypot(x - (starts[:, 0] + params * dxs), y - (starts[:, 1] + params * dys))
+
+
+def polyline_distances(xs, ys, line_xy):
+    """
+    Distances of a set of points from a polyline.
+
+    :param xs: numpy array of floats
+    :param ys: numpy array of floats
+    :param line_xy: polyline vertices - array-like of floats, shape: N x 2
+    :return: numpy array of floats
+    """
+
+    line_xy = np.asarray(line_xy, dtype=np.float64).reshape(-1, 2)
+
+    if line_xy.shape[0] == 1:
+        return point_segment_distances(xs, ys, line_xy[0], line_xy[0])
+
+    distances = np.empty(np.shape(xs))
+    distances.fill(np.inf)
+    for start, end in zip(line_xy[:-1], line_xy[1:]):
+        distances = np.minimum(distances, point_segment_distances(xs, ys, start, end))
+
+    return distances
+
+
+class GridIndex(object):
+    """
+    Uniform grid index of feature envelopes.
+    Each cell stores the indices of the features whose envelope overlaps it,
+    in a compressed layout (feature indices sorted by cell, plus cell start offsets).
+    """
+
+    def __init__(self, envelopes, cell_size=None):
+        """
+        :param envelopes: feature envelopes, as (x_min, y_min, x_max, y_max) rows - array-like of floats
+        :param cell_size: grid cell size, by default derived from the feature density - float
+        """
+
+        self.envelopes = np.asarray(envelopes, dtype=np.float64).reshape(-1, 4)
+
+        num_features = self.envelopes.shape[0]
+
+        self.centers_x = 0.5 * (self.envelopes[:, 0] + self.envelopes[:, 2])
+        self.centers_y = 0.5 * (self.envelopes[:, 1] + self.envelopes[:, 3])
+        self.half_diagonals = 0.5 * np.hypot(self.envelopes[:, 2] - self.envelopes[:, 0],
+                                             self.envelopes[:, 3] - self.envelopes[:, 1])
+
+        if num_features == 0:
+            self.x_min = self.y_min = 0.0
+            self.cell_size = 1.0
+            self.cols = self.rows = 1
+            self.cell_starts = np.zeros(2, dtype=np.int64)
+            self.cell_features = np.empty(0, dtype=np.int64)
+            self.large_features = np.empty(0, dtype=np.int64)
+            return
+
+        self.x_min = float(self.envelopes[:, 0].min())
+        self.y_min = float(self.envelopes[:, 1].min())
+        width = float(self.envelopes[:, 2].max()) - self.x_min
+        height = float(self.envelopes[:, 3].max()) - self.y_min
+
+        if cell_size is None:
+            # about GRID_FEATURES_PER_CELL features per cell for evenly spread features,
+            # with cells not smaller than the typical feature
+            if width > 0.0 and height > 0.0:
+                cell_size = sqrt(width * height * GRID_FEATURES_PER_CELL / num_features)
+            else:
+                cell_size = max(width, height) * GRID_FEATURES_PER_CELL / num_features
+            feature_sizes = np.maximum(self.envelopes[:, 2] - self.envelopes[:, 0],
+                                       self.envelopes[:, 3] - self.envelopes[:, 1])
+            cell_size = max(cell_size, float(np.median(feature_sizes)))
+
+        # limit the number of cells to about the number of features
+
+        self.cell_size = max(cell_size,
+                             sqrt(width * height / num_features),
+                             max(width, height) / num_features,
+                             1e-12)
+
+        self.cols = int(floor(width / self.cell_size)) + 1
+        self.rows = int(floor(height / self.cell_size)) + 1
+
+        col_mins, row_mins, col_maxs, row_maxs = self._cell_ranges(self.envelopes)
+
+        cells_per_feature = (col_maxs - col_mins + 1) * (row_maxs - row_mins + 1)
+
+        is_large = cells_per_feature > GRID_MAX_CELLS_PER_FEATURE
+        self.large_features = np.flatnonzero(is_large)
+
+        gridded = np.flatnonzero(~is_large)
+        counts = cells_per_feature[gridded]
+
+        # one entry per (feature, covered cell)
+
+        feature_ndxs = np.repeat(gridded, counts)
+        firsts = np.repeat(np.cumsum(counts) - counts, counts)
+        steps = np.arange(feature_ndxs.size) - firsts
+
+        range_cols = np.repeat(col_maxs[gridded] - col_mins[gridded] + 1, counts)
+        cols = np.repeat(col_mins[gridded], counts) + steps % range_cols
+        rows = np.repeat(row_mins[gridded], counts) + steps // range_cols
+
+        cell_ids = rows * self.cols + cols
+
+        order = np.argsort(cell_ids, kind='mergesort')
+        self.cell_features = feature_ndxs[order]
+        self.cell_starts = np.searchsorted(cell_ids[order], np.arange(self.rows * self.cols + 1))
+
+    def _cell_ranges(self, envelopes):
+        """
+        Column and row ranges of the cells overlapped by envelopes, clipped to the grid.
+        """
+
+        def cell_ndxs(values, origin, num_cells):
+            return np.clip(np.floor((values - origin) / self.cell_size), 0, num_cells - 1).astype(np.int64)
+
+        return cell_ndxs(envelopes[:, 0], self.x_min, self.cols), \
+            cell_ndxs(envelopes[:, 1], self.y_min, self.rows), \
+            cell_ndxs(envelopes[:, 2], self.x_min, self.cols), \
+            cell_ndxs(envelopes[:, 3], self.y_min, self.rows)
+
+    @property
+    def num_features(self):
+
+        return self.envelopes.shape[0]
+
+    def query_envelope(self, x_min, y_min, x_max, y_max):
+        """
+        Find the features whose envelope intersects the given one.
+
+        :return: sorted numpy array of feature indices
+        """
+
+        if self.num_features == 0:
+            return np.empty(0, dtype=np.int64)
+
+        (col_min,), (row_min,), (col_max,), (row_max,) = self._cell_ranges(
+            np.array([[x_min, y_min, x_max, y_max]], dtype=np.float64))
+
+        # the cells of a grid row are contiguous in the compressed layout
+
+        chunks = [self.large_features]
+        for row in range(row_min, row_max + 1):
+            start = self.cell_starts[row * self.cols + col_min]
+            end = self.cell_starts[row * self.cols + col_max + 1]
+            chunks.append(self.cell_features[start:end])
+
+        candidates = np.unique(np.concatenate(chunks))
+
+        envelopes = self.envelopes[candidates]
+        overlapping = (envelopes[:, 0] <= x_max) & (envelopes[:, 2] >= x_min) & \
+                      (envelopes[:, 1] <= y_max) & (envelopes[:, 3] >= y_min)
+
+        return candidates[overlapping]
+
+    def query_corridor(self, line_xy, distance):
+        """
+        Find the features that can be within a distance from a polyline.
+        The result may include features whose envelope, but not the geometry,
+        is within the distance; it is exact for point features.
+
+        :param line_xy: polyline vertices - array-like of floats, shape: N x 2
+        :param distance: corridor half-width - float
+        :return: sorted numpy array of feature indices
+        """
+
+        line_xy = np.asarray(line_xy, dtype=np.float64).reshape(-1, 2)
+
+        if line_xy.shape[0] == 1:
+            line_xy = np.vstack((line_xy, line_xy))
+
+        found = []
+        for start, end in zip(line_xy[:-1], line_xy[1:]):
+
+            candidates = self.query_envelope(min(start[0], end[0]) - distance,
+                                             min(start[1], end[1]) - distance,
+                                             max(start[0], end[0]) + distance,
+                                             max(start[1], end[1]) + distance)
+
+            # lower bound of the envelope distance from the segment
+
+            distances = point_segment_distances(self.centers_x[candidates], self.centers_y[candidates],
+                                                start, end) - self.half_diagonals[candidates]
+
+            found.append(candidates[distances <= distance])
+
+        if not found:
+            return np.empty(0, dtype=np.int64)
+
+        return np.unique(np.concatenate(found))
+
+
+class LayerIndex(object):
+    """
+    Records read from a vector layer, with the grid index of their envelopes.
+    """
+
+    def __init__(self, records, envelopes, cell_size=None):
+        """
+        :param records: feature records, in the layer reading order - list
+        :param envelopes: envelopes of the records - array-like of floats, shape: N x 4
+        :param cell_size: grid cell size - float
+        """
+
+        assert len(records) == len(envelopes)
+
+        self.records = records
+        self.grid = GridIndex(envelopes, cell_size)
+
+    def corridor_indices(self, line_xy, distance):
+        """
+        Indices of the records that can be within a distance from a polyline,
+        in the layer reading order.
+
+        :param line_xy: polyline vertices, in the layer CRS - array-like of floats, shape: N x 2
+        :param distance: corridor half-width, in the layer CRS units - float
+        :return: list of ints
+        """
+
+        return self.grid.query_corridor(line_xy, distance).tolist()
+
+    def corridor_records(self, line_xy, distance):
+        """
+        Records that can be within a distance from a polyline, in the layer reading order.
+
+        :param line_xy: polyline vertices, in the layer CRS - array-like of floats, shape: N x 2
+        :param distance: corridor half-width, in the layer CRS units - float
+        :return: list
+        """
+
+        return [self.records[ndx] for ndx in self.corridor_indices(line_xy, distance)]
+
+
+class LayerIndexCache(object):
+    """
+    Layer indices, keyed by layer id and reading options,
+    reused while the layer state is unchanged.
+    """
+
+    def __init__(self):
+
+        self.hits = 0
+        self.misses = 0
+
+        self._indices = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, state, build):
+        """
+        Return the cached index for the key when built with the same layer state,
+        otherwise build and store it.
+        A None state means that the layer state cannot be tracked: the index is not cached.
+
+        :param key: hashable
+        :param state: hashable or None
+        :param build: function returning the LayerIndex
+        :return: LayerIndex
+        """
+
+        if state is not None:
+            with self._lock:
+                cached = self._indices.get(key)
+                if cached is not None and cached[0] == state:
+                    self.hits += 1
+                    return cached[1]
+                self.misses += 1
+
+        layer_index = build()
+
+        if state is not None:
+            with self._lock:
+                self._indices[key] = (state, layer_index)
+
+        return layer_index
+
+    def invalidate(self, layer_id=None):
+        """
+        Remove the indices of a layer, or all indices when layer_id is None.
+
+        :param layer_id: string or None
+        """
+
+        with self._lock:
+            if layer_id is None:
+                self._indices.clear()
+                return
+
+            for key in [key for key in self._indices if key[0] == layer_id]:
+                del self._indices[key]
+
+
+# process-wide cache of the structural layer indices
+layer_indices = LayerIndexCache()
@@ -0,0 +1,151 @@
+from __future__ import division
+
+from math import floor, sqrt
+
+import numpy as np
+
+from ..gsf.geometry import Point
+
+from .rasters import Grid, RectangularDomain
+from .intersections import IntersectionParameters, Intersections, intersection_cells
+from .gdal_utils import open_gdal_raster, read_gdal_band_window
+from .errors import RasterIOException
+
+
+DEFAULT_TILE_BUDGET = 256 * 1024 * 1024  # default memory budget of a tile, in bytes
+
+# bytes per cell of the block read from the DEM (float64 from GDAL)
+READ_BYTES_PER_CELL = 8
+
+# peak number of cell-sized arrays of the calculation dtype while intersecting a tile
+TILE_ARRAYS_PER_CELL = 10
+
+# bytes per cell of the resulting intersection coordinates (two float64 arrays)
+RESULT_BYTES_PER_CELL = 16
+
+MIN_TILE_SIDE = 16  # tile side, in cells, also when the budget is lower
+
+
+def tile_side(tile_budget, dtype):
+    """
+    Side, in cells, of the square tiles whose intersection fits the memory budget,
+    halo included.
+
+    :param tile_budget: memory budget, in bytes - int
+    :param dtype: calculation dtype
+    :return: int
+    """
+
+    bytes_per_cell = READ_BYTES_PER_CELL + RESULT_BYTES_PER_CELL + TILE_ARRAYS_PER_CELL * np.dtype(dtype).itemsize
+
+    return max(int(floor(sqrt(tile_budget / bytes_per_cell))) - 1, MIN_TILE_SIDE)
+
+
+def tile_windows(row_num, col_num, tile_rows, tile_cols):
+    """
+    Windows covering a grid, in row-major order.
+
+    :param row_num: grid rows - int
+    :param col_num: grid columns - int
+    :param tile_rows: tile rows - int
+    :param tile_cols: tile columns - int
+    :return: list of (row_min, row_max, col_min, col_max) tuples, with exclusive max bounds
+    """
+
+    return [(row_min, min(row_min + tile_rows, row_num), col_min, min(col_min + tile_cols, col_num))
+            for row_min in range(0, row_num, tile_rows)
+            for col_min in range(0, col_num, tile_cols)]
+
+
+def tiled_plane_intersections(read_window, row_num, col_num, geotransform, srcPt, srcPlaneAttitude,
+                              tile_budget=DEFAULT_TILE_BUDGET, dtype=None):
+    """
+    Intersect a plane with a DEM read tile by tile, so that the DEM is never fully in memory.
+    Each tile is read with a one-cell halo, the upper row and the right column,
+    needed by the intersections on the segments leaving its border cells:
+    results are the same as intersecting the whole DEM.
+    Intersections are kept per cell, with global row and column indices, so that
+    trace fragments crossing the tile borders are connected when building the networks.
+
+    :param read_window: function reading the DEM cells within inclusive bounds
+                        (row_min, row_max, col_min, col_max), returning a 2D numpy array
+                        with NaN for no-data cells
+    :param row_num: DEM rows - int
+    :param col_num: DEM columns - int
+    :param geotransform: north-up DEM geotransform, in the GDAL six-values format - tuple of floats
+    :param srcPt: point of the plane - Point
+    :param srcPlaneAttitude: plane attitude - GPlane
+    :param tile_budget: memory budget of a tile, in bytes - int
+    :param dtype: calculation dtype, by default that of the read blocks when floating point
+    :return: Intersections
+    """
+
+    x_min, cellsize_x, _, y_max, _, cellsize_y = geotransform
+    cellsize_y = abs(cellsize_y)
+
+    side = tile_side(tile_budget, dtype if dtype is not None else np.float64)
+
+    x_cells = ([], [], [], [])
+    y_cells = ([], [], [], [])
+
+    for row_min, row_max, col_min, col_max in tile_windows(row_num, col_num, side, side):
+
+        halo_row_min = max(row_min - 1, 0)
+        halo_col_max = min(col_max + 1, col_num)
+
+        grid = Grid(grid_data=read_window(halo_row_min, row_max - 1, col_min, halo_col_max - 1), copy_data=False)
+        grid.domain = RectangularDomain(Point(x_min + col_min * cellsize_x, y_max - row_max * cellsize_y),
+                                        Point(x_min + halo_col_max * cellsize_x, y_max - halo_row_min * cellsize_y))
+
+        xcoords_x, xcoords_y, ycoords_x, ycoords_y = grid.intersection_with_surface('plane', srcPt,
+                                                                                   srcPlaneAttitude, dtype)
+        del grid
+
+        # tile core, without the halo cells
+
+        core = (slice(row_min - halo_row_min, None), slice(0, col_max - col_min))
+
+        tile_x_cells, tile_y_cells = intersection_cells(xcoords_x[core], xcoords_y[core],
+                                                        ycoords_x[core], ycoords_y[core],
+                                                        row_min, col_min)
+        del xcoords_x, xcoords_y, ycoords_x, ycoords_y
+
+        for cells, tile_cells in ((x_cells, tile_x_cells), (y_cells, tile_y_cells)):
+            for values, tile_values in zip(cells, tile_cells):
+                values.append(tile_values)
+
+    def concatenated(cells):
+        return tuple(np.concatenate(values) if values else np.empty(0) for values in cells)
+
+    return Intersections.from_cells((row_num, col_num), concatenated(x_cells), concatenated(y_cells))
+
+
+def gdal_plane_intersections(raster_path, srcPt, srcPlaneAttitude, band=1, tile_budget=DEFAULT_TILE_BUDGET,
+                             dtype=None):
+    """
+    Intersect a plane with a DEM file, read tile by tile through GDAL.
+
+    :param raster_path: DEM path - string
+    :param srcPt: point of the plane - Point
+    :param srcPlaneAttitude: plane attitude - GPlane
+    :param band: band number (1-based) - int
+    :param tile_budget: memory budget of a tile, in bytes - int
+    :param dtype: calculation dtype, float64 by default
+    :return: Intersections
+    :raise: RasterIOException
+    """
+
+    dataset = open_gdal_raster(raster_path)
+
+    geotransform = tuple(dataset.GetGeoTransform())
+    if geotransform[2] != 0.0 or geotransform[4] != 0.0:
+        raise RasterIOException("Raster {} is not north-up".format(raster_path))
+
+    def read_window(row_min, row_max, col_min, col_max):
+        return read_gdal_band_window(dataset, row_min, row_max, col_min, col_max, band)
+
+    intersections = tiled_plane_intersections(read_window, dataset.RasterYSize, dataset.RasterXSize, geotransform,
+                                              srcPt, srcPlaneAttitude, tile_budget, dtype)
+    intersections.parameters = IntersectionParameters(raster_path, srcPt, srcPlaneAttitude)
+
+    return intersections
@@ -21,14 +21,20 @@ class Point(object):
     """
     Cartesian point.
     Dimensions: 3D + time
+    Coordinates are stored as plain floats, for fast scalar math.
     """
 
+    __slots__ = ('_x', '_y', '_z', '_t')
+
     def __init__(self, x=np.nan, y=np.nan, z=np.nan, t=np.nan):
         """
         Construct a Point instance given 3 or 4 float values.
         """
 
-        self._p = np.array([x, y, z, t], dtype=np.float64)
+        self._x = float(x)
+        self._y = float(y)
+        self._z = float(z)
+        self._t = float(t)
 
     def __repr__(self):
 
@@ -44,28 +50,23 @@ class Point(object):
           Point(1.0000, 0.0000, 1.0000, nan)
         """
 
-        obj = cls()
-
         assert 3 <= a.size <= 4
-        b = a.astype(np.float64)
-        if b.size == 3:
-            c = np.append(b, [np.nan])
+        if a.size == 3:
+            return cls(a[0], a[1], a[2])
         else:
-            c = b
-        obj._p = c
-        return obj
+            return cls(a[0], a[1], a[2], a[3])
 
     @property
     def v(self):
         """
-        Return values as array
+        Return values as a new array
 
         Example:
           >>> Point(1, 0, 0).v
           array([  1.,   0.,   0.,  nan])
         """
 
-        return self._p
+        return np.array([self._x, self._y, self._z, self._t], dtype=np.float64)
 
     @property
     def x(self):
@@ -77,7 +78,7 @@ class Point(object):
           1.5
         """
 
-        return self.v[0]
+        return self._x
 
     @property
     def y(self):
@@ -88,7 +89,7 @@ class Point(object):
           >>> Point(1.5, 3.0, 1).y
           3.0
         """
-        return self.v[1]
+        return self._y
 
     @property
     def z(self):
@@ -99,7 +100,7 @@ class Point(object):
           >>> Point(1.5, 3.2, 41.).z
           41.0
         """
-        return self.v[2]
+        return self._z
 
     @property
     def t(self):
@@ -110,7 +111,7 @@ class Point(object):
           >>> Point(1.5, 3.2, 41., 22.).t
           22.0
         """
-        return self.v[3]
+        return self._t
 
     def clone(self):
         """
@@ -121,7 +122,7 @@ class Point(object):
           Point(1.0000, 1.0000, 1.0000, nan)
         """
 
-        return Point.from_array(self.v)
+        return Point(self._x, self._y, self._z, self._t)
 
     def __sub__(self, another):
         """Return point difference
@@ -131,7 +132,10 @@ class Point(object):
           Point(0.0000, 0.0000, 0.0000, nan)
         """
 
-        return Point.from_array(self.v - another.v)
+        return Point(self._x - another.x,
+                     self._y - another.y,
+                     self._z - another.z,
+                     self._t - another.t)
 
     def __abs__(self):
         """
@@ -145,7 +149,7 @@ class Point(object):
           13.0
         """
 
-        return sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+        return sqrt(self._x * self._x + self._y * self._y + self._z * self._z)
 
     def dist_3d(self, another):
         """
@@ -159,7 +163,11 @@ class Point(object):
           5.0
         """
 
-        return abs(self - another)
+        dx = self._x - another.x
+        dy = self._y - another.y
+        dz = self._z - another.z
+
+        return sqrt(dx * dx + dy * dy + dz * dz)
 
     def dist_2d(self, another):
         """
@@ -171,7 +179,10 @@ class Point(object):
           5.0
         """
 
-        return sqrt((self.x - another.x) ** 2 + (self.y - another.y) ** 2)
+        dx = self._x - another.x
+        dy = self._y - another.y
+
+        return sqrt(dx * dx + dy * dy)
 
     def coincident(self, another, tolerance=MIN_SEPARATION_THRESHOLD):
         """
@@ -201,7 +212,7 @@ class Point(object):
           Point(1.5000, 2.0000, 2.5000, nan)
        """
 
-        return Point(self.x + sx, self.y + sy, self.z + sz, self.t + st)
+        return Point(self._x + sx, self._y + sy, self._z + sz, self._t + st)
 
     def vect_offset(self, displ_vect):
         """
@@ -212,10 +223,10 @@ class Point(object):
           Point(11.0000, 7.0000, 0.0000, nan)
         """
 
-        return Point(self.x + displ_vect.x,
-                     self.y + displ_vect.y,
-                     self.z + displ_vect.z,
-                     self.t)
+        return Point(self._x + displ_vect.x,
+                     self._y + displ_vect.y,
+                     self._z + displ_vect.z,
+                     self._t)
 
     @property
     def vector(self):
@@ -262,14 +273,19 @@ class Vect(object):
     x axis -> East
     y axis -> North
     z axis -> Up
+    Components are stored as plain floats, for fast scalar math.
     """
 
+    __slots__ = ('_x', '_y', '_z')
+
     def __init__(self, x=np.nan, y=np.nan, z=np.nan):
         """
         Vect constructor
         """
 
-        self._v = np.array([x, y, z], dtype=np.float64)
+        self._x = float(x)
+        self._y = float(y)
+        self._z = float(z)
 
     @classmethod
     def from_array(cls, a):
@@ -281,24 +297,20 @@ class Vect(object):
           Vect(1.0000, 0.0000, 1.0000)
         """
 
-        obj = cls()
-
         assert a.size == 3
-        b = a.astype(np.float64)
-        obj._v = b
-        return obj
+        return cls(a[0], a[1], a[2])
 
     @property
     def v(self):
         """
-        Return the vector values as array
+        Return the vector values as a new array
 
         Example:
           >>> Vect(1, 1, 0).v
           array([ 1.,  1.,  0.])
         """
 
-        return self._v
+        return np.array([self._x, self._y, self._z], dtype=np.float64)
 
     @property
     def x(self):
@@ -310,7 +322,7 @@ class Vect(object):
           1.0
         """
 
-        return self.v[0]
+        return self._x
 
     @property
     def y(self):
@@ -322,7 +334,7 @@ class Vect(object):
           2.0
         """
 
-        return self.v[1]
+        return self._y
 
     @property
     def z(self):
@@ -334,7 +346,7 @@ class Vect(object):
           0.0
         """
 
-        return self.v[2]
+        return self._z
 
     def __sub__(self, another):
         """
@@ -347,7 +359,9 @@ class Vect(object):
           Vect(-7.0000, -2.0000, 3.0000)
         """
 
-        return Vect.from_array(self.v - another.v)
+        return Vect(self._x - another.x,
+                    self._y - another.y,
+                    self._z - another.z)
 
     def __eq__(self, another):
         """
@@ -385,7 +399,9 @@ class Vect(object):
           Vect(0.0000, 0.0000, 0.0000)
         """
 
-        return Vect.from_array(self.v + another.v)
+        return Vect(self._x + another.x,
+                    self._y + another.y,
+                    self._z + another.z)
 
     def clone(self):
         """
@@ -395,14 +411,14 @@ class Vect(object):
           >>> Vect(1, 1, 1).clone()
           Vect(1.0000, 1.0000, 1.0000)
         """
-        return Vect.from_array(self.v)
+        return Vect(self._x, self._y, self._z)
 
     def __abs__(self):
         """
         Vector magnitude.
         """
 
-        return sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+        return sqrt(self._x * self._x + self._y * self._y + self._z * self._z)
 
     @property
     def len_2d(self):
@@ -414,7 +430,7 @@ class Vect(object):
           5.0
         """
 
-        return sqrt(self.x * self.x + self.y * self.y)
+        return sqrt(self._x * self._x + self._y * self._y)
 
     @property
     def len_3d(self):
@@ -423,7 +439,7 @@ class Vect(object):
 
         """
 
-        return sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+        return sqrt(self._x * self._x + self._y * self._y + self._z * self._z)
 
     def scale(self, scale_factor):
         """
@@ -434,7 +450,9 @@ class Vect(object):
           Vect(2.5000, 0.0000, 2.5000)
         """
 
-        return Vect.from_array(self.v * scale_factor)
+        return Vect(self._x * scale_factor,
+                    self._y * scale_factor,
+                    self._z * scale_factor)
 
     @property
     def versor_full(self):
@@ -663,7 +681,7 @@ class Vect(object):
           -1.0
         """
 
-        return self.x * another.x + self.y * another.y + self.z * another.z
+        return self._x * another.x + self._y * another.y + self._z * another.z
 
     def cos_angle(self, another):
         """
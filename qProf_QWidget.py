@@ -5,18 +5,21 @@ import unicodedata
 
 from qgis.core import QgsGeometry, QgsVectorLayer
 
-from .gsf.geometry import Plane, GPlane, GAxis
+from .gsf.geometry import Plane, GPlane
 from .gsf.array_utils import to_float
 
-from .gis_utils.features import Segment, MultiLine, Line, \
-    merge_line, merge_lines, ParamLine3D, xytuple_list_to_Line
-from .gis_utils.intersections import map_struct_pts_on_section, calculate_distance_with_sign
+from .gis_utils.features import Segment, Line, \
+    merge_line, merge_lines, xytuple_list_to_Line
+from .gis_utils.intersections import map_struct_pts_on_section, project_multilines_on_section
 from .gis_utils.profile import GeoProfilesSet, GeoProfile, topoprofiles_from_dems, topoprofiles_from_gpxfile, \
-    intersect_with_dem, calculate_profile_lines_intersection, intersection_distances_by_profile_start_list, \
-    extract_multiline2d_list, profile_polygon_intersection, calculate_projected_3d_pts
+    intersect_with_dem, profile_lines_intersections, profile_path_in_crs, \
+    extract_multiline2d_list, profile_polygon_intersection, structural_pts_in_crs, structural_pts_3d, \
+    section_corridor_indices, multilines_section_distances, distances_along_profile
 from .gis_utils.qgs_tools import *
 from .gis_utils.statistics import get_statistics
+from .gis_utils.sampling import NODATA_PROPAGATE, NODATA_RENORMALIZE
 from .gis_utils.errors import VectorInputException, VectorIOException
+from .gis_utils.pipeline import StagedPipeline
 
 from .qt_utils.filesystem import update_directory_key, new_file_path, old_file_path
 from .qt_utils.tools import info, warn, error, update_ComboBox
@@ -55,6 +58,9 @@ class qprof_QWidget(QWidget):
 
         self.demline_source = "demline"
         self.gpxfile_source = "gpxfile"
+        self.profile_sampling_modes = ["fixed distance", "DEM cell crossings"]
+        self.nodata_policies = [(NODATA_PROPAGATE, "set to no-data"),
+                                (NODATA_RENORMALIZE, "use valid neighbours")]
         self.digitized_profile_line2dt = None
         self.polygon_classification_colors = None
 
@@ -65,6 +71,11 @@ class qprof_QWidget(QWidget):
         self.plane_attitudes_colors = []
         #self.curve_colors = []
 
+        # memoized stages of the structural points projection
+        self.struct_point_pipeline = StagedPipeline("structural points projection",
+                                                    ['layer fetch', 'reprojection', 'z sampling', 'section mapping',
+                                                     'plotting'])
+
         self.setup_gui()
 
     def setup_gui(self):
@@ -134,20 +145,24 @@ class qprof_QWidget(QWidget):
                 try:
                     selected_dems = self.selected_dems
                     selected_dem_parameters = self.selected_dem_parameters
+                    parallel_dem_sampling = self.parallel_dem_sampling
                 except Exception as e:
                     warn(self,
                          self.plugin_name,
                          "Input DEMs definition not correct")
                     return
 
-                try:
-                    sample_distance = float(self.qledProfileDensifyDistance.text())
-                    assert sample_distance > 0.0
-                except Exception as e:
-                    warn(self,
-                         self.plugin_name,
-                         "Sample distance value not correct: {}".format(e.message))
-                    return
+                cell_crossings_sampling = self.qcmbxProfileSampling.currentIndex() == 1
+
+                if not cell_crossings_sampling:  # DEM cell crossings do not use the densify distance
+                    try:
+                        sample_distance = float(self.qledProfileDensifyDistance.text())
+                        assert sample_distance > 0.0
+                    except Exception as e:
+                        warn(self,
+                             self.plugin_name,
+                             "Sample distance value not correct: {}".format(e.message))
+                        return
 
                 if self.qcbxDigitizeLineSource.isChecked():
                     if self.digitized_profile_line2dt is None or \
@@ -197,6 +212,9 @@ class qprof_QWidget(QWidget):
             # calculates profiles
 
             invert_profile = self.qcbxInvertProfile.isChecked()
+            nodata_policy = self.nodata_policies[self.qcmbxNoDataPolicy.currentIndex()][0]
+            use_dem_overviews = self.qcbxUseDEMOverviews.isChecked()
+            build_dem_overviews = use_dem_overviews and self.qcbxBuildDEMOverviews.isChecked()
 
             if topo_source_type == self.demline_source:  # sources are DEM(s) and line
 
@@ -208,7 +226,12 @@ class qprof_QWidget(QWidget):
                                                                sample_distance,
                                                                selected_dems,
                                                                selected_dem_parameters,
-                                                               invert_profile)
+                                                               invert_profile,
+                                                               parallel_dem_sampling,
+                                                               use_dem_overviews,
+                                                               build_dem_overviews,
+                                                               cell_crossings_sampling,
+                                                               nodata_policy)
                     except Exception as e:
                          warn(self,
                              self.plugin_name,
@@ -224,7 +247,10 @@ class qprof_QWidget(QWidget):
                     geoprofile = GeoProfile()
                     geoprofile.source_data_type = topo_source_type
                     geoprofile.original_line = profile_line
-                    geoprofile.sample_distance = sample_distance
+                    if cell_crossings_sampling:  # largest spacing of the cell crossings, for the later densifications
+                        geoprofile.sample_distance = float(np.max(np.diff(topo_profiles.profile_s)))
+                    else:
+                        geoprofile.sample_distance = sample_distance
                     geoprofile.set_topo_profiles(topo_profiles)
 
                     self.input_geoprofiles.append(geoprofile)
@@ -296,7 +322,7 @@ class qprof_QWidget(QWidget):
 
             def get_dem_parameters(dem):
 
-                return QGisRasterParameters(*raster_qgis_params(dem))
+                return rotated_raster_params(dem, QGisRasterParameters(*raster_qgis_params(dem)))
 
             def get_selected_dems_params(dialog):
 
@@ -310,6 +336,7 @@ class qprof_QWidget(QWidget):
 
             self.selected_dems = None
             self.selected_dem_parameters = []
+            self.parallel_dem_sampling = False
 
             current_raster_layers = loaded_monoband_raster_layers()
             if len(current_raster_layers) == 0:
@@ -322,6 +349,8 @@ class qprof_QWidget(QWidget):
 
             if dialog.exec_():
                 selected_dems = get_selected_dems_params(dialog)
+                use_dem_mirrors = dialog.qcbxUseDEMMirrors.isChecked()
+                self.parallel_dem_sampling = dialog.qcbxParallelDEMSampling.isChecked()
             else:
                 warn(self,
                      self.plugin_name,
@@ -336,10 +365,28 @@ class qprof_QWidget(QWidget):
             else:
                 self.selected_dems = selected_dems
 
+            # discard raster blocks cached from previous versions of the DEMs
+
+            for dem in selected_dems:
+                invalidate_raster_cache(dem)
+
             # get geodata
 
             self.selected_dem_parameters = [get_dem_parameters(dem) for dem in selected_dems]
 
+            # set memory-mapped on-disk copies of the DEMs
+
+            for dem, dem_params in zip(self.selected_dems, self.selected_dem_parameters):
+                if use_dem_mirrors:
+                    try:
+                        register_dem_mirror(dem, dem_params)
+                    except Exception as e:
+                        warn(self,
+                             self.plugin_name,
+                             "Unable to create on-disk copy of {}: {}".format(dem.name(), e))
+                else:
+                    unregister_dem_mirror(dem)
+
             # get DEMs resolutions in project CRS and choose the min value
 
             dem_resolutions_prj_crs_list = []
@@ -807,7 +854,29 @@ class qprof_QWidget(QWidget):
         # trace sampling spat_distance
         qlytInputLine.addWidget(QLabel(self.tr("line densify distance")), 3, 0, 1, 1)
         self.qledProfileDensifyDistance = QLineEdit()
-        qlytInputLine.addWidget(self.qledProfileDensifyDistance, 3, 1, 1, 3)
+        qlytInputLine.addWidget(self.qledProfileDensifyDistance, 3, 1, 1, 1)
+        self.qcmbxProfileSampling = QComboBox()
+        self.qcmbxProfileSampling.insertItems(0, self.profile_sampling_modes)
+        self.qcmbxProfileSampling.setToolTip(self.tr("Sample DEMs at the densify distance\n"
+                                                     "or at each crossing of the DEM cell edges"))
+        qlytInputLine.addWidget(self.qcmbxProfileSampling, 3, 2, 1, 2)
+
+        # DEM overviews for sample distances larger than the DEM cells
+        self.qcbxUseDEMOverviews = QCheckBox(self.tr("use DEM overviews"))
+        self.qcbxUseDEMOverviews.setToolTip(self.tr("Sample the coarsest DEM overview\n"
+                                                    "with cells not larger than the densify distance"))
+        qlytInputLine.addWidget(self.qcbxUseDEMOverviews, 4, 0, 1, 2)
+        self.qcbxBuildDEMOverviews = QCheckBox(self.tr("build missing overviews"))
+        qlytInputLine.addWidget(self.qcbxBuildDEMOverviews, 4, 2, 1, 2)
+
+        # interpolation with DEM no-data cells
+        qlytInputLine.addWidget(QLabel(self.tr("samples near no-data cells")), 5, 0, 1, 1)
+        self.qcmbxNoDataPolicy = QComboBox()
+        self.qcmbxNoDataPolicy.insertItems(0, [label for _, label in self.nodata_policies])
+        self.qcmbxNoDataPolicy.setToolTip(self.tr("Samples with no-data cells among their interpolation cells\n"
+                                                  "can be set to no-data or interpolated\n"
+                                                  "with the weights renormalized over the valid cells"))
+        qlytInputLine.addWidget(self.qcmbxNoDataPolicy, 5, 1, 1, 3)
 
         qgbxInputLine.setLayout(qlytInputLine)
 
@@ -958,6 +1027,11 @@ class qprof_QWidget(QWidget):
         self.qcbxProjPointDipAngFld = QComboBox()
         qlytXsInputPointProj.addWidget(self.qcbxProjPointDipAngFld, 1, 6, 1, 1)
 
+        qlytXsInputPointProj.addWidget(QLabel("Max distance from section"), 3, 0, 1, 2)
+        self.project_point_max_distance_lineedit = QLineEdit()
+        self.project_point_max_distance_lineedit.setPlaceholderText("no limit")
+        qlytXsInputPointProj.addWidget(self.project_point_max_distance_lineedit, 3, 2, 1, 2)
+
         qgbxXsInputPointProj.setLayout(qlytXsInputPointProj)
         qlytXsPointProj.addWidget(qgbxXsInputPointProj)
 
@@ -1076,6 +1150,11 @@ class qprof_QWidget(QWidget):
         self.project_line_densify_distance_lineedit = QLineEdit()
         xs_input_line_proj_Layout.addWidget(self.project_line_densify_distance_lineedit, 2, 1, 1, 3)
 
+        xs_input_line_proj_Layout.addWidget(QLabel("Max distance from section"), 3, 0, 1, 1)
+        self.project_line_max_distance_lineedit = QLineEdit()
+        self.project_line_max_distance_lineedit.setPlaceholderText("no limit")
+        xs_input_line_proj_Layout.addWidget(self.project_line_max_distance_lineedit, 3, 1, 1, 3)
+
         self.flds_prj_line_comboBoxes = [self.id_fld_line_prj_comboBox]
 
         xs_input_line_proj_QGroupBox.setLayout(xs_input_line_proj_Layout)
@@ -1893,22 +1972,17 @@ class qprof_QWidget(QWidget):
 
     def reset_lineaments_intersections(self):
 
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        if geoprofile is not None:
+        for geoprofile in self.input_geoprofiles.geoprofiles:
             geoprofile.lineaments = []
 
     def reset_polygon_intersections(self):
 
-        try:
-            geoprofile = self.input_geoprofiles.geoprofile(0)
-            if geoprofile is not None:
-                geoprofile.outcrops = []
-        except:
-            pass
+        for geoprofile in self.input_geoprofiles.geoprofiles:
+            geoprofile.outcrops = []
 
     def check_intersection_polygon_inputs(self):
 
-        if not self.check_for_struc_process():
+        if not self.check_for_struc_process(single_segment_constrain=False):
             return False
 
         # polygon layer with parameter fields
@@ -1923,7 +1997,7 @@ class qprof_QWidget(QWidget):
 
     def check_intersection_line_inputs(self):
 
-        if not self.check_for_struc_process():
+        if not self.check_for_struc_process(single_segment_constrain=False):
             return False
 
         # line structural layer with parameter fields
@@ -1942,13 +2016,10 @@ class qprof_QWidget(QWidget):
         if not self.check_intersection_polygon_inputs():
             return
 
-        # get dem parameters
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        demLayer = geoprofile.profile_elevations.dem_params[0].layer
-        demParams = geoprofile.profile_elevations.dem_params[0].params
-
-        # profile line2d, in project CRS and densified
-        profile_line2d_prjcrs_densif = geoprofile.original_line.densify_2d_line(geoprofile.sample_distance)
+        # get dem parameters, shared by all the profiles
+        geoprofiles = self.input_geoprofiles.geoprofiles
+        demLayer = geoprofiles[0].profile_elevations.dem_params[0].layer
+        demParams = geoprofiles[0].profile_elevations.dem_params[0].params
 
         # polygon layer
         intersection_polygon_qgis_ndx = self.inters_input_polygon_comboBox.currentIndex() - 1  # minus 1 to account for initial text in combo box
@@ -1958,67 +2029,89 @@ class qprof_QWidget(QWidget):
 
         on_the_fly_projection, project_crs = get_on_the_fly_projection(self.canvas)
 
-        if on_the_fly_projection and polygon_layer_crs != project_crs:
-            profile_line2d_polycrs_densif = profile_line2d_prjcrs_densif.crs_project(project_crs,
-                                                                                     polygon_layer_crs)
-        else:
-            profile_line2d_polycrs_densif = profile_line2d_prjcrs_densif
+        # intersections of each profile with the polygons, in the project CRS
 
-        profile_qgsgeometry = QgsGeometry.fromPolyline(
-            [QgsPoint(pt2d.x, pt2d.y) for pt2d in profile_line2d_polycrs_densif.pts])
+        profiles_intersections = []
+        for geoprofile in geoprofiles:
 
-        success, return_data = profile_polygon_intersection(profile_qgsgeometry,
-                                                            polygon_layer,
-                                                            inters_polygon_classifaction_field_ndx)
+            # profile line2d, in project CRS and densified
+            profile_line2d_prjcrs_densif = geoprofile.original_line.densify_2d_line(geoprofile.sample_distance)
 
-        if not success:
-            error(self,
-                  self.plugin_name,
-                  return_data)
-            return
+            if on_the_fly_projection and polygon_layer_crs != project_crs:
+                profile_line2d_polycrs_densif = profile_line2d_prjcrs_densif.crs_project(project_crs,
+                                                                                         polygon_layer_crs)
+            else:
+                profile_line2d_polycrs_densif = profile_line2d_prjcrs_densif
+
+            profile_qgsgeometry = QgsGeometry.fromPolyline(
+                [QgsPoint(x, y) for x, y in profile_line2d_polycrs_densif.xyzt[:, :2]])
+
+            success, return_data = profile_polygon_intersection(profile_qgsgeometry,
+                                                                polygon_layer,
+                                                                inters_polygon_classifaction_field_ndx)
+
+            if not success:
+                error(self,
+                      self.plugin_name,
+                      return_data)
+                return
 
-        lIntersectPolylinePolygonCrs = return_data
+            lIntersectPolylinePolygonCrs = return_data
 
-        if len(lIntersectPolylinePolygonCrs) == 0:
+            # transform polyline intersections into prj crs line2d & classification list
+            lIntersLine2dPrjCrs = []
+            for intersection_polyline_polygon_crs in lIntersectPolylinePolygonCrs:
+                rec_classification, xy_tuple_list = intersection_polyline_polygon_crs
+                intersection_polygon_crs_line2d = xytuple_list_to_Line(xy_tuple_list)
+                if on_the_fly_projection and polygon_layer_crs != project_crs:
+                    intersection_prj_crs_line2d = intersection_polygon_crs_line2d.crs_project(polygon_layer_crs,
+                                                                                              project_crs)
+                else:
+                    intersection_prj_crs_line2d = intersection_polygon_crs_line2d
+                lIntersLine2dPrjCrs.append([rec_classification, intersection_prj_crs_line2d])
+
+            profiles_intersections.append(lIntersLine2dPrjCrs)
+
+        if not any(profiles_intersections):
             warn(self,
                  self.plugin_name,
                  "No intersection found")
             return
 
-        # transform polyline intersections into prj crs line2d & classification list
-        lIntersLine2dPrjCrs = []
-        for intersection_polyline_polygon_crs in lIntersectPolylinePolygonCrs:
-            rec_classification, xy_tuple_list = intersection_polyline_polygon_crs
-            intersection_polygon_crs_line2d = xytuple_list_to_Line(xy_tuple_list)
-            if on_the_fly_projection and polygon_layer_crs != project_crs:
-                intersection_prj_crs_line2d = intersection_polygon_crs_line2d.crs_project(polygon_layer_crs,
-                                                                                          project_crs)
-            else:
-                intersection_prj_crs_line2d = intersection_polygon_crs_line2d
-            lIntersLine2dPrjCrs.append([rec_classification, intersection_prj_crs_line2d])
+        # create Point lists from intersection with source DEM,
+        # sampled at once for the intersections of all the profiles
 
-        # create Point lists from intersection with source DEM
+        lIntersPts = [Point(x, y) for lIntersLine2dPrjCrs in profiles_intersections for _, line2d in lIntersLine2dPrjCrs
+                      for x, y in line2d.xyzt[:, :2]]
+        lIntersPts3d = intersect_with_dem(demLayer, demParams, on_the_fly_projection, project_crs, lIntersPts)
 
         polygon_classification_set = set()
-        sect_pt_1, sect_pt_2 = geoprofile.original_line.pts
-        formation_list = []
-        intersection_line3d_list = []
-        intersection_polygon_s_list2 = []
-        for polygon_classification, line2d in lIntersLine2dPrjCrs:
-            polygon_classification_set.add(polygon_classification)
+        profiles_outcrops = []
+        first_pt_ndx = 0
+        for geoprofile, lIntersLine2dPrjCrs in zip(geoprofiles, profiles_intersections):
 
-            lptIntersPts3d = intersect_with_dem(demLayer, demParams, on_the_fly_projection, project_crs, line2d.pts)
-            lineIntersectionLine3d = Line(lptIntersPts3d)
+            formation_list = []
+            intersection_line3d_list = []
+            intersection_polygon_s_list2 = []
+            for polygon_classification, line2d in lIntersLine2dPrjCrs:
+                polygon_classification_set.add(polygon_classification)
 
-            s0_list = lineIntersectionLine3d.incremental_length_2d()
-            s_start = sect_pt_1.dist_2d(lineIntersectionLine3d.pts[0])
-            s_list = [s + s_start for s in s0_list]
+                last_pt_ndx = first_pt_ndx + line2d.num_pts
+                lineIntersectionLine3d = Line(lIntersPts3d[first_pt_ndx:last_pt_ndx])
+                first_pt_ndx = last_pt_ndx
 
-            formation_list.append(polygon_classification)
-            intersection_line3d_list.append(lineIntersectionLine3d)
-            intersection_polygon_s_list2.append(s_list)
+                # distances along the profile, as for the line intersections
+                s_list = distances_along_profile(geoprofile.original_line,
+                                                 lineIntersectionLine3d.x_array(),
+                                                 lineIntersectionLine3d.y_array()).tolist()
 
-        if len(intersection_polygon_s_list2) == 0:
+                formation_list.append(polygon_classification)
+                intersection_line3d_list.append(lineIntersectionLine3d)
+                intersection_polygon_s_list2.append(s_list)
+
+            profiles_outcrops.append((formation_list, intersection_line3d_list, intersection_polygon_s_list2))
+
+        if not any(intersection_polygon_s_list2 for _, _, intersection_polygon_s_list2 in profiles_outcrops):
             warn(self,
                  self.plugin_name,
                  "No reprojected intersection")
@@ -2046,7 +2139,9 @@ class qprof_QWidget(QWidget):
         else:
             self.polygon_classification_colors = None
 
-        geoprofile.add_intersections_lines(formation_list, intersection_line3d_list, intersection_polygon_s_list2)
+        for geoprofile, (formation_list, intersection_line3d_list, intersection_polygon_s_list2) in \
+                zip(geoprofiles, profiles_outcrops):
+            geoprofile.add_intersections_lines(formation_list, intersection_line3d_list, intersection_polygon_s_list2)
 
         # plot profiles
         plot_addit_params = dict()
@@ -2081,10 +2176,10 @@ class qprof_QWidget(QWidget):
         # get color for projected points
         color = qcolor2rgbmpl(self.inters_line_point_color_QgsColorButtonV2.color())
 
-        # get dem parameters
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        demLayer = geoprofile.profile_elevations.dem_params[0].layer
-        demParams = geoprofile.profile_elevations.dem_params[0].params
+        # get dem parameters, shared by all the profiles
+        geoprofiles = self.input_geoprofiles.geoprofiles
+        demLayer = geoprofiles[0].profile_elevations.dem_params[0].layer
+        demParams = geoprofiles[0].profile_elevations.dem_params[0].params
 
         # get line structural layer
         intersection_line_qgis_ndx = self.inters_input_line_comboBox.currentIndex() - 1  # minus 1 to account for initial text in combo box
@@ -2097,33 +2192,62 @@ class qprof_QWidget(QWidget):
 
         on_the_fly_projection, project_crs = get_on_the_fly_projection(self.canvas)
 
-        # read structural line values
+        # the structural lines whose envelope is crossed by each profile
+        line_index = line_layer_index(structural_line_layer)
+        profiles_candidate_ndxs = []
+        for geoprofile in geoprofiles:
+            profile_layer_crs_xy, corridor_tolerance = profile_path_in_crs(geoprofile.original_line,
+                                                                           geoprofile.sample_distance,
+                                                                           on_the_fly_projection,
+                                                                           project_crs,
+                                                                           structural_line_layer.crs())
+            profiles_candidate_ndxs.append(line_index.corridor_indices(profile_layer_crs_xy, corridor_tolerance))
+
+        # read each structural line once, also when crossed by more profiles
+        candidate_ndxs = sorted(set(ndx for profile_candidate_ndxs in profiles_candidate_ndxs
+                                    for ndx in profile_candidate_ndxs))
+        candidate_positions = dict((ndx, position) for position, ndx in enumerate(candidate_ndxs))
+
         if intersection_line_id_field_ndx == -1:
             id_list = None
         else:
-            id_list = field_values(structural_line_layer, intersection_line_id_field_ndx)
+            layer_id_list = field_values(structural_line_layer, intersection_line_id_field_ndx)
+            id_list = [layer_id_list[ndx] for ndx in candidate_ndxs]
 
         line_proj_crs_MultiLine2D_list = extract_multiline2d_list(structural_line_layer, on_the_fly_projection,
-                                                                       project_crs)
+                                                                  project_crs,
+                                                                  [line_index.records[ndx] for ndx in candidate_ndxs])
+
+        # intersections of each profile, sorted by distance from profile start point along the profile
+        profiles_intersections = []
+        for geoprofile, profile_candidate_ndxs in zip(geoprofiles, profiles_candidate_ndxs):
+            positions = [candidate_positions[ndx] for ndx in profile_candidate_ndxs]
+            profiles_intersections.append(
+                profile_lines_intersections([line_proj_crs_MultiLine2D_list[position] for position in positions],
+                                            None if id_list is None else [id_list[position] for position in positions],
+                                            geoprofile.original_line))
+
+        # create CartesianPoint from intersection with source DEM,
+        # sampled at once for the intersections of all the profiles
+        lstIntersectionPoints = [Point(x, y) for _, _, intersection_xs, intersection_ys in profiles_intersections
+                                 for x, y in zip(intersection_xs, intersection_ys)]
+        lstIntersectionPoints3d = intersect_with_dem(demLayer, demParams, on_the_fly_projection, project_crs,
+                                                            lstIntersectionPoints)
 
-        # calculated Point intersection list
-        intersection_point_id_list = calculate_profile_lines_intersection(line_proj_crs_MultiLine2D_list,
-                                                                          id_list,
-                                                                          geoprofile.original_line)
+        first_pt_ndx = 0
+        for geoprofile, (intersection_distances, lstIntersectionIds, intersection_xs, _) in \
+                zip(geoprofiles, profiles_intersections):
 
-        # sort intersection points by spat_distance from profile start point
-        lstDistancesFromProfileStart = intersection_distances_by_profile_start_list(geoprofile.original_line,
-                                                                                         intersection_point_id_list)
+            last_pt_ndx = first_pt_ndx + len(intersection_xs)
+            lstProfileIntersectionPoints3d = lstIntersectionPoints3d[first_pt_ndx:last_pt_ndx]
+            first_pt_ndx = last_pt_ndx
 
-        # create CartesianPoint from intersection with source DEM
-        lstIntersectionPoints = [pt2d for pt2d, _ in intersection_point_id_list]
-        lstIntersectionIds = [id for _, id in intersection_point_id_list]
-        lstIntersectionPoints3d = intersect_with_dem(demLayer, demParams, on_the_fly_projection, project_crs,
-                                                            lstIntersectionPoints)
-        lstIntersectionColors = [color] * len(lstIntersectionPoints)
+            lstDistancesFromProfileStart = intersection_distances.tolist()
+            lstIntersectionColors = [color] * len(lstProfileIntersectionPoints3d)
 
-        geoprofile.add_intersections_pts(
-            zip(lstDistancesFromProfileStart, lstIntersectionPoints3d, lstIntersectionIds, lstIntersectionColors))
+            geoprofile.add_intersections_pts(
+                zip(lstDistancesFromProfileStart, lstProfileIntersectionPoints3d, lstIntersectionIds,
+                    lstIntersectionColors))
 
         # plot profiles
 
@@ -2137,6 +2261,7 @@ class qprof_QWidget(QWidget):
                                           plot_addit_params)
         self.profile_windows.append(profile_window)
 
+
     def struct_point_refresh_lyr_combobox(self):
 
         self.pointLayers = loaded_point_layers()
@@ -2216,9 +2341,11 @@ class qprof_QWidget(QWidget):
 
         return [combobox.currentText() for combobox in combobox_list]
 
-    def calculate_section_data(self):
+    def calculate_section_data(self, geoprofile=None):
+
+        if geoprofile is None:
+            geoprofile = self.input_geoprofiles.geoprofile(0)
 
-        geoprofile = self.input_geoprofiles.geoprofile(0)
         sect_pt_1, sect_pt_2 = geoprofile.original_line.pts
 
         section_init_pt = Point(sect_pt_1.x, sect_pt_1.y, 0.0)
@@ -2264,36 +2391,66 @@ class qprof_QWidget(QWidget):
         if not check_post_profile():
             return False
 
-        # check that just one profile is set
+        # structural data are processed for all the profiles of the set
+
+        geoprofiles = self.input_geoprofiles.geoprofiles
 
-        if self.input_geoprofiles.geoprofiles_num != 1:
+        if len(geoprofiles) == 0:
             warn(self,
                  self.plugin_name,
-                 "Profile lines must be one and just one")
+                 "Profile lines not defined")
             return False
 
+        for ndx, geoprofile in enumerate(geoprofiles):
+
+            profile_label = "profile" if len(geoprofiles) == 1 else "profile %d" % (ndx + 1)
+
+            # check that section is made up of only two points
 
-        geoprofile = self.input_geoprofiles.geoprofile(0)
+            if single_segment_constrain:
+                if geoprofile.original_line.num_pts != 2:
+                    warn(self,
+                         self.plugin_name,
+                         "For projection, %s must be made up by just two points" % profile_label)
+                    return False
 
-        # check that section is made up of only two points
+            # check that source dem is just one
 
-        if single_segment_constrain:
-            if geoprofile.original_line.num_pts != 2:
+            if len(geoprofile.profile_elevations.profile_s3ds) != 1:
                 warn(self,
                      self.plugin_name,
-                     "For projection, profile must be made up by just two points")
+                     "One (and only) topographic surface has to be used in the %s section" % profile_label)
                 return False
 
-        # check that source dem is just one
+        # the DEM is sampled once for all the profiles
 
-        if len(geoprofile.profile_elevations.profile_s3ds) != 1:
+        dem_layer_ids = set(geoprofile.profile_elevations.dem_params[0].layer.id() for geoprofile in geoprofiles
+                            if geoprofile.profile_elevations.dem_params)
+        if len(dem_layer_ids) > 1:
             warn(self,
                  self.plugin_name,
-                 "One (and only) topographic surface has to be used in the profile section")
+                 "All the profiles have to use the same topographic surface")
             return False
 
         return True
 
+    def section_max_distance(self, max_distance_lineedit):
+        """
+        Maximum distance from the section of the structural data to project,
+        in the project CRS units, or None when not set (no limit).
+        Raises ValueError for non-numeric or not positive values.
+        """
+
+        max_distance_text = unicode(max_distance_lineedit.text()).strip()
+        if not max_distance_text:
+            return None
+
+        max_distance = float(max_distance_text)
+        if not max_distance > 0.0:
+            raise ValueError("Max distance from section must be larger than zero")
+
+        return max_distance
+
     def check_struct_point_proj_parameters(self):
 
         if not self.check_for_struc_process():
@@ -2307,6 +2464,14 @@ class qprof_QWidget(QWidget):
                  "No defined point layer for structural data")
             return False
 
+        try:
+            self.section_max_distance(self.project_point_max_distance_lineedit)
+        except ValueError:
+            warn(self,
+                 self.plugin_name,
+                 "Max distance from section must be empty or a positive number")
+            return False
+
         return True
 
     def create_struct_point_projection(self):
@@ -2323,74 +2488,157 @@ class qprof_QWidget(QWidget):
         structural_layer_crs = structural_layer.crs()
         structural_field_list = self.get_current_combobox_values(self.flds_prj_point_comboBoxes)
         isRHRStrike = self.qrbtPlotPrjUseRhrStrike.isChecked()
+        max_distance = self.section_max_distance(self.project_point_max_distance_lineedit)
 
-        # retrieve selected structural points with their attributes
-        structural_pts_attrs = pt_geoms_attrs(structural_layer, structural_field_list)
+        # points are mapped onto all the profiles, sharing the source DEM
+        geoprofiles = self.input_geoprofiles.geoprofiles
+        dem_params = geoprofiles[0].profile_elevations.dem_params[0]
+        section_lines = [geoprofile.original_line for geoprofile in geoprofiles]
+        sections_xy = tuple(tuple(map(tuple, section_line.xyzt[:, :2].tolist())) for section_line in section_lines)
 
-        # list of structural points with original crs
-        struct_pts_in_orig_crs = [Point(float(rec[0]), float(rec[1])) for rec in structural_pts_attrs]
+        on_the_fly_projection, project_crs = get_on_the_fly_projection(self.canvas)
 
-        # IDs of structural points
-        struct_pts_ids = [rec[2] for rec in structural_pts_attrs]
+        # stages are rerun only from the one whose parameters changed
+        pipeline_run = self.struct_point_pipeline.start()
 
-        # - geological planes (3D), as geological planes
-        try:
-            structural_planes = [GPlane(float(rec[3]), float(rec[4]), isRHRStrike) for rec in structural_pts_attrs]
-        except:
+        # layer fetch: selected structural points with their attributes, within the section corridor
+
+        def fetch_layer():
+
+            structural_pts_index = point_layer_index(structural_layer, structural_field_list)
+            structural_pts_attrs = structural_pts_index.records
+
+            # keep the points within the corridor of any section, before sampling the DEM
+            if max_distance is None:
+                corridor_ndxs = None
+            else:
+                corridor_ndxs = section_corridor_indices(structural_pts_index,
+                                                         structural_layer_crs,
+                                                         on_the_fly_projection,
+                                                         project_crs,
+                                                         section_lines,
+                                                         max_distance)
+                structural_pts_attrs = [structural_pts_attrs[ndx] for ndx in corridor_ndxs]
+
+            try:
+                orientations = [(float(rec[3]), float(rec[4])) for rec in structural_pts_attrs]
+            except:
+                return None
+
+            # structural points with original crs and their IDs
+            struct_pts_in_orig_crs = [Point(float(rec[0]), float(rec[1])) for rec in structural_pts_attrs]
+            struct_pts_ids = [rec[2] for rec in structural_pts_attrs]
+
+            return struct_pts_in_orig_crs, struct_pts_ids, orientations, corridor_ndxs
+
+        layer_state = vector_layer_state(structural_layer)
+        layer_data = pipeline_run.stage('layer fetch',
+                                        None if layer_state is None else
+                                        (structural_layer.id(),
+                                         layer_state,
+                                         tuple(structural_field_list),
+                                         max_distance,
+                                         None if max_distance is None else sections_xy,
+                                         crs_fingerprint(structural_layer_crs),
+                                         on_the_fly_projection,
+                                         crs_fingerprint(project_crs)),
+                                        fetch_layer)
+
+        if layer_data is None:
             warn(self,
                  self.plugin_name,
                  "Check defined fields for possible errors")
             return
 
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        struct_pts_3d = calculate_projected_3d_pts(self.canvas,
-                                                   struct_pts_in_orig_crs,
-                                                   structural_layer_crs,
-                                                   geoprofile.profile_elevations.dem_params[0])
+        struct_pts_in_orig_crs, struct_pts_ids, orientations, corridor_ndxs = layer_data
 
-        # - zip together the point value data sets                     
-        assert len(struct_pts_3d) == len(structural_planes)
-        structural_data = zip(struct_pts_3d, structural_planes, struct_pts_ids)
+        # reprojection: points in the project and in the DEM CRS
 
-        ### map points onto section ###
+        struct_pts_in_prj_crs, struct_pts_in_dem_crs = pipeline_run.stage(
+            'reprojection',
+            (on_the_fly_projection, crs_fingerprint(project_crs), crs_fingerprint(dem_params.params.crs)),
+            lambda: structural_pts_in_crs(struct_pts_in_orig_crs,
+                                          structural_layer_crs,
+                                          on_the_fly_projection,
+                                          project_crs,
+                                          dem_params.params.crs))
 
-        # calculation of Cartesian plane expressing section plane        
-        self.section_data = self.calculate_section_data()
+        # z sampling: 3D structural points, with z from the DEM
 
-        # calculation of projected structural points
+        dem_state = raster_layer_state(dem_params.layer)
+        struct_pts_3d = pipeline_run.stage('z sampling',
+                                           None if dem_state is None else (dem_params.layer.id(), dem_state),
+                                           lambda: structural_pts_3d(struct_pts_in_prj_crs,
+                                                                     struct_pts_in_dem_crs,
+                                                                     dem_params))
+
+        ### map points onto section ###
 
         # get chosen mapping method
         mapping_method = self.struct_prjct_get_mapping_method()
-        if mapping_method['method'] == 'individual axes':
-            trend_field_name, plunge_field_name = mapping_method['trend field'], mapping_method['plunge field']
-            # retrieve structural points mapping axes        
-            mapping_method['individual_axes_values'] = vect_attrs(structural_layer,
-                                                                  [trend_field_name, plunge_field_name])
 
-        geoprofile.add_plane_attitudes(map_struct_pts_on_section(structural_data, self.section_data, mapping_method))
-        self.plane_attitudes_colors.append(color)
+        def map_on_sections():
 
-        # plot profiles
+            # - geological planes (3D), as geological planes
+            structural_planes = [GPlane(orientation, dip_angle, isRHRStrike) for orientation, dip_angle in
+                                 orientations]
 
-        plot_addit_params = dict()
-        plot_addit_params["add_trendplunge_label"] = self.plot_prj_add_trendplunge_label.isChecked()
-        plot_addit_params["add_ptid_label"] = self.plot_prj_add_pt_id_label.isChecked()
-        plot_addit_params["polygon_class_colors"] = self.polygon_classification_colors
-        plot_addit_params["plane_attitudes_colors"] = self.plane_attitudes_colors
+            # - zip together the point value data sets                     
+            assert len(struct_pts_3d) == len(structural_planes)
+            structural_data = list(zip(struct_pts_3d, structural_planes, struct_pts_ids))
 
-        profile_window = plot_geoprofiles(self.input_geoprofiles,
-                                          plot_addit_params)
+            section_mapping_method = dict(mapping_method)
+            if section_mapping_method['method'] == 'individual axes':
+                trend_field_name, plunge_field_name = mapping_method['trend field'], mapping_method['plunge field']
+                # retrieve structural points mapping axes        
+                individual_axes_values = vect_attrs(structural_layer, [trend_field_name, plunge_field_name])
+                if corridor_ndxs is not None:
+                    individual_axes_values = [individual_axes_values[ndx] for ndx in corridor_ndxs]
+                section_mapping_method['individual_axes_values'] = individual_axes_values
+
+            # just the per-section geometry is repeated for each profile
+            sections_plane_attitudes = []
+            for geoprofile in geoprofiles:
+                plane_attitudes = map_struct_pts_on_section(structural_data,
+                                                            self.calculate_section_data(geoprofile),
+                                                            section_mapping_method)
+                if max_distance is not None and plane_attitudes is not None:
+                    plane_attitudes = [plane_attitude for plane_attitude in plane_attitudes if
+                                       plane_attitude.section_dist <= max_distance]
+                sections_plane_attitudes.append(plane_attitudes)
+
+            return sections_plane_attitudes
+
+        sections_plane_attitudes = pipeline_run.stage('section mapping',
+                                                      (isRHRStrike, sections_xy, tuple(sorted(mapping_method.items()))),
+                                                      map_on_sections)
+
+        # plotting, always rerun, since it opens a new profile window
+
+        def plot_projection():
+
+            for geoprofile, plane_attitudes in zip(geoprofiles, sections_plane_attitudes):
+                geoprofile.add_plane_attitudes(plane_attitudes)
+            self.plane_attitudes_colors.append(color)
+
+            plot_addit_params = dict()
+            plot_addit_params["add_trendplunge_label"] = self.plot_prj_add_trendplunge_label.isChecked()
+            plot_addit_params["add_ptid_label"] = self.plot_prj_add_pt_id_label.isChecked()
+            plot_addit_params["polygon_class_colors"] = self.polygon_classification_colors
+            plot_addit_params["plane_attitudes_colors"] = self.plane_attitudes_colors
+
+            return plot_geoprofiles(self.input_geoprofiles,
+                                    plot_addit_params)
+
+        profile_window = pipeline_run.stage('plotting', None, plot_projection)
         self.profile_windows.append(profile_window)
 
 
     def reset_struct_point_projection(self):
 
-        try:
-            geoprofile = self.input_geoprofiles.geoprofile(0)
+        for geoprofile in self.input_geoprofiles.geoprofiles:
             geoprofile.geoplane_attitudes = []
-            self.plane_attitudes_colors = []
-        except:
-            pass
+        self.plane_attitudes_colors = []
 
     def check_structural_line_projection_inputs(self):
 
@@ -2419,6 +2667,14 @@ class qprof_QWidget(QWidget):
                      "Densify line distance must be larger than zero")
                 return False
 
+        try:
+            self.section_max_distance(self.project_line_max_distance_lineedit)
+        except ValueError:
+            warn(self,
+                 self.plugin_name,
+                 "Max distance from section must be empty or a positive number")
+            return False
+
         return True
 
     def create_struct_line_projection(self):
@@ -2427,10 +2683,10 @@ class qprof_QWidget(QWidget):
         if not self.check_structural_line_projection_inputs():
             return
 
-        # input dem parameters
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        demLayer = geoprofile.profile_elevations.dem_params[0].layer
-        demParams = geoprofile.profile_elevations.dem_params[0].params
+        # input dem parameters, shared by all the profiles
+        geoprofiles = self.input_geoprofiles.geoprofiles
+        demLayer = geoprofiles[0].profile_elevations.dem_params[0].layer
+        demParams = geoprofiles[0].profile_elevations.dem_params[0].params
 
         # get line structural layer
         prj_struct_line_qgis_ndx = self.prj_input_line_comboBox.currentIndex() - 1  # minus 1 to account for initial text in combo box
@@ -2443,16 +2699,46 @@ class qprof_QWidget(QWidget):
 
         on_the_fly_projection, project_crs = get_on_the_fly_projection(self.canvas)
 
-        # read structural line values
-        id_list = field_values(structural_line_layer, prj_struct_line_id_field_ndx)
+        max_distance = self.section_max_distance(self.project_line_max_distance_lineedit)
+
+        # read structural line values, prefiltered by envelope when the layer is in the project CRS,
+        # keeping the lines within the corridor of any section
+        line_index = line_layer_index(structural_line_layer)
+        if max_distance is None or (on_the_fly_projection and structural_line_layer.crs() != project_crs):
+            candidate_ndxs = list(range(len(line_index.records)))
+        else:
+            candidate_ndxs = sorted(set(ndx for geoprofile in geoprofiles
+                                        for ndx in line_index.corridor_indices(
+                                            np.column_stack((geoprofile.original_line.x_array(),
+                                                             geoprofile.original_line.y_array())),
+                                            max_distance)))
+
+        layer_id_list = field_values(structural_line_layer, prj_struct_line_id_field_ndx)
+        id_list = [layer_id_list[ndx] for ndx in candidate_ndxs]
         line_proj_crs_MultiLine2D_list = extract_multiline2d_list(structural_line_layer, on_the_fly_projection,
-                                                                       project_crs)
+                                                                  project_crs,
+                                                                  [line_index.records[ndx] for ndx in candidate_ndxs])
 
         # densify with provided spat_distance
         densify_proj_crs_distance = float(self.project_line_densify_distance_lineedit.text())
         densified_proj_crs_MultiLine2D_list = [multiline_2d.densify_2d_multiline(densify_proj_crs_distance) for multiline_2d in
                                                line_proj_crs_MultiLine2D_list]
 
+        # lines within the corridor of each section,
+        # keeping those within the corridor of any section before sampling the DEM
+        if max_distance is None:
+            sections_within = [np.ones(len(densified_proj_crs_MultiLine2D_list), dtype=bool) for _ in geoprofiles]
+        else:
+            sections_within = [multilines_section_distances(densified_proj_crs_MultiLine2D_list,
+                                                            geoprofile.original_line) <= max_distance
+                               for geoprofile in geoprofiles]
+            within_any = np.logical_or.reduce(sections_within)
+            densified_proj_crs_MultiLine2D_list = [multiline_2d for multiline_2d, is_within in
+                                                   zip(densified_proj_crs_MultiLine2D_list, within_any.tolist())
+                                                   if is_within]
+            id_list = [line_id for line_id, is_within in zip(id_list, within_any.tolist()) if is_within]
+            sections_within = [within[within_any] for within in sections_within]
+
         # project to Dem CRS
         if on_the_fly_projection and demParams.crs != project_crs:
             densified_dem_crs_MultiLine2D_list = [multiline_2d.crs_project(project_crs, demParams.crs) for
@@ -2460,72 +2746,34 @@ class qprof_QWidget(QWidget):
         else:
             densified_dem_crs_MultiLine2D_list = densified_proj_crs_MultiLine2D_list
 
-        # interpolate z values from Dem
-        z_list = [interpolate_z(demLayer, demParams, pt_2d) for multiline_2d in densified_dem_crs_MultiLine2D_list
-                  for line_2d in multiline_2d.lines for pt_2d in line_2d.pts]
-
-        # extract x-y pairs for creation of 3D points
-        xy_list = [(pt_2d.x, pt_2d.y) for multiline_2d in densified_proj_crs_MultiLine2D_list for line_2d in
-                   multiline_2d.lines for pt_2d in line_2d.pts]
-
-        # replicate MultiLine list structure with 3D points with project CRS
-        ndx = -1
-        multiline_3d_proj_crs_list = []
-        for multiline_2d in densified_proj_crs_MultiLine2D_list:
-            multiline_3d_list = []
-            for line_2d in multiline_2d.lines:
-                line_3d_pts_list = []
-                for _ in line_2d.pts:
-                    ndx += 1
-                    line_3d_pts_list.append(Point(xy_list[ndx][0], xy_list[ndx][1], z_list[ndx]))
-                multiline_3d_list.append(Line(line_3d_pts_list))
-            multiline_3d_proj_crs_list.append(MultiLine(multiline_3d_list))
-
-        # create projection vector        
+        # interpolate z values from Dem, once for all the sections
+        dem_crs_xy = [multiline_2d.xyzt[:, :2] for multiline_2d in densified_dem_crs_MultiLine2D_list]
+        dem_crs_xy = np.vstack(dem_crs_xy) if dem_crs_xy else np.empty((0, 2))
+        z_array = interpolate_z_array(demLayer, demParams, dem_crs_xy[:, 0], dem_crs_xy[:, 1])
+
+        # z values of each line
+        vertices_nums = np.array([multiline_2d.xyzt.shape[0] for multiline_2d in densified_proj_crs_MultiLine2D_list],
+                                 dtype=np.int64)
+        lines_z_arrays = np.split(z_array, np.cumsum(vertices_nums)[:-1])
+
+        # projection axis
         trend = float(self.common_axis_line_trend_SpinBox.value())
         plunge = float(self.common_axis_line_plunge_SpinBox.value())
-        axis_versor = GAxis(trend, plunge).as_vect().versor
-        l, m, n = axis_versor.x, axis_versor.y, axis_versor.z
-
-        # calculation of Cartesian plane expressing section plane        
-        self.section_data = self.calculate_section_data()
-
-        # project CartesianMultiLine3DT points to section
-        intersection_point_list = []
-        for multiline_3d in multiline_3d_proj_crs_list:
-            for line_3d in multiline_3d.lines:
-                for pt_3d in line_3d.pts:
-                    srcPt = pt_3d
-                    param_line = ParamLine3D(srcPt, l, m, n)
-                    intersection_point_list.append(param_line.intersect_cartes_plane(self.section_data['cartes_plane']))
-
-        # replicate MultiLine list structure with 3D points with project CRS
-        ndx = -1
-        multiline_3d_proj_crs_section_list = []
-        for multiline_3d in multiline_3d_proj_crs_list:
-            multiline_3d_list = []
-            for line_3d in multiline_3d.lines:
-                line_3d_pts_list = []
-                for _ in line_3d.pts:
-                    ndx += 1
-                    line_3d_pts_list.append(intersection_point_list[ndx])
-                multiline_3d_list.append(Line(line_3d_pts_list))
-            multiline_3d_proj_crs_section_list.append(MultiLine(multiline_3d_list))
-
-        section_start_point, section_vector = self.section_data['init_pt'], self.section_data['vector']
-        curves_2d_list = []
-        for multiline_3d in multiline_3d_proj_crs_section_list:
-            multiline_2d_list = []
-            for line_3d in multiline_3d.lines:
-                line_2d_pts_list = []
-                for pt_3d in line_3d.pts:
-                    s = calculate_distance_with_sign(pt_3d, section_start_point, section_vector)
-                    z = pt_3d.z
-                    line_2d_pts_list.append(Point(s, z))
-                multiline_2d_list.append(Line(line_2d_pts_list))
-            curves_2d_list.append(MultiLine(multiline_2d_list))
-
-        geoprofile.add_curves(curves_2d_list, id_list)
+
+        # project the 3D points, in the project CRS, onto each section
+        for geoprofile, within in zip(geoprofiles, sections_within):
+
+            line_ndxs = np.flatnonzero(within).tolist()
+            section_z_array = np.concatenate([lines_z_arrays[ndx] for ndx in line_ndxs]) if line_ndxs else \
+                np.empty(0)
+
+            curves_2d_list = project_multilines_on_section([densified_proj_crs_MultiLine2D_list[ndx] for ndx in line_ndxs],
+                                                           section_z_array,
+                                                           self.calculate_section_data(geoprofile),
+                                                           trend,
+                                                           plunge)
+
+            geoprofile.add_curves(curves_2d_list, [id_list[ndx] for ndx in line_ndxs])
 
         # plot profiles
 
@@ -2541,12 +2789,9 @@ class qprof_QWidget(QWidget):
 
     def reset_structural_lines_projection(self):
 
-        try:
-            geoprofile = self.input_geoprofiles.geoprofile(0)
+        for geoprofile in self.input_geoprofiles.geoprofiles:
             geoprofile.geosurfaces = []
             geoprofile.geosurfaces_ids = []
-        except:
-            pass
 
     def do_export_project_geol_attitudes(self):
 
@@ -2560,8 +2805,8 @@ class qprof_QWidget(QWidget):
                 return ""
 
         try:
-            geoprofile = self.input_geoprofiles.geoprofile(0)
-            num_plane_attitudes_sets = len(geoprofile.geoplane_attitudes)
+            num_plane_attitudes_sets = sum([len(geoprofile.geoplane_attitudes) for geoprofile in
+                                            self.input_geoprofiles.geoprofiles])
         except:
             warn(self,
                  self.plugin_name,
@@ -2632,9 +2877,10 @@ class qprof_QWidget(QWidget):
                 or_dipangle = plane_attitude_rec.src_geol_plane.da
                 tr_dipangle = degrees(plane_attitude_rec.slope_rad)
                 tr_dipdir = plane_attitude_rec.dwnwrd_sense
+                sect_dist = plane_attitude_rec.section_dist
 
                 record = [pt_id, or_pt_x, or_pt_y, or_pt_z, pr_pt_x, pr_pt_y, pr_pt_z, s, or_dipdir, or_dipangle,
-                          tr_dipangle, tr_dipdir]
+                          tr_dipangle, tr_dipdir, sect_dist]
 
                 result_data.append(record)
 
@@ -2643,7 +2889,8 @@ class qprof_QWidget(QWidget):
     def output_geological_attitudes(self, output_format, output_filepath, project_crs_osr):
 
         # definition of field names
-        header_list = ['id',
+        header_list = ['profile',
+                       'id',
                        'or_strpt_x',
                        'or_strpt_y',
                        'or_strpt_z',
@@ -2654,11 +2901,15 @@ class qprof_QWidget(QWidget):
                        'or_dipdir',
                        'or_dipangle',
                        'trc_dipangle',
-                       'trc_dipdir']
+                       'trc_dipdir',
+                       'sect_dist']
 
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        parsed_geologicalattitudes_results = self.export_parse_geologicalattitudes_results(
-            geoprofile.geoplane_attitudes)
+        # records of all the profiles, each one prefixed by the profile number
+        parsed_geologicalattitudes_results = []
+        for ndx, geoprofile in enumerate(self.input_geoprofiles.geoprofiles):
+            parsed_geologicalattitudes_results += [[ndx + 1] + record for record in
+                                                   self.export_parse_geologicalattitudes_results(
+                                                       geoprofile.geoplane_attitudes)]
 
         # output for csv file
         if output_format == "csv":
@@ -2687,8 +2938,8 @@ class qprof_QWidget(QWidget):
     def do_export_project_geol_traces(self):
 
         try:
-            geoprofile = self.input_geoprofiles.geoprofile(0)
-            num_proj_lines_sets = len(geoprofile.geosurfaces)
+            num_proj_lines_sets = sum([len(geoprofile.geosurfaces) for geoprofile in
+                                       self.input_geoprofiles.geoprofiles])
         except:
             warn(self,
                  self.plugin_name,
@@ -2713,7 +2964,7 @@ class qprof_QWidget(QWidget):
             return
 
         parsed_curves_for_export = self.export_parse_projected_geological_traces()
-        header_list = ['id', 's', 'z']
+        header_list = ['profile', 'id', 's', 'z']
 
         write_generic_csv(fileName, header_list, parsed_curves_for_export)
 
@@ -2733,8 +2984,8 @@ class qprof_QWidget(QWidget):
                 return ""
 
         try:
-            geoprofile = self.input_geoprofiles.geoprofile(0)
-            num_intersection_pts = len(geoprofile.lineaments)
+            num_intersection_pts = sum([len(geoprofile.lineaments) for geoprofile in
+                                        self.input_geoprofiles.geoprofiles])
         except:
             warn(self,
                  self.plugin_name,
@@ -2788,14 +3039,18 @@ class qprof_QWidget(QWidget):
     def output_profile_lines_intersections(self, output_format, output_filepath, project_crs_osr):
 
         # definition of field names
-        header_list = ['id',
+        header_list = ['profile',
+                       'id',
                        's',
                        'x',
                        'y',
                        'z']
 
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        parsed_profilelineintersections = self.export_parse_lineintersections(geoprofile.lineaments)
+        # records of all the profiles, each one prefixed by the profile number
+        parsed_profilelineintersections = []
+        for ndx, geoprofile in enumerate(self.input_geoprofiles.geoprofiles):
+            parsed_profilelineintersections += [[ndx + 1] + record for record in
+                                                self.export_parse_lineintersections(geoprofile.lineaments)]
 
         # output for csv file
         if output_format == "csv":
@@ -2824,12 +3079,12 @@ class qprof_QWidget(QWidget):
     def export_parse_projected_geological_traces(self):
 
         data_list = []
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        for curve_set, id_set in zip(geoprofile.geosurfaces, geoprofile.geosurfaces_ids):
-            for curve, rec_id in zip(curve_set, id_set):
-                for line in curve.lines:
-                    for pt in line.pts:
-                        data_list.append([rec_id, pt.x, pt.y])
+        for ndx, geoprofile in enumerate(self.input_geoprofiles.geoprofiles):
+            for curve_set, id_set in zip(geoprofile.geosurfaces, geoprofile.geosurfaces_ids):
+                for curve, rec_id in zip(curve_set, id_set):
+                    for line in curve.lines:
+                        for x, y in zip(line.x_list, line.y_list):
+                            data_list.append([ndx + 1, rec_id, x, y])
         return data_list
 
     def export_parse_lineintersections(self, profile_intersection_pts):
@@ -2855,8 +3110,8 @@ class qprof_QWidget(QWidget):
                 return ""
 
         try:
-            geoprofile = self.input_geoprofiles.geoprofile(0)
-            num_intersection_lines = len(geoprofile.outcrops)
+            num_intersection_lines = sum([len(geoprofile.outcrops) for geoprofile in
+                                          self.input_geoprofiles.geoprofiles])
         except:
             warn(self,
                      self.plugin_name,
@@ -2909,14 +3164,17 @@ class qprof_QWidget(QWidget):
     def output_profile_polygons_intersections(self, output_format, output_filepath, sr):
 
         # definition of field names
-        header_list = ['class_fld',
+        header_list = ['profile',
+                       'class_fld',
                        's',
                        'x',
                        'y',
                        'z']
 
-        geoprofile = self.input_geoprofiles.geoprofile(0)
-        intersection_lines = geoprofile.outcrops
+        # intersection lines of all the profiles, each one prefixed by the profile number
+        intersection_lines = [(ndx + 1, classification, line3d, s_list) for ndx, geoprofile in
+                              enumerate(self.input_geoprofiles.geoprofiles)
+                              for classification, line3d, s_list in geoprofile.outcrops]
 
         # output for csv file
         if output_format == "csv":
@@ -2990,6 +3248,8 @@ class qprof_QWidget(QWidget):
         except:
             pass
 
+        invalidate_raster_cache()
+
         try:
             QgsMapLayerRegistry.instance().layerWasAdded.disconnect(self.struct_polygon_refresh_lyr_combobox)
         except:
@@ -3048,6 +3308,14 @@ class SourceDEMsDialog(QDialog):
 
         self.populate_raster_layer_treewidget()
 
+        self.qcbxUseDEMMirrors = QCheckBox("Use on-disk memory-mapped copies")
+        self.qcbxUseDEMMirrors.setToolTip("Copy the selected DEMs into a user cache directory\n"
+                                          "for faster repeated profiles.\n"
+                                          "Copies are rebuilt when the source files change")
+
+        self.qcbxParallelDEMSampling = QCheckBox("Sample DEMs in parallel")
+        self.qcbxParallelDEMSampling.setToolTip("Read each DEM in a separate thread via GDAL")
+
         okButton = QPushButton("&OK")
         cancelButton = QPushButton("Cancel")
 
@@ -3059,7 +3327,9 @@ class SourceDEMsDialog(QDialog):
         layout = QGridLayout()
 
         layout.addWidget(self.listDEMs_treeWidget, 0, 0, 1, 3)
-        layout.addLayout(buttonLayout, 1, 0, 1, 3)
+        layout.addWidget(self.qcbxUseDEMMirrors, 1, 0, 1, 3)
+        layout.addWidget(self.qcbxParallelDEMSampling, 2, 0, 1, 3)
+        layout.addLayout(buttonLayout, 3, 0, 1, 3)
 
         self.setLayout(layout)
 
@@ -4067,12 +4337,17 @@ class StatisticsDialog(QDialog):
                                      profile_elevations.statistics_dirslopes,
                                      profile_elevations.statistics_slopes))
 
+            if profile_elevations.profile_masked_counts:
+                masked_counts = profile_elevations.profile_masked_counts
+            else:
+                masked_counts = [None] * len(profiles_stats)
+
             stat_report += "\nStatistics for Line {}\n".format(ndx+1)
             stat_report += "\nProfile length: %f\n" % profile_elevations.profile_length
             stat_report += "\nTopographic elevations\n"
             stat_report += " - min: {}\n".format(profile_elevations.natural_elev_range[0])
             stat_report += " - max: {}\n\n".format(profile_elevations.natural_elev_range[1])
-            stat_report += self.report_stats(profiles_stats)
+            stat_report += self.report_stats(profiles_stats, masked_counts)
 
         self.text_widget.setPlainText(stat_report)
 
@@ -4082,7 +4357,7 @@ class StatisticsDialog(QDialog):
 
         self.setWindowTitle("Statistics")
 
-    def report_stats(self, profiles_stats):
+    def report_stats(self, profiles_stats, masked_counts):
 
         def type_report(values):
 
@@ -4096,8 +4371,10 @@ class StatisticsDialog(QDialog):
 
         report = 'Dataset statistics\n'
         types = ['elevations', 'directional slopes', 'absolute slopes']
-        for name, stats in profiles_stats:
+        for (name, stats), masked_count in zip(profiles_stats, masked_counts):
             report += '\ndataset name\n%s\n\n' % name
+            if masked_count is not None:
+                report += 'samples involving no-data cells: %d\n\n' % masked_count
             for type, stat_val in zip(types, stats):
                 report += '%s\n\n' % type
                 report += type_report(stat_val)
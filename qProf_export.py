@@ -533,6 +533,7 @@ def write_geological_attitudes_ptshp(fileName, parsed_crosssect_results, sr):
         return False, "Output layer creation failed"
 
     # creates required fields
+    layer.CreateField(ogr.FieldDefn('profile', ogr.OFTInteger))
     layer.CreateField(ogr.FieldDefn('id', ogr.OFTString))
     layer.CreateField(ogr.FieldDefn('or_pt_x', ogr.OFTReal))
     layer.CreateField(ogr.FieldDefn('or_pt_y', ogr.OFTReal))
@@ -545,12 +546,14 @@ def write_geological_attitudes_ptshp(fileName, parsed_crosssect_results, sr):
     layer.CreateField(ogr.FieldDefn('or_dpang', ogr.OFTReal))
     layer.CreateField(ogr.FieldDefn('tr_dpang', ogr.OFTReal))
     layer.CreateField(ogr.FieldDefn('tr_dpdir', ogr.OFTString))
+    layer.CreateField(ogr.FieldDefn('sect_dist', ogr.OFTReal))
 
     featureDefn = layer.GetLayerDefn()
 
     # loops through output records
     for rec in parsed_crosssect_results:
-        pt_id, or_pt_x, or_pt_y, or_pt_z, pr_pt_x, pr_pt_y, pr_pt_z, s, or_dipdir, or_dipangle, tr_dipangle, tr_dipdir = rec
+        profile_num, pt_id, or_pt_x, or_pt_y, or_pt_z, pr_pt_x, pr_pt_y, pr_pt_z, s, or_dipdir, or_dipangle, \
+            tr_dipangle, tr_dipdir, sect_dist = rec
 
         pt_feature = ogr.Feature(featureDefn)
 
@@ -558,6 +561,7 @@ def write_geological_attitudes_ptshp(fileName, parsed_crosssect_results, sr):
         pt.SetPoint(0, pr_pt_x, pr_pt_y, pr_pt_z)
         pt_feature.SetGeometry(pt)
 
+        pt_feature.SetField('profile', profile_num)
         pt_feature.SetField('id', str(pt_id))
         pt_feature.SetField('or_pt_x', or_pt_x)
         pt_feature.SetField('or_pt_y', or_pt_y)
@@ -570,6 +574,8 @@ def write_geological_attitudes_ptshp(fileName, parsed_crosssect_results, sr):
         pt_feature.SetField('or_dpang', or_dipangle)
         pt_feature.SetField('tr_dpang', tr_dipangle)
         pt_feature.SetField('tr_dpdir', str(tr_dipdir))
+        if sect_dist is not None:
+            pt_feature.SetField('sect_dist', float(sect_dist))
 
         layer.CreateFeature(pt_feature)
 
@@ -585,9 +591,9 @@ def write_intersection_line_csv(output_filepath, header_list, parsed_results, se
     try:
         with open(unicode(output_filepath), 'w') as f:
             f.write(sep.join(header_list) + '\n')
-            for classification, line3d, s_list in parsed_results:
-                for pt, s in zip(line3d.pts, s_list):
-                    out_values = [classification, s, pt.x, pt.y, pt.z]
+            for profile_num, classification, line3d, s_list in parsed_results:
+                for (x, y, z), s in zip(line3d.xyzt[:, :3].tolist(), s_list):
+                    out_values = [profile_num, classification, s, x, y, z]
                     out_val_strings = [str(val) for val in out_values]
                     f.write(sep.join(out_val_strings) + '\n')
         return True, "done"
@@ -615,27 +621,29 @@ def write_intersection_line_ptshp(fileName, header_list, intersline_results, sr)
         return False, "Output layer creation failed"
 
     # creates required fields
-    layer.CreateField(ogr.FieldDefn(header_list[0], ogr.OFTString))
-    layer.CreateField(ogr.FieldDefn(header_list[1], ogr.OFTReal))
+    layer.CreateField(ogr.FieldDefn(header_list[0], ogr.OFTInteger))
+    layer.CreateField(ogr.FieldDefn(header_list[1], ogr.OFTString))
     layer.CreateField(ogr.FieldDefn(header_list[2], ogr.OFTReal))
     layer.CreateField(ogr.FieldDefn(header_list[3], ogr.OFTReal))
     layer.CreateField(ogr.FieldDefn(header_list[4], ogr.OFTReal))
+    layer.CreateField(ogr.FieldDefn(header_list[5], ogr.OFTReal))
 
     featureDefn = layer.GetLayerDefn()
 
     # loops through output records
-    for rec_id, s, x, y, z in intersline_results:
+    for profile_num, rec_id, s, x, y, z in intersline_results:
         pt_feature = ogr.Feature(featureDefn)
 
         pt = ogr.Geometry(ogr.wkbPoint25D)
         pt.SetPoint(0, x, y, z)
         pt_feature.SetGeometry(pt)
 
-        pt_feature.SetField(header_list[0], str(rec_id))
-        pt_feature.SetField(header_list[1], s)
-        pt_feature.SetField(header_list[2], x)
-        pt_feature.SetField(header_list[3], y)
-        pt_feature.SetField(header_list[4], z)
+        pt_feature.SetField(header_list[0], profile_num)
+        pt_feature.SetField(header_list[1], str(rec_id))
+        pt_feature.SetField(header_list[2], s)
+        pt_feature.SetField(header_list[3], x)
+        pt_feature.SetField(header_list[4], y)
+        pt_feature.SetField(header_list[5], z)
 
         layer.CreateFeature(pt_feature)
 
@@ -666,33 +674,35 @@ def write_intersection_polygon_lnshp(fileName, header_list, intersline_results,
         return False, "Output layer creation failed"
 
     # creates required fields
-    layer.CreateField(ogr.FieldDefn(header_list[0], ogr.OFTString))
-    layer.CreateField(ogr.FieldDefn(header_list[1], ogr.OFTReal))
+    layer.CreateField(ogr.FieldDefn(header_list[0], ogr.OFTInteger))
+    layer.CreateField(ogr.FieldDefn(header_list[1], ogr.OFTString))
+    layer.CreateField(ogr.FieldDefn(header_list[2], ogr.OFTReal))
 
     featureDefn = layer.GetLayerDefn()
 
     # loops through output records
 
-    for classification, line3d, s_list in intersline_results:
+    for profile_num, classification, line3d, s_list in intersline_results:
+
+        assert line3d.num_pts == len(s_list)
 
-        assert len(line3d.pts) == len(s_list)
+        xyz_list = line3d.xyzt[:, :3].tolist()
 
         # loops through output records
 
-        for ndx in range(len(line3d.pts) - 1):
-            rec_a = line3d.pts[ndx]
-            rec_b = line3d.pts[ndx + 1]
+        for ndx in range(line3d.num_pts - 1):
 
-            x0, y0, z0 = rec_a.x, rec_a.y, rec_a.z
-            x1, y1, z1 = rec_b.x, rec_b.y, rec_b.z
+            x0, y0, z0 = xyz_list[ndx]
+            x1, y1, z1 = xyz_list[ndx + 1]
             s = s_list[ndx + 1]
 
             ln_feature = ogr.Feature(featureDefn)
             segment_3d = ogr.CreateGeometryFromWkt('LINESTRING(%f %f %f, %f %f %f)' % (x0, y0, z0, x1, y1, z1))
             ln_feature.SetGeometry(segment_3d)
 
-            ln_feature.SetField(header_list[0], str(classification))
-            ln_feature.SetField(header_list[1], s)
+            ln_feature.SetField(header_list[0], profile_num)
+            ln_feature.SetField(header_list[1], str(classification))
+            ln_feature.SetField(header_list[2], s)
 
             layer.CreateFeature(ln_feature)
 
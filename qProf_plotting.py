@@ -77,7 +77,7 @@ def plot_profile_lines_intersection_points(axes, profile_lines_intersection_poin
 def plot_profile_polygon_intersection_line(plot_addit_params, axes, intersection_line_value):
 
     classification, line3d, s_list = intersection_line_value
-    z_list = [pt3d.z for pt3d in line3d.pts]
+    z_list = line3d.z_list
 
     if plot_addit_params["polygon_class_colors"] is None:
         color = "red"